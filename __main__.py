@@ -13,6 +13,7 @@ Telegram Digester - система анализа и суммаризации Te
 import argparse
 import datetime as dt
 import os
+import sys
 from typing import Optional
 
 # Загружаем переменные окружения в самом начале
@@ -23,18 +24,22 @@ import pathlib
 env_path = pathlib.Path(__file__).parent / '.env'
 load_dotenv(env_path)
 
-from . import orchestrator
-from . import topic_extractor
-from . import topic_resumator_chat
-from . import daily_digester
-from . import custom_date_digester
-from . import init_test_data
-from . import tg_etl
-from . import test_data
-import asyncio
+# Подсистемы (pandas, telethon, requests, YQL-клиент) импортируются лениво —
+# внутри ветки своей команды: `--help` и короткие команды не платят за весь пакет.
 
 
-def main():
+def _loaded(name: str):
+    """модуль пакета, если он уже импортирован этой командой, иначе None."""
+    return sys.modules.get(f"{__package__}.{name}")
+
+
+def _add_cache_args(p: argparse.ArgumentParser) -> None:
+    """флаги кэша ответов LLM (общие для команд, которые ходят в модель)"""
+    p.add_argument('--no-cache', action='store_true', help='Не использовать кэш ответов LLM')
+    p.add_argument('--refresh', action='store_true', help='Игнорировать кэш и перезаписать его свежими ответами LLM')
+
+
+def build_parser() -> argparse.ArgumentParser:
     parser = argparse.ArgumentParser(description="Telegram Digester - анализ переписок")
     
     subparsers = parser.add_subparsers(dest='command', help='Доступные команды')
@@ -46,6 +51,12 @@ def main():
     interval_parser.add_argument('--channel-id', type=int, help='ID канала (если не указан, обрабатываются все каналы)')
     interval_parser.add_argument('--model', type=str, default='yandex', choices=['yandex', 'deepseek'], help='Модель LLM')
     interval_parser.add_argument('--verify', type=str, default=str(pathlib.Path(__file__).parent / 'YandexInternalRootCA.pem'), help='Путь к CA-сертификату')
+    _add_cache_args(interval_parser)
+    interval_parser.add_argument('--workers', type=int, default=1, help='Количество параллельных задач (канал × день), по умолчанию: 1')
+    interval_parser.add_argument('--resume-workers', type=int, help='Количество потоков resumator (по умолчанию = --workers)')
+    interval_parser.add_argument('--with-daily', action='store_true', help='После анализа тем собрать дневные дайджесты за интервал')
+    interval_parser.add_argument('--incremental', action='store_true', help='Пропускать дни, сообщения которых не менялись с прошлого прогона')
+    interval_parser.add_argument('--resume', action='store_true', help='Продолжить прерванный прогон: пропустить выполненное по журналу, повторить упавшее')
     
     # Команда topic_extractor
     extract_parser = subparsers.add_parser('extract', help='Извлечь темы за день')
@@ -55,12 +66,14 @@ def main():
     
     extract_parser.add_argument('--model', type=str, default='yandex', choices=['yandex', 'deepseek'], help='Модель LLM')
     extract_parser.add_argument('--verify', type=str, default=cert_path, help='Путь к CA-сертификату')
+    _add_cache_args(extract_parser)
     
     # Команда topic_resumator
     resume_parser = subparsers.add_parser('resume', help='Проанализировать тему')
     resume_parser.add_argument('--topic-id', type=str, required=True, help='ID темы')
     resume_parser.add_argument('--model', type=str, default='yandex', choices=['yandex', 'deepseek'], help='Модель LLM')
     resume_parser.add_argument('--verify', type=str, default=cert_path, help='Путь к CA-сертификату')
+    _add_cache_args(resume_parser)
     
     # Команда daily_digester
     daily_parser = subparsers.add_parser('daily', help='Создать дневной дайджест')
@@ -68,6 +81,8 @@ def main():
     daily_parser.add_argument('--channel-id', type=int, required=True, help='ID канала')
     daily_parser.add_argument('--model', type=str, default='yandex', choices=['yandex', 'deepseek'], help='Модель LLM')
     daily_parser.add_argument('--verify', type=str, default=cert_path, help='Путь к CA-сертификату')
+    _add_cache_args(daily_parser)
+    daily_parser.add_argument('--stream', action='store_true', help='Печатать дайджест по мере генерации')
     
     # Команда custom_date_digester
     custom_parser = subparsers.add_parser('custom', help='Создать дайджест за произвольный период')
@@ -76,6 +91,30 @@ def main():
     custom_parser.add_argument('--channel-id', type=int, required=True, help='ID канала')
     custom_parser.add_argument('--model', type=str, default='yandex', choices=['yandex', 'deepseek'], help='Модель LLM')
     custom_parser.add_argument('--verify', type=str, default=cert_path, help='Путь к CA-сертификату')
+    _add_cache_args(custom_parser)
+    custom_parser.add_argument('--mode', type=str, default='auto', choices=['auto', 'single', 'hierarchical', 'clustered'], help='Один промпт на весь период, иерархическая свёртка по календарным чанкам или по локальным кластерам похожих тем (по умолчанию: auto)')
+    custom_parser.add_argument('--chunk', type=str, default='auto', choices=['auto', 'day', 'week'], help='Размер чанка для иерархической свёртки (по умолчанию: auto)')
+    custom_parser.add_argument('--token-budget', type=int, help='Бюджет токенов на данные одного промпта (по умолчанию: из контекста модели)')
+    custom_parser.add_argument('--workers', type=int, default=4, help='Параллельных LLM-запросов при свёртке чанков')
+    custom_parser.add_argument('--stream', action='store_true', help='Печатать сюжеты и пост по мере генерации')
+    custom_parser.add_argument('--render', type=str, default='local', choices=['local', 'llm'], help='Финальный пост: локальный рендер или отдельный LLM-вызов (по умолчанию: local)')
+    
+    # Команды daily-all / custom-all
+    daily_all_parser = subparsers.add_parser('daily-all', help='Дневные дайджесты для всех каналов с сообщениями за дату')
+    daily_all_parser.add_argument('--date', type=str, required=True, help='Дата (YYYY-MM-DD)')
+    daily_all_parser.add_argument('--workers', type=int, default=4, help='Параллельных дайджестов (по умолчанию: 4)')
+    daily_all_parser.add_argument('--model', type=str, default='yandex', choices=['yandex', 'deepseek'], help='Модель LLM')
+    daily_all_parser.add_argument('--verify', type=str, default=cert_path, help='Путь к CA-сертификату')
+    _add_cache_args(daily_all_parser)
+    
+    custom_all_parser = subparsers.add_parser('custom-all', help='Дайджесты за период для всех каналов с сообщениями')
+    custom_all_parser.add_argument('--start-date', type=str, required=True, help='Начальная дата (YYYY-MM-DD)')
+    custom_all_parser.add_argument('--end-date', type=str, required=True, help='Конечная дата (YYYY-MM-DD)')
+    custom_all_parser.add_argument('--workers', type=int, default=4, help='Параллельных дайджестов (по умолчанию: 4)')
+    custom_all_parser.add_argument('--render', type=str, default='local', choices=['local', 'llm'], help='Финальный пост: локальный рендер или отдельный LLM-вызов (по умолчанию: local)')
+    custom_all_parser.add_argument('--model', type=str, default='yandex', choices=['yandex', 'deepseek'], help='Модель LLM')
+    custom_all_parser.add_argument('--verify', type=str, default=cert_path, help='Путь к CA-сертификату')
+    _add_cache_args(custom_all_parser)
     
     # Команда init-data
     init_parser = subparsers.add_parser('init-data', help='Инициализировать тестовые данные в YT')
@@ -88,101 +127,286 @@ def main():
     dump_parser.add_argument('--output-table', help='Путь к таблице YT для сохранения (по умолчанию из YT_MESSAGES_TABLE)')
     dump_parser.add_argument('--days-back-start', type=int, default=3, help='Количество дней назад от текущего момента для начала интервала (по умолчанию: 3)')
     dump_parser.add_argument('--days-back-end', type=int, default=0, help='Количество дней назад от текущего момента для конца интервала (по умолчанию: 0 = сейчас)')
+    dump_parser.add_argument('--concurrency', type=int, help='Чатов выгружается одновременно (по умолчанию из TG_CONCURRENCY = 4)')
+    dump_parser.add_argument('--archive', nargs='?', const='', metavar='DIR', help='Дописать выгрузку в локальный архив для офлайн-повторов (по умолчанию TG_ARCHIVE_DIR)')
+    dump_parser.add_argument('--incremental', action='store_true', help='Только новые и изменённые сообщения от водяного знака чата (upsert вместо перезаписи)')
+    dump_parser.add_argument('--lookback-hours', type=float, help='Окно поиска правок от водяного знака, ч (по умолчанию из INGEST_EDIT_LOOKBACK_HOURS = 48)')
     
-    args = parser.parse_args()
+    # Команда watch
+    watch_parser = subparsers.add_parser('watch', help='Обновлять темы и дневные дайджесты по мере прихода сообщений')
+    watch_parser.add_argument('--chats', nargs='*', help='Список чатов (по умолчанию из переменной TG_CHATS)')
+    watch_parser.add_argument('--debounce', type=float, help='Пауза без новых событий перед пересчётом дня, сек (по умолчанию из WATCH_DEBOUNCE_SEC = 60)')
+    watch_parser.add_argument('--max-delay', type=float, help='Максимальная задержка пересчёта после первого события, сек (по умолчанию из WATCH_MAX_DELAY_SEC = 300)')
+    watch_parser.add_argument('--model', type=str, default='yandex', choices=['yandex', 'deepseek'], help='Модель LLM')
+    watch_parser.add_argument('--verify', type=str, default=cert_path, help='Путь к CA-сертификату')
+    _add_cache_args(watch_parser)
     
-    if not args.command:
-        parser.print_help()
-        return
+    # Команды serve / enqueue / jobs
+    serve_parser = subparsers.add_parser('serve', help='Долгоживущий воркер: выполнять задания из очереди')
+    serve_parser.add_argument('--workers', type=int, default=1, help='Параллельных заданий (по умолчанию: 1)')
+    serve_parser.add_argument('--poll', type=float, default=1.0, help='Период опроса пустой очереди, сек')
+    serve_parser.add_argument('--queue', type=str, help='Путь к SQLite-очереди (по умолчанию из JOB_QUEUE_DB)')
+    serve_parser.add_argument('--exit-when-empty', action='store_true', help='Завершиться, когда очередь опустеет')
+    _add_cache_args(serve_parser)
     
-    try:
-        if args.command == 'interval':
-            start_date = dt.datetime.strptime(args.start, '%Y-%m-%d').date()
-            end_date = dt.datetime.strptime(args.end, '%Y-%m-%d').date()
-            orchestrator.process_interval(
-                start=start_date,
-                end=end_date,
-                channel_id=args.channel_id,
-                model=args.model,
-                verify=args.verify
-            )
-            
-        elif args.command == 'extract':
-            date = dt.datetime.strptime(args.date, '%Y-%m-%d').date()
-            topic_extractor.run_topic_extractor(
-                date=date,
-                channel_id=args.channel_id,
-                model=args.model,
-                verify=args.verify
-            )
-            
-        elif args.command == 'resume':
-            topic_resumator_chat.run_topic_resumator(
-                topic_id=args.topic_id,
-                model=args.model,
-                verify=args.verify
-            )
-            
-        elif args.command == 'daily':
-            date = dt.datetime.strptime(args.date, '%Y-%m-%d').date()
-            daily_digester.run_daily_digester(
-                date=date,
-                channel_id=args.channel_id,
-                model=args.model,
-                verify=args.verify
-            )
-            
-        elif args.command == 'custom':
-            start_date = dt.datetime.strptime(args.start_date, '%Y-%m-%d').date()
-            end_date = dt.datetime.strptime(args.end_date, '%Y-%m-%d').date()
-            custom_date_digester.run_custom_date_digester(
-                start_date=start_date,
-                end_date=end_date,
-                channel_id=args.channel_id,
-                model=args.model,
-                verify=args.verify
-            )
-            
-        elif args.command == 'init-data':
-            init_test_data.init_test_data(
+    enqueue_parser = subparsers.add_parser('enqueue', help='Поставить команду в очередь serve, например: enqueue daily --date 2025-01-21 --channel-id 1')
+    enqueue_parser.add_argument('--queue', type=str, help='Путь к SQLite-очереди (по умолчанию из JOB_QUEUE_DB)')
+    enqueue_parser.add_argument('job', nargs=argparse.REMAINDER, help='Команда и её аргументы')
+    
+    jobs_parser = subparsers.add_parser('jobs', help='Состояние очереди serve')
+    jobs_parser.add_argument('--queue', type=str, help='Путь к SQLite-очереди (по умолчанию из JOB_QUEUE_DB)')
+    jobs_parser.add_argument('--limit', type=int, default=20, help='Сколько последних заданий показать')
+    
+    return parser
+
+
+def run_command(args: argparse.Namespace) -> None:
+    """выполняет команду CLI (и задание воркера serve) по разобранным аргументам"""
+    if args.command == 'interval':
+        from . import orchestrator
+        start_date = dt.datetime.strptime(args.start, '%Y-%m-%d').date()
+        end_date = dt.datetime.strptime(args.end, '%Y-%m-%d').date()
+        failures = orchestrator.process_interval(
+            start=start_date,
+            end=end_date,
+            channel_id=args.channel_id,
+            model=args.model,
+            verify=args.verify,
+            workers=args.workers,
+            resume_workers=args.resume_workers,
+            with_daily=args.with_daily,
+            incremental=args.incremental,
+            resume=args.resume
+        )
+        if failures:
+            # ненулевой код выхода / задание serve — failed
+            raise RuntimeError(f"не выполнено единиц работы: {len(failures)} (повтор: interval --resume)")
+        
+    elif args.command == 'extract':
+        from . import storage, topic_extractor
+        storage.require_yt('extract')
+        date = dt.datetime.strptime(args.date, '%Y-%m-%d').date()
+        topic_extractor.run_topic_extractor(
+            date=date,
+            channel_id=args.channel_id,
+            model=args.model,
+            verify=args.verify
+        )
+        
+    elif args.command == 'resume':
+        from . import storage, topic_resumator_chat
+        storage.require_yt('resume')
+        topic_resumator_chat.run_topic_resumator(
+            topic_id=args.topic_id,
+            model=args.model,
+            verify=args.verify
+        )
+        
+    elif args.command == 'daily':
+        from . import daily_digester
+        date = dt.datetime.strptime(args.date, '%Y-%m-%d').date()
+        daily_digester.run_daily_digester(
+            date=date,
+            channel_id=args.channel_id,
+            model=args.model,
+            verify=args.verify,
+            stream=args.stream
+        )
+        
+    elif args.command == 'custom':
+        from . import custom_date_digester
+        start_date = dt.datetime.strptime(args.start_date, '%Y-%m-%d').date()
+        end_date = dt.datetime.strptime(args.end_date, '%Y-%m-%d').date()
+        custom_date_digester.run_custom_date_digester(
+            start_date=start_date,
+            end_date=end_date,
+            channel_id=args.channel_id,
+            model=args.model,
+            verify=args.verify,
+            mode=args.mode,
+            chunk=args.chunk,
+            token_budget=args.token_budget,
+            workers=args.workers,
+            stream=args.stream,
+            render=args.render
+        )
+        
+    elif args.command == 'daily-all':
+        from . import orchestrator
+        date = dt.datetime.strptime(args.date, '%Y-%m-%d').date()
+        orchestrator.run_daily_all(
+            date=date,
+            model=args.model,
+            verify=args.verify,
+            workers=args.workers
+        )
+        
+    elif args.command == 'custom-all':
+        from . import orchestrator
+        start_date = dt.datetime.strptime(args.start_date, '%Y-%m-%d').date()
+        end_date = dt.datetime.strptime(args.end_date, '%Y-%m-%d').date()
+        orchestrator.run_custom_all(
+            start=start_date,
+            end=end_date,
+            model=args.model,
+            verify=args.verify,
+            workers=args.workers,
+            render=args.render
+        )
+        
+    elif args.command == 'init-data':
+        from . import init_test_data
+        init_test_data.init_test_data(
+            days_back_start=args.days_back_start,
+            days_back_end=args.days_back_end
+        )
+        
+    elif args.command == 'dump':
+        from . import tg_ingest
+        from . import test_data
+        
+        # Определяем список чатов
+        chats = args.chats if args.chats else test_data.TG_CHATS
+        
+        # Определяем таблицу для сохранения
+        output_table = args.output_table or os.getenv("YT_MESSAGES_TABLE", "//tmp/ia-nartov/hackathon/tg_raw_enriched")
+        concurrency = args.concurrency or tg_ingest.TG_CONCURRENCY
+        archive = None
+        if args.archive is not None:
+            from . import storage
+            from . import tg_archive
+            # при MESSAGES_SOURCE=archive хранилище и так пишет сообщения в архив
+            if not isinstance(storage.get_storage(), storage.ArchiveStorage):
+                archive = tg_archive.Archive(args.archive or tg_archive.ARCHIVE_DIR)
+        
+        if args.incremental:
+            print(f"🔄 Инкрементальная выгрузка из {len(chats)} чатов ({concurrency} параллельно) → {output_table}")
+            written = tg_ingest.incremental_dump(
+                chats,
+                output_table,
+                test_data.MSG_SCHEMA,
                 days_back_start=args.days_back_start,
-                days_back_end=args.days_back_end
+                lookback_hours=args.lookback_hours if args.lookback_hours is not None else tg_ingest.EDIT_LOOKBACK_HOURS,
+                concurrency=concurrency,
+                archive=archive,
             )
-            
-        elif args.command == 'dump':
-            # Определяем список чатов
-            chats = args.chats if args.chats else test_data.TG_CHATS
-            
-            # Определяем таблицу для сохранения
-            output_table = args.output_table or os.getenv("YT_MESSAGES_TABLE", "//tmp/ia-nartov/hackathon/tg_raw_enriched")
-            
-            print(f"🔄 Выгружаем сообщения из {len(chats)} чатов...")
-            for i, chat in enumerate(chats, 1):
-                print(f"  {i}. {chat}")
-            
-            # Выгружаем сообщения
-            df_messages = asyncio.run(tg_etl.dump_chats(
+        else:
+            print(f"🔄 Выгружаем сообщения из {len(chats)} чатов ({concurrency} параллельно) → {output_table}")
+            written = tg_ingest.full_dump(
                 chats,
-                days_back_start=args.days_back_start,
-                days_back_end=args.days_back_end
-            ))
-            print(f"✅ Получено сообщений: {len(df_messages)}")
-            
-            # Загружаем в YT
-            print(f"📤 Загружаем в YT: {output_table}")
-            tg_etl.upload_df_to_yt(
-                df_messages,
                 output_table,
                 test_data.MSG_SCHEMA,
-                overwrite=True
+                days_back_start=args.days_back_start,
+                days_back_end=args.days_back_end,
+                concurrency=concurrency,
+                archive=archive,
+            )
+        print(f"✅ Записано сообщений: {written}")
+        if archive is not None:
+            st = archive.stats()
+            print(f"🗄  архив {archive.root}: {st['chats']} чатов, {st['days']} дней, "
+                  f"{st['segments']} сегментов, {st['bytes'] / 2**20:.1f} МБ")
+
+    elif args.command == 'watch':
+        from . import test_data
+        from . import watcher
+        watcher.watch(
+            args.chats if args.chats else test_data.TG_CHATS,
+            model=args.model,
+            verify=args.verify,
+            debounce=args.debounce if args.debounce is not None else watcher.WATCH_DEBOUNCE_SEC,
+            max_delay=args.max_delay if args.max_delay is not None else watcher.WATCH_MAX_DELAY_SEC,
+        )
+
+    else:
+        raise ValueError(f"неизвестная команда: {args.command}")
+
+
+def _enqueue(parser: argparse.ArgumentParser, args: argparse.Namespace) -> None:
+    from . import job_queue
+    # аргументы задания проверяются тем же парсером, что и при прямом запуске
+    job = parser.parse_args(args.job)
+    if job.command in (None, 'serve', 'enqueue', 'jobs', 'watch'):
+        parser.error(f"enqueue: нельзя поставить в очередь команду {job.command}")
+    if getattr(job, 'no_cache', False) or getattr(job, 'refresh', False):
+        # кэш LLM настраивается на процесс serve и общий для всех его заданий
+        parser.error("enqueue: --no-cache / --refresh задаются у serve, а не у задания")
+    params = {k: v for k, v in vars(job).items() if k != 'command'}
+    q = job_queue.JobQueue(args.queue or job_queue.DB_PATH)
+    job_id = q.put(job.command, params)
+    q.close()
+    print(f"📥 job {job_id}: {job.command} поставлен в очередь {q.path}")
+
+
+def _jobs(args: argparse.Namespace) -> None:
+    from . import job_queue
+    q = job_queue.JobQueue(args.queue or job_queue.DB_PATH)
+    print(f"📋 {q.path}: {q.counts()}")
+    for j in q.recent(args.limit):
+        took = f"{j['duration']:.1f}s" if j['duration'] is not None else '—'
+        err = f"  {j['error']}" if j['error'] else ''
+        print(f"  {j['id']:>6}  {j['command']:<10} {j['status']:<8} {took:>8}{err}")
+    q.close()
+
+
+def main():
+    parser = build_parser()
+    args = parser.parse_args()
+    
+    if not args.command:
+        parser.print_help()
+        return
+    
+    if args.command == 'enqueue':
+        _enqueue(parser, args)
+        return 0
+    if args.command == 'jobs':
+        _jobs(args)
+        return 0
+    
+    if hasattr(args, 'no_cache'):
+        from . import eliza_client
+        eliza_client.configure_cache(enabled=not args.no_cache, refresh=args.refresh)
+    
+    status = 0
+    try:
+        if args.command == 'serve':
+            from . import worker
+            worker.serve(
+                run_command,
+                queue_path=args.queue,
+                workers=args.workers,
+                poll=args.poll,
+                exit_when_empty=args.exit_when_empty
             )
-            print("✅ Сообщения загружены в YT!")
+        else:
+            run_command(args)
             
     except Exception as e:
         print(f"Ошибка: {e}")
-        return 1
+        status = 1
+    finally:
+        # строки дайджестов, накопленные в буфере записи, уходят в YT одной пачкой
+        yt_writer = _loaded('yt_writer')
+        if yt_writer:
+            try:
+                yt_writer.flush()
+            except yt_writer.WriteError as e:
+                print(f"Ошибка записи: {e}")
+                status = 1
+        eliza_client = _loaded('eliza_client')
+        if eliza_client:
+            stats = eliza_client.cache_stats()
+            if stats.get('hits') or stats.get('misses'):
+                print(f"🗄  LLM cache: hits={stats['hits']} misses={stats['misses']} writes={stats['writes']}")
+            for model, st in eliza_client.token_stats().items():
+                print(f"🔢 LLM {model}: вызовов {st['calls']}, prompt {st['prompt_tokens']} / completion {st['completion_tokens']} токенов")
+        # сводка по этапам (и выгрузка в METRICS_PROM / METRICS_JSONL)
+        metrics = _loaded('metrics')
+        if metrics:
+            metrics.report()
     
-    return 0
+    return status
 
 
 if __name__ == '__main__':
@@ -0,0 +1,70 @@
+#!/usr/bin/env python3
+"""
+Бенчмарк custom_date_digester: локальный рендер поста vs второй LLM-вызов.
+
+Прогоняет run_custom_date_digester целиком (чтение, сюжеты, пост) для обоих
+значений render без кэша ответов LLM и без записи в YT, печатает время.
+
+    python -m <package>.benchmarks.bench_custom_render \\
+        --channel-id 4963882870 --start-date 2025-01-18 --end-date 2025-01-25 --repeat 3
+"""
+
+import argparse
+import contextlib
+import datetime as dt
+import io
+import pathlib
+import statistics
+import time
+
+from dotenv import load_dotenv
+
+load_dotenv(pathlib.Path(__file__).parent.parent / '.env')
+
+from .. import custom_date_digester
+from .. import eliza_client
+
+
+def _run(args, render: str) -> float:
+    t0 = time.perf_counter()
+    with contextlib.redirect_stdout(io.StringIO()):
+        custom_date_digester.run_custom_date_digester(
+            start_date=args.start_date,
+            end_date=args.end_date,
+            channel_id=args.channel_id,
+            model=args.model,
+            verify=args.verify,
+            render=render,
+            save=False,
+        )
+    return time.perf_counter() - t0
+
+
+def main():
+    parser = argparse.ArgumentParser(description="custom digest: render=local vs render=llm")
+    parser.add_argument('--channel-id', type=int, required=True)
+    parser.add_argument('--start-date', type=dt.date.fromisoformat, required=True)
+    parser.add_argument('--end-date', type=dt.date.fromisoformat, required=True)
+    parser.add_argument('--model', type=str, default='yandex', choices=['yandex', 'deepseek'])
+    parser.add_argument('--verify', type=str, default=str(pathlib.Path(__file__).parent.parent / 'YandexInternalRootCA.pem'))
+    parser.add_argument('--repeat', type=int, default=3)
+    args = parser.parse_args()
+
+    # без кэша — иначе второй прогон меряет диск, а не LLM
+    eliza_client.configure_cache(enabled=False)
+
+    results = {"local": [], "llm": []}
+    for i in range(args.repeat):
+        for render in results:
+            results[render].append(_run(args, render))
+            print(f"  run {i + 1}/{args.repeat} render={render}: {results[render][-1]:.2f}s")
+
+    print(f"\n{'render':<8}{'median, s':>12}{'min, s':>10}{'max, s':>10}")
+    for render, times in results.items():
+        print(f"{render:<8}{statistics.median(times):>12.2f}{min(times):>10.2f}{max(times):>10.2f}")
+    speedup = statistics.median(results["llm"]) / statistics.median(results["local"])
+    print(f"\nlocal быстрее llm в {speedup:.2f}×")
+
+
+if __name__ == '__main__':
+    main()
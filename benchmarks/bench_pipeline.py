@@ -0,0 +1,246 @@
+#!/usr/bin/env python3
+"""
+Сквозной нагрузочный бенчмарк конвейера на локальном стенде LLM (mock_llm).
+
+Поднимает mock_llm в процессе, заполняет локальное хранилище (storage,
+SQLite во временном каталоге) синтетическими каналами, сообщениями и темами,
+и прогоняет сценарии:
+  daily     — run_daily_digester по всем (канал × день), --workers потоков
+  custom    — run_custom_date_digester по всем каналам за весь период
+(process_interval здесь не прогоняется: извлечение тем пишет только в YT,
+см. storage.require_yt)
+
+Для каждого сценария: заданий, ошибок, jobs/s, p50/p95 задержки задания,
+число запросов к LLM (по счётчикам стенда) и токены из eliza_client.
+
+    python -m <package>.benchmarks.bench_pipeline --channels 8 --days 7 --workers 8 \\
+        --latency lognormal:-1.5,0.5 --rate-limit-rate 0.02
+"""
+
+import argparse
+import datetime as dt
+import os
+import pathlib
+import statistics
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, List
+
+from . import mock_llm
+
+
+START = dt.date(2025, 1, 1)
+
+# тематика синтетических тем: темы одной задачи похожи лексически (для mode=clustered)
+_THEMES = [
+    "доставка айсбергов буксирами, расчёт стоимости буксировки и теплоизоляции",
+    "найм стажёров-менеджеров, собеседования и онбординг новичков",
+    "релиз мобильного приложения, регрессионное тестирование и баги сборки",
+    "бюджет квартала, согласование расходов на маркетинг и рекламу",
+    "миграция базы данных, резервные копии и простой сервиса",
+    "подготовка к хакатону, команды участников и призовой фонд",
+    "переезд офиса, аренда помещения и рабочие места",
+]
+
+_CHAT_SCHEMA = [
+    {"name": "chat_id", "type": "int64", "sort_order": "ascending"},
+    {"name": "chat", "type": "string"},
+    {"name": "description", "type": "string"},
+]
+_MSG_SCHEMA = [
+    {"name": "chat_id", "type": "int64", "sort_order": "ascending"},
+    {"name": "message_id", "type": "int64", "sort_order": "ascending"},
+    {"name": "dttm", "type": "string"},
+    {"name": "edit_dttm", "type": "string"},
+    {"name": "text", "type": "string"},
+]
+_ANALYSIS_SCHEMA = [
+    {"name": "topic_id", "type": "string", "sort_order": "ascending"},
+    {"name": "channel_id", "type": "int64"},
+    {"name": "date", "type": "string"},
+    {"name": "summary", "type": "string"},
+    {"name": "status", "type": "string"},
+    {"name": "conclusions", "type": "string"},
+    {"name": "resume", "type": "string"},
+]
+_DAILY_SCHEMA = [
+    {"name": "topic_id", "type": "string", "sort_order": "ascending"},
+    {"name": "channel_id", "type": "int64"},
+    {"name": "date", "type": "string"},
+]
+
+
+def _isolate(tmp: pathlib.Path, from_archive: bool = False) -> None:
+    """всё состояние прогона — во временном каталоге; запросы к LLM — на стенд."""
+    if from_archive:
+        os.environ.update(MESSAGES_SOURCE="archive", TG_ARCHIVE_DIR=str(tmp / "archive"))
+    os.environ.update(
+        STORAGE_BACKEND="sqlite",
+        STORAGE_PATH=str(tmp / "storage.sqlite"),
+        YT_WRITER_SPILL_DIR=str(tmp / "spill"),
+        STATE_DB=str(tmp / "state.sqlite"),
+        CHECKPOINT_DB=str(tmp / "checkpoints.sqlite"),
+        ELIZA_CACHE_DIR=str(tmp / "eliza"),
+    )
+    os.environ.pop("CHANNEL_CACHE_SNAPSHOT", None)
+    os.environ.setdefault("SOY_TOKEN", "mock")
+
+
+def _seed(args, days: List[dt.date]) -> List[int]:
+    """синтетические tg_chats / tg_raw_enriched / topic_analysis / daily_topics."""
+    import pandas as pd
+    from .. import channel_cache, interval_data, orchestrator, storage
+
+    st = storage.get_storage()
+    channels = [1000 + i for i in range(args.channels)]
+    chats, msgs, topics, daily = [], [], [], []
+    for ch in channels:
+        chats.append({"chat_id": ch, "chat": f"Канал {ch}", "description": "синтетический канал"})
+        msg_id = 0
+        for day in days:
+            for m in range(args.messages):
+                msg_id += 1
+                msgs.append({
+                    "chat_id": ch, "message_id": msg_id,
+                    "dttm": f"{day}T{9 + m % 10:02d}:{m % 60:02d}:00+00:00",
+                    "edit_dttm": None, "text": f"сообщение {msg_id}",
+                })
+            for t in range(args.topics):
+                tid = f"{ch}_{day}_{t}"
+                daily.append({"topic_id": tid, "channel_id": ch, "date": str(day)})
+                topics.append({
+                    "topic_id": tid, "channel_id": ch, "date": str(day),
+                    "summary": f"Тема {t} за {day}: {_THEMES[(ch + t) % len(_THEMES)]}",
+                    "status": ["решено", "спор", "отложили"][t % 3],
+                    "conclusions": f"Вывод по теме {t}",
+                    "resume": f"Кратко: тема {t} канала {ch}",
+                })
+    st.upload(pd.DataFrame(chats), channel_cache.TBL_CHATS, _CHAT_SCHEMA, overwrite=True)
+    st.upload(pd.DataFrame(msgs), orchestrator.TBL_MSG, _MSG_SCHEMA, overwrite=True)
+    st.upload(pd.DataFrame(topics), interval_data.TBL_ANALYSIS, _ANALYSIS_SCHEMA, overwrite=True)
+    st.upload(pd.DataFrame(daily), interval_data.TBL_DAILY, _DAILY_SCHEMA, overwrite=True)
+    channel_cache.invalidate()
+    print(f"🌱 {len(channels)} каналов × {len(days)} дней: {len(msgs)} сообщений, {len(topics)} тем")
+    return channels
+
+
+def _timed_jobs(jobs: List[Callable[[], Any]], workers: int) -> Dict[str, Any]:
+    latencies: List[float] = []
+    errors = 0
+
+    def _one(fn):
+        t0 = time.perf_counter()
+        try:
+            fn()
+            return time.perf_counter() - t0, None
+        except Exception as e:
+            return time.perf_counter() - t0, e
+
+    t0 = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=max(1, workers)) as pool:
+        for took, err in pool.map(_one, jobs):
+            latencies.append(took)
+            if err is not None:
+                errors += 1
+                print(f"⚠️ {type(err).__name__}: {err}")
+    return {"jobs": len(jobs), "errors": errors, "elapsed": time.perf_counter() - t0, "latencies": latencies}
+
+
+def _scenario_daily(args, channels, days) -> Dict[str, Any]:
+    from .. import daily_digester
+    jobs = [
+        (lambda ch=ch, day=day: daily_digester.run_daily_digester(
+            date=day, channel_id=ch, model=args.model, verify=False, stream=args.stream,
+        ))
+        for ch in channels for day in days
+    ]
+    return _timed_jobs(jobs, args.workers)
+
+
+def _scenario_custom(args, channels, days) -> Dict[str, Any]:
+    from .. import custom_date_digester
+    jobs = [
+        (lambda ch=ch: custom_date_digester.run_custom_date_digester(
+            start_date=days[0], end_date=days[-1], channel_id=ch,
+            model=args.model, verify=False, stream=args.stream, mode=args.custom_mode,
+        ))
+        for ch in channels
+    ]
+    return _timed_jobs(jobs, args.workers)
+
+
+SCENARIOS = {"daily": _scenario_daily, "custom": _scenario_custom}
+
+
+def _pct(values: List[float], q: float) -> float | None:
+    if not values:
+        return None
+    if len(values) == 1:
+        return values[0]
+    return statistics.quantiles(values, n=100, method="inclusive")[int(q) - 1]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="сквозной бенчмарк конвейера на локальном стенде LLM")
+    parser.add_argument('--scenarios', type=str, default='daily,custom', help='Через запятую: daily, custom')
+    parser.add_argument('--channels', type=int, default=4)
+    parser.add_argument('--days', type=int, default=7)
+    parser.add_argument('--topics', type=int, default=5, help='Тем на (канал, день)')
+    parser.add_argument('--messages', type=int, default=20, help='Сообщений на (канал, день)')
+    parser.add_argument('--workers', type=int, default=4)
+    parser.add_argument('--model', type=str, default='yandex', choices=['yandex', 'deepseek'])
+    parser.add_argument('--stream', action='store_true', help='Дайджесты в режиме стриминга')
+    parser.add_argument('--custom-mode', type=str, default='auto', choices=['auto', 'single', 'hierarchical', 'clustered'], help='mode для сценария custom')
+    parser.add_argument('--from-archive', action='store_true', help='tg_raw_enriched — из локального архива (tg_archive, нужен pyarrow)')
+    mock_llm.add_mock_args(parser)
+    args = parser.parse_args()
+
+    tmp = pathlib.Path(tempfile.mkdtemp(prefix="tg_bench_"))
+    _isolate(tmp, args.from_archive)
+    mock = mock_llm.from_args(args)
+    server = mock_llm.start(mock)
+    host, port = server.server_address[:2]
+
+    from .. import eliza_client, metrics, yt_writer
+    eliza_client.configure_endpoint(f"http://{host}:{port}")
+    eliza_client.configure_cache(enabled=False)      # меряем LLM-вызовы, а не диск
+
+    days = [START + dt.timedelta(days=i) for i in range(args.days)]
+    channels = _seed(args, days)
+
+    results = {}
+    for name in [s.strip() for s in args.scenarios.split(",") if s.strip()]:
+        before = mock.snapshot()["requests"]
+        print(f"\n▶️  {name}")
+        try:
+            res = SCENARIOS[name](args, channels, days)
+        except ImportError as e:
+            print(f"⏭  {name}: пропущен ({e})")
+            continue
+        yt_writer.flush()
+        res["llm_calls"] = mock.snapshot()["requests"] - before
+        results[name] = res
+
+    server.shutdown()
+
+    def _ms(v):
+        return f"{v * 1000:.0f}" if v is not None else "—"
+
+    print(f"\n{'scenario':<10}{'jobs':>6}{'errors':>8}{'elapsed, s':>12}{'jobs/s':>9}{'p50, ms':>9}{'p95, ms':>9}{'LLM calls':>11}")
+    for name, r in results.items():
+        print(
+            f"{name:<10}{r['jobs']:>6}{r['errors']:>8}{r['elapsed']:>12.2f}"
+            f"{r['jobs'] / r['elapsed'] if r['elapsed'] else 0:>9.2f}"
+            f"{_ms(_pct(r['latencies'], 50)):>9}{_ms(_pct(r['latencies'], 95)):>9}{r['llm_calls']:>11}"
+        )
+    stats = mock.snapshot()
+    print(f"\n🧪 стенд: запросов {stats['requests']}, 500 {stats['errors']}, 429 {stats['rate_limited']}, стримов {stats['streams']}")
+    for model, st in eliza_client.token_stats().items():
+        print(f"🔢 LLM {model}: вызовов {st['calls']}, prompt {st['prompt_tokens']} / completion {st['completion_tokens']} токенов")
+    metrics.report()
+    print(f"📁 данные прогона: {tmp}")
+
+
+if __name__ == '__main__':
+    main()
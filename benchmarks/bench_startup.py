@@ -0,0 +1,118 @@
+#!/usr/bin/env python3
+"""
+Бенчмарк старта CLI: `python -X importtime -m <package> ...` для набора команд.
+
+Каждая команда запускается в отдельном процессе (--repeat раз), печатается
+медиана wall-time, суммарное время импортов и самые тяжёлые модули верхнего
+уровня. С --max-ms код возврата 1, если медиана какой-то команды превысила
+порог — так регрессии старта ловятся в CI. Команда, завершившаяся с ненулевым
+кодом (например, упавшая на импорте), — всегда код возврата 1 и хвост stderr.
+
+    python -m <package>.benchmarks.bench_startup --repeat 5 --max-ms 300
+    python -m <package>.benchmarks.bench_startup --cmd "--help" --cmd "resume --help"
+"""
+
+import argparse
+import pathlib
+import re
+import shlex
+import statistics
+import subprocess
+import sys
+import time
+from typing import Dict, List, Tuple
+
+PACKAGE_DIR = pathlib.Path(__file__).resolve().parent.parent
+PACKAGE = PACKAGE_DIR.name
+
+DEFAULT_COMMANDS = [
+    "--help",
+    "interval --help",
+    "resume --help",
+    "custom --help",
+    "dump --help",
+]
+
+# import time:       self [us] |  cumulative | imported package
+_LINE_RE = re.compile(r"^import time:\s+(\d+)\s+\|\s+(\d+)\s+\|(\s*)(\S+)")
+
+
+def _parse_importtime(stderr: str) -> Tuple[int, Dict[str, int]]:
+    """(сумма self, мкс; cumulative модулей верхнего уровня, мкс)."""
+    total = 0
+    top: Dict[str, int] = {}
+    for line in stderr.splitlines():
+        m = _LINE_RE.match(line)
+        if not m:
+            continue
+        self_us, cum_us, indent, name = int(m.group(1)), int(m.group(2)), m.group(3), m.group(4)
+        total += self_us
+        if len(indent) <= 1:                 # модуль импортирован напрямую, не транзитивно
+            top[name] = max(top.get(name, 0), cum_us)
+    return total, top
+
+
+def _stderr_tail(stderr: str, lines: int = 10) -> str:
+    """stderr без строк -X importtime — последние lines строк."""
+    rest = [l for l in stderr.splitlines() if not l.startswith("import time:")]
+    return "\n".join(rest[-lines:])
+
+
+def _run(cmd: str) -> Tuple[float, int, Dict[str, int], int, str]:
+    """(wall, сек; импорты, мкс; модули верхнего уровня; код возврата; stderr)."""
+    argv = [sys.executable, "-X", "importtime", "-m", PACKAGE, *shlex.split(cmd)]
+    t0 = time.perf_counter()
+    proc = subprocess.run(
+        argv,
+        cwd=PACKAGE_DIR.parent,
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.PIPE,
+        text=True,
+    )
+    wall = time.perf_counter() - t0
+    total, top = _parse_importtime(proc.stderr)
+    return wall, total, top, proc.returncode, proc.stderr
+
+
+def main():
+    parser = argparse.ArgumentParser(description="время старта CLI по командам (-X importtime)")
+    parser.add_argument('--cmd', action='append', help='Аргументы CLI (можно несколько раз); по умолчанию набор --help')
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--top', type=int, default=8, help='Сколько самых тяжёлых импортов показать')
+    parser.add_argument('--max-ms', type=float, help='Порог медианы wall-time, мс: выше — код возврата 1')
+    args = parser.parse_args()
+
+    commands: List[str] = args.cmd or DEFAULT_COMMANDS
+    _run(commands[0])                        # прогрев: .pyc и файловый кэш
+
+    failed = []
+    crashed = []
+    print(f"{'command':<24}{'wall, ms':>10}{'imports, ms':>13}")
+    for cmd in commands:
+        runs = [_run(cmd) for _ in range(args.repeat)]
+        wall = statistics.median(r[0] for r in runs) * 1000
+        imports = statistics.median(r[1] for r in runs) / 1000
+        bad = next((r for r in runs if r[3] != 0), None)
+        mark = ""
+        if bad is not None:
+            crashed.append(cmd)
+            mark = f"  💥 exit {bad[3]}"
+        elif args.max_ms is not None and wall > args.max_ms:
+            failed.append(cmd)
+            mark = "  ❌"
+        print(f"{cmd:<24}{wall:>10.1f}{imports:>13.1f}{mark}")
+        if bad is not None:
+            print("    " + _stderr_tail(bad[4]).replace("\n", "\n    "))
+            continue
+        heaviest = sorted(runs[-1][2].items(), key=lambda kv: kv[1], reverse=True)[:args.top]
+        print("    " + ", ".join(f"{name} {us / 1000:.1f}" for name, us in heaviest))
+
+    if crashed:
+        print(f"\n💥 команда завершилась с ошибкой: {', '.join(crashed)}")
+    if failed:
+        print(f"\n❌ старт дольше {args.max_ms:.0f} мс: {', '.join(failed)}")
+    return 1 if crashed or failed else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,296 @@
+#!/usr/bin/env python3
+"""
+Локальный детерминированный стенд вместо Eliza.
+
+Отвечает в обоих форматах, которые понимает eliza_client:
+  …/chat/completions  → chat-completions (deepseek): choices[0].message.content
+  любой другой путь   → generative (yandex): response.Responses[0].Response
+stream=true — SSE: delta.content для chat-completions, накопленный текст
+для generative, в конце «data: [DONE]».
+
+Ответ зависит только от промпта (sha256): дневной дайджест, сюжеты периода,
+пост или общий JSON — по маркерам промпта. Задержка и ошибки берутся из
+генератора с фиксированным seed, так что прогон воспроизводим.
+
+    python -m <package>.benchmarks.mock_llm --port 8099 --latency lognormal:-1.5,0.5 --error-rate 0.01
+    # + время генерации 20 мс на completion-токен
+    python -m <package>.benchmarks.mock_llm --port 8099 --latency fixed:0.2 --token-latency 0.02
+    ELIZA_BASE_URL=http://127.0.0.1:8099 SOY_TOKEN=mock ./telegram_digester daily ...
+
+GET /stats — счётчики запросов по моделям, внедрённых ошибок и стримов.
+"""
+
+import argparse
+import hashlib
+import json
+import random
+import re
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Callable, Dict, List
+
+
+# ─────────── задержки ───────────
+def parse_latency(spec: str) -> Callable[[random.Random], float]:
+    """
+    fixed:S | uniform:A,B | exp:MEAN | lognormal:MU,SIGMA  (секунды)
+    """
+    kind, _, args = spec.partition(":")
+    nums = [float(x) for x in args.split(",") if x]
+    if kind == "fixed":
+        return lambda rng: nums[0]
+    if kind == "uniform":
+        return lambda rng: rng.uniform(nums[0], nums[1])
+    if kind == "exp":
+        return lambda rng: rng.expovariate(1 / nums[0])
+    if kind == "lognormal":
+        return lambda rng: rng.lognormvariate(nums[0], nums[1])
+    raise ValueError(f"unknown latency spec: {spec}")
+
+
+# ─────────── ответы ───────────
+_DATE_RE = re.compile(r"\d{4}-\d{2}-\d{2}")
+
+
+def _rng_for(prompt: str) -> random.Random:
+    return random.Random(hashlib.sha256(prompt.encode()).digest())
+
+
+def _daily_answer(prompt: str, rng: random.Random) -> str:
+    return json.dumps({
+        "discussions": [f"• Обсуждение {i + 1}: {rng.randrange(10**6):06d}" for i in range(rng.randint(1, 4))],
+        "commitments": [f"• Коммит {i + 1} до пятницы" for i in range(rng.randint(0, 2))],
+    }, ensure_ascii=False)
+
+
+def _stories_answer(prompt: str, rng: random.Random, max_stories: int = 4) -> str:
+    days = sorted(set(_DATE_RE.findall(prompt))) or ["2025-01-01"]
+    stories = []
+    for rank in range(1, min(10, rng.randint(1, max_stories)) + 1):
+        covered = sorted(rng.sample(days, k=min(len(days), rng.randint(1, 3))))
+        stories.append({
+            "rank": rank,
+            "title": f"Сюжет {rank}",
+            "days_covered": covered,
+            "summary": f"Сводка сюжета {rank} ({rng.randrange(10**6):06d})",
+            "evolution": [f"{d}: шаг" for d in covered],
+            "final_status": rng.choice(["решено", "спор", "отложили", "неясно"]),
+            "key_participants": [{"name": "Участник", "role": "аналитик"}],
+            "resume": "Итог сюжета",
+        })
+    return json.dumps(stories, ensure_ascii=False)
+
+
+def _post_answer(prompt: str, rng: random.Random) -> str:
+    days = sorted(set(_DATE_RE.findall(prompt))) or ["2025-01-01"]
+    lines = [f"Дайджест:  {days[0]} – {days[-1]}"]
+    lines += [f"• [{d[-2:]}] Сюжет {i + 1}: сводка" for i, d in enumerate(days[:10])]
+    return "\n".join(lines)
+
+
+def _generic_answer(prompt: str, rng: random.Random) -> str:
+    return json.dumps({"answer": f"mock-{rng.randrange(10**9):09d}"})
+
+
+def answer_for(prompt: str) -> str:
+    """детерминированный ответ по тексту промпта."""
+    rng = _rng_for(prompt)
+    if '"discussions"' in prompt:
+        return _daily_answer(prompt, rng)
+    if "пост-дайджест" in prompt:
+        return _post_answer(prompt, rng)
+    if "одной сюжетной линии" in prompt:          # CLUSTER_PROMPT: кластер → один сюжет
+        return _stories_answer(prompt, rng, max_stories=1)
+    if ("сюжет" in prompt and '"rank"' in prompt) or "rank, title" in prompt:
+        return _stories_answer(prompt, rng)
+    return _generic_answer(prompt, rng)
+
+
+def _usage(prompt: str, text: str) -> Dict[str, int]:
+    # грубо: ~4 символа на токен — стенду точность не нужна
+    return {"prompt_tokens": len(prompt) // 4 + 1, "completion_tokens": len(text) // 4 + 1}
+
+
+def _chat_body(text: str, usage: Dict[str, int]) -> Dict[str, Any]:
+    return {"choices": [{"message": {"role": "assistant", "content": text}}], "usage": usage}
+
+
+def _generative_body(text: str, usage: Dict[str, int]) -> Dict[str, Any]:
+    return {"response": {"Responses": [{"Response": text}], "usage": usage}}
+
+
+def _pieces(text: str, n: int) -> List[str]:
+    step = max(1, len(text) // n)
+    return [text[i:i + step] for i in range(0, len(text), step)]
+
+
+# ─────────── сервер ───────────
+class MockLLM:
+    """параметры стенда и счётчики; handler() — класс обработчика для HTTP-сервера."""
+
+    def __init__(
+        self,
+        *,
+        latency: str = "fixed:0.05",
+        token_latency: float = 0.0,
+        error_rate: float = 0.0,
+        rate_limit_rate: float = 0.0,
+        retry_after: float = 1.0,
+        stream_chunks: int = 8,
+        stream_delay: float = 0.01,
+        seed: int = 42,
+    ) -> None:
+        self.latency = parse_latency(latency)
+        self.token_latency = token_latency
+        self.error_rate = error_rate
+        self.rate_limit_rate = rate_limit_rate
+        self.retry_after = retry_after
+        self.stream_chunks = stream_chunks
+        self.stream_delay = stream_delay
+        self._rng = random.Random(seed)
+        self._lock = threading.Lock()
+        self.stats: Dict[str, Any] = {"requests": 0, "by_model": {}, "errors": 0, "rate_limited": 0, "streams": 0}
+
+    def _draw(self) -> tuple:
+        """(задержка, исход) из общего seeded-генератора — последовательность воспроизводима."""
+        with self._lock:
+            delay = max(0.0, self.latency(self._rng))
+            roll = self._rng.random()
+        if roll < self.rate_limit_rate:
+            return delay, 429
+        if roll < self.rate_limit_rate + self.error_rate:
+            return delay, 500
+        return delay, 200
+
+    def _count(self, key: str, model: str | None = None) -> None:
+        with self._lock:
+            self.stats[key] += 1
+            if model:
+                self.stats["by_model"][model] = self.stats["by_model"].get(model, 0) + 1
+
+    def snapshot(self) -> Dict[str, Any]:
+        with self._lock:
+            return json.loads(json.dumps(self.stats))
+
+    def handler(self):
+        mock = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def log_message(self, *args):
+                pass
+
+            def _send_json(self, status: int, body: Dict[str, Any], headers: Dict[str, str] | None = None):
+                raw = json.dumps(body, ensure_ascii=False).encode()
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(raw)))
+                for k, v in (headers or {}).items():
+                    self.send_header(k, v)
+                self.end_headers()
+                self.wfile.write(raw)
+
+            def do_GET(self):
+                if self.path.rstrip("/") == "/stats":
+                    self._send_json(200, mock.snapshot())
+                else:
+                    self._send_json(404, {"error": "not found"})
+
+            def do_POST(self):
+                body = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))) or b"{}")
+                chat = self.path.rstrip("/").endswith("/chat/completions")
+                model = "deepseek" if chat else "yandex"
+                prompt = "\n".join(m.get("content", "") for m in body.get("messages", []))
+                mock._count("requests", model)
+
+                delay, status = mock._draw()
+                time.sleep(delay)
+                if status == 429:
+                    mock._count("rate_limited")
+                    self._send_json(429, {"error": "rate limited"}, {"Retry-After": f"{mock.retry_after:g}"})
+                    return
+                if status == 500:
+                    mock._count("errors")
+                    self._send_json(500, {"error": "injected failure"})
+                    return
+
+                text = answer_for(prompt)
+                usage = _usage(prompt, text)
+                # время генерации: пропорционально числу completion-токенов
+                time.sleep(mock.token_latency * usage["completion_tokens"])
+                if not body.get("stream"):
+                    self._send_json(200, _chat_body(text, usage) if chat else _generative_body(text, usage))
+                    return
+
+                mock._count("streams")
+                self.send_response(200)
+                self.send_header("Content-Type", "text/event-stream")
+                self.send_header("Connection", "close")
+                self.end_headers()
+                sent = ""
+                for piece in _pieces(text, mock.stream_chunks):
+                    sent += piece
+                    chunk = (
+                        {"choices": [{"delta": {"content": piece}}]} if chat
+                        else _generative_body(sent, usage)
+                    )
+                    self.wfile.write(f"data: {json.dumps(chunk, ensure_ascii=False)}\n\n".encode())
+                    self.wfile.flush()
+                    time.sleep(mock.stream_delay)
+                self.wfile.write(b"data: [DONE]\n\n")
+                self.close_connection = True
+
+        return Handler
+
+
+def start(mock: MockLLM, host: str = "127.0.0.1", port: int = 0) -> ThreadingHTTPServer:
+    """поднимает стенд в фоновом потоке; адрес — server.server_address."""
+    server = ThreadingHTTPServer((host, port), mock.handler())
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, name="mock-llm", daemon=True).start()
+    return server
+
+
+def add_mock_args(parser: argparse.ArgumentParser) -> None:
+    parser.add_argument('--latency', type=str, default='fixed:0.05', help='fixed:S | uniform:A,B | exp:MEAN | lognormal:MU,SIGMA')
+    parser.add_argument('--token-latency', type=float, default=0.0, help='Доп. задержка на completion-токен, сек (генерация)')
+    parser.add_argument('--error-rate', type=float, default=0.0, help='Доля ответов 500')
+    parser.add_argument('--rate-limit-rate', type=float, default=0.0, help='Доля ответов 429')
+    parser.add_argument('--retry-after', type=float, default=1.0, help='Retry-After для 429, сек')
+    parser.add_argument('--stream-chunks', type=int, default=8)
+    parser.add_argument('--stream-delay', type=float, default=0.01, help='Пауза между SSE-чанками, сек')
+    parser.add_argument('--seed', type=int, default=42)
+
+
+def from_args(args: argparse.Namespace) -> MockLLM:
+    return MockLLM(
+        latency=args.latency,
+        token_latency=args.token_latency,
+        error_rate=args.error_rate,
+        rate_limit_rate=args.rate_limit_rate,
+        retry_after=args.retry_after,
+        stream_chunks=args.stream_chunks,
+        stream_delay=args.stream_delay,
+        seed=args.seed,
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description="локальный стенд LLM (yandex generative + chat-completions)")
+    parser.add_argument('--host', type=str, default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8099)
+    add_mock_args(parser)
+    args = parser.parse_args()
+
+    server = ThreadingHTTPServer((args.host, args.port), from_args(args).handler())
+    print(f"🧪 mock LLM: http://{args.host}:{args.port}  (ELIZA_BASE_URL)")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == '__main__':
+    main()
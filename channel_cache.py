@@ -0,0 +1,136 @@
+# channel_cache.py
+# ─────────────────────────────────────────────────────────────
+# Кэш метаданных каналов (tg_chats: chat, description) на весь процесс.
+# Таблица целиком читается одним запросом и живёт TTL секунд;
+# опционально сохраняется в локальный снапшот (CHANNEL_CACHE_SNAPSHOT),
+# чтобы следующий запуск CLI не ходил в YQL вовсе.
+#
+# После изменения tg_chats (init-data, правка описаний) — invalidate().
+
+from __future__ import annotations
+import contextlib, json, os, pathlib, threading, time
+from typing import Any, Dict
+
+import pandas as pd
+
+from . import metrics
+from . import storage
+
+
+ROOT       = os.getenv("YT_ROOT", "//tmp/ia-nartov/hackathon")
+TBL_CHATS  = f"{ROOT}/tg_chats"
+
+TTL        = float(os.getenv("CHANNEL_CACHE_TTL", "3600"))
+SNAPSHOT   = os.getenv("CHANNEL_CACHE_SNAPSHOT")     # путь к json; пусто — без снапшота
+
+_MISS_RELOAD_INTERVAL = 60.0     # неизвестный канал → перечитать таблицу не чаще раза в минуту
+
+
+class ChannelCache:
+    """chat_id → {chat, description}; bulk-загрузка tg_chats, TTL, снапшот на диске."""
+
+    def __init__(self, ttl: float = TTL, snapshot_path: str | os.PathLike | None = SNAPSHOT) -> None:
+        self.ttl = ttl
+        self.snapshot_path = pathlib.Path(snapshot_path) if snapshot_path else None
+        self._rows: Dict[int, Dict[str, Any]] = {}
+        self._loaded_at = 0.0
+        self._lock = threading.Lock()
+        self._refresh_lock = threading.Lock()      # один запрос к tg_chats на все потоки
+
+    # ─────────── загрузка ───────────
+    def _fresh(self) -> bool:
+        return bool(self._rows) and time.time() - self._loaded_at < self.ttl
+
+    def _read_snapshot(self) -> bool:
+        if not self.snapshot_path or not self.snapshot_path.exists():
+            return False
+        try:
+            snap = json.loads(self.snapshot_path.read_text(encoding="utf-8"))
+            loaded_at = float(snap["loaded_at"])
+            rows = {int(r["chat_id"]): r for r in snap["rows"]}
+        except (OSError, ValueError, KeyError, TypeError):
+            # битый или чужой снапшот — игнорируем, таблица перечитается
+            return False
+        if time.time() - loaded_at >= self.ttl:
+            return False
+        self._rows = rows
+        self._loaded_at = loaded_at
+        return True
+
+    def _write_snapshot(self) -> None:
+        if not self.snapshot_path:
+            return
+        # свой tmp на процесс: параллельные запуски CLI не пишут в один файл
+        tmp = self.snapshot_path.with_name(f"{self.snapshot_path.name}.{os.getpid()}.tmp")
+        try:
+            self.snapshot_path.parent.mkdir(parents=True, exist_ok=True)
+            tmp.write_text(
+                json.dumps({"loaded_at": self._loaded_at, "rows": list(self._rows.values())}, ensure_ascii=False),
+                encoding="utf-8",
+            )
+            os.replace(tmp, self.snapshot_path)
+        except OSError as e:
+            # снапшот — только ускорение; данные в памяти уже свежие
+            print(f"⚠️  снапшот каналов не сохранён ({self.snapshot_path}): {e}")
+            with contextlib.suppress(OSError):
+                tmp.unlink(missing_ok=True)
+
+    @metrics.timed("read.chats")
+    def refresh(self) -> None:
+        """перечитывает tg_chats целиком одним запросом."""
+        df = storage.get_storage().chats(TBL_CHATS)
+        with self._lock:
+            self._rows = {
+                int(r["chat_id"]): {"chat_id": int(r["chat_id"]), "chat": r["chat"], "description": r["description"]}
+                for r in df.to_dict("records")
+            }
+            self._loaded_at = time.time()
+            self._write_snapshot()
+
+    def _loaded(self) -> bool:
+        with self._lock:
+            return self._fresh() or self._read_snapshot()
+
+    def _ensure_loaded(self) -> None:
+        if self._loaded():
+            return
+        with self._refresh_lock:
+            # пока ждали, таблицу мог перечитать другой поток
+            if not self._loaded():
+                self.refresh()
+
+    # ─────────── API ───────────
+    def get(self, channel_id: int) -> pd.Series:
+        """строка tg_chats (chat, description); KeyError, если канала нет."""
+        self._ensure_loaded()
+        row = self._rows.get(int(channel_id))
+        if row is None and time.time() - self._loaded_at > _MISS_RELOAD_INTERVAL:
+            # канал мог появиться после загрузки — перечитываем один раз
+            with self._refresh_lock:
+                if time.time() - self._loaded_at > _MISS_RELOAD_INTERVAL:
+                    self.refresh()
+            row = self._rows.get(int(channel_id))
+        if row is None:
+            raise KeyError(f"channel {channel_id} not found in {TBL_CHATS}")
+        return pd.Series(row)
+
+    def invalidate(self) -> None:
+        """сбрасывает кэш в памяти и снапшот на диске."""
+        with self._lock:
+            self._rows = {}
+            self._loaded_at = 0.0
+            if self.snapshot_path:
+                self.snapshot_path.unlink(missing_ok=True)
+
+
+_cache = ChannelCache()
+
+
+def get_channel(channel_id: int) -> pd.Series:
+    """метаданные канала из общего кэша процесса."""
+    return _cache.get(channel_id)
+
+
+def invalidate() -> None:
+    """сбросить общий кэш (после изменения tg_chats)."""
+    _cache.invalidate()
@@ -0,0 +1,140 @@
+# checkpoint.py
+# ─────────────────────────────────────────────────────────────
+# Журнал прогона process_interval (SQLite): статус каждой единицы работы
+#   stage = "extract"       unit = "<канал>:<день>"   — topic_extractor за день
+#   stage = "resume"        unit = topic_id           — topic_resumator по теме
+#   stage = "daily_digest"  unit = "<канал>:<день>"   — дневной дайджест
+#
+# status: queued → done | failed. Темы дня записываются (queued) в той же
+# транзакции, что и успешный extract, поэтому после падения процесса
+# `--resume` знает, какие темы ещё не разобраны, и не перезапускает extractor.
+# Прогон идентифицируется интервалом и каналом (run_key).
+
+from __future__ import annotations
+import datetime as dt
+import os, pathlib, sqlite3, threading, time
+from typing import Dict, Iterable, List, Set, Tuple
+
+
+DB_PATH = os.getenv(
+    "CHECKPOINT_DB",
+    str(pathlib.Path.home() / ".cache" / "tg_digester" / "checkpoints.sqlite"),
+)
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS units (
+    run_key     TEXT    NOT NULL,
+    stage       TEXT    NOT NULL,
+    unit        TEXT    NOT NULL,
+    channel_id  INTEGER NOT NULL,
+    day         TEXT    NOT NULL,
+    status      TEXT    NOT NULL,
+    attempts    INTEGER NOT NULL DEFAULT 0,
+    error       TEXT,
+    updated_at  REAL    NOT NULL,
+    PRIMARY KEY (run_key, stage, unit)
+);
+"""
+
+Pair = Tuple[int, dt.date]
+
+
+def run_key(start: dt.date, end: dt.date, channel_id: int | None = None) -> str:
+    """идентификатор прогона: один и тот же для повторного запуска с теми же параметрами."""
+    return f"interval:{start}:{end}:{channel_id or 'all'}"
+
+
+def pair_unit(channel_id: int, day) -> str:
+    return f"{int(channel_id)}:{day}"
+
+
+class Journal:
+    """статусы (stage, unit) одного прогона."""
+
+    def __init__(self, key: str, path: str | os.PathLike = DB_PATH) -> None:
+        self.key = key
+        self.path = pathlib.Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self._conn = sqlite3.connect(self.path, check_same_thread=False)
+        self._conn.executescript(_SCHEMA)
+        self._lock = threading.Lock()
+
+    def close(self) -> None:
+        self._conn.close()
+
+    def reset(self) -> None:
+        """новый прогон с теми же параметрами: старые статусы забываются."""
+        with self._lock, self._conn:
+            self._conn.execute("DELETE FROM units WHERE run_key = ?", (self.key,))
+
+    def _upsert(self, stage: str, unit: str, ch: int, day, status: str, error: str | None) -> None:
+        # attempts растёт только на done/failed — то есть на фактических попытках
+        self._conn.execute(
+            """
+            INSERT INTO units VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+            ON CONFLICT (run_key, stage, unit) DO UPDATE SET
+                status = excluded.status,
+                attempts = units.attempts + excluded.attempts,
+                error = excluded.error,
+                updated_at = excluded.updated_at
+            """,
+            (self.key, stage, unit, int(ch), str(day), status,
+             0 if status == "queued" else 1, error, time.time()),
+        )
+
+    def mark(self, stage: str, unit: str, ch: int, day, *, error: str | None = None) -> None:
+        """unit выполнен (error=None) или упал."""
+        with self._lock, self._conn:
+            self._upsert(stage, unit, ch, day, "failed" if error else "done", error)
+
+    def extracted(self, ch: int, day, topic_ids: Iterable[str]) -> None:
+        """extract за день выполнен, его темы ждут resumator'а — одной транзакцией."""
+        with self._lock, self._conn:
+            for tid in topic_ids:
+                self._upsert("resume", str(tid), ch, day, "queued", None)
+            self._upsert("extract", pair_unit(ch, day), ch, day, "done", None)
+
+    def done(self, stage: str) -> Set[str]:
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT unit FROM units WHERE run_key = ? AND stage = ? AND status = 'done'",
+                (self.key, stage),
+            ).fetchall()
+        return {r[0] for r in rows}
+
+    def pending_topics(self) -> List[Tuple[int, dt.date, str]]:
+        """темы уже извлечённых дней, которые ещё не разобраны (queued или failed)."""
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT channel_id, day, unit FROM units "
+                "WHERE run_key = ? AND stage = 'resume' AND status != 'done' ORDER BY channel_id, day",
+                (self.key,),
+            ).fetchall()
+        return [(ch, dt.date.fromisoformat(day), tid) for ch, day, tid in rows]
+
+    def unfinished_days(self) -> Set[Pair]:
+        """дни, у которых есть неразобранные темы."""
+        return {(ch, day) for ch, day, _ in self.pending_topics()}
+
+    def failures(self) -> List[Dict]:
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT stage, unit, attempts, error FROM units "
+                "WHERE run_key = ? AND status != 'done' ORDER BY stage, unit",
+                (self.key,),
+            ).fetchall()
+        return [
+            {"stage": stage, "unit": unit, "attempts": att, "error": err or "не выполнено"}
+            for stage, unit, att, err in rows
+        ]
+
+    def report(self) -> List[Dict]:
+        """печатает сводку по незавершённым единицам работы; возвращает их."""
+        failures = self.failures()
+        if not failures:
+            print(f"🧾 {self.key}: все единицы работы выполнены")
+            return failures
+        print(f"🧾 {self.key}: не выполнено {len(failures)} (повторить: --resume)")
+        for f in failures:
+            print(f"   ❌ {f['stage']:<12} {f['unit']:<32} попыток {f['attempts']}: {f['error']}")
+        return failures
@@ -6,13 +6,21 @@
 
 from __future__ import annotations
 import datetime as dt, json, os, re
+from concurrent.futures import ThreadPoolExecutor
 from typing import Any, Dict, List
 
 import pandas as pd
 from dateutil import tz
 
-from . import tg_etl
+from . import storage
+from . import yt_writer
+from . import channel_cache
 from . import eliza_client
+from . import json_stream
+from . import metrics
+from . import prompt_builder
+from . import topic_clusters
+from .interval_data import IntervalData
 
 
 # ─────────── YT таблицы ───────────
@@ -113,35 +121,82 @@ json
 Верни ОДИН текстовый блок-пост без обрамления.
 """
 
+MERGE_PROMPT = """
+Ты — ведущий редактор периодических дайджестов.
+Период {start_date} → {end_date} разбит на части, и для каждой части уже
+выделены «сюжеты». Твоя задача — свести их в **до 10** сюжетных линий всего периода.
+
+────────────────────────────────────────
+🛈 ВХОД
+Канал: {channel_name} — {channel_description}
+
+Сюжеты по частям периода:
+json
+{stories_json}
+
+
+────────────────────────────────────────
+📋 ЗАДАЧА
+• Объедини сюжеты разных частей, если это одна и та же тема или её продолжение;
+  days_covered объединённого сюжета — объединение дней исходных.
+• evolution объединённого сюжета отражает развитие темы по дням.
+• Отсортируй сюжеты по убыванию значимости, перенумеруй rank и выбери максимум 10.
+
+────────────────────────────────────────
+📤 ВЫХОД — JSON-массив (1–10 объектов) с теми же полными ключами, что у элементов items на входе:
+rank, title, days_covered, summary, evolution, final_status, key_participants ([{{"name":"…","role":"…"}}]), resume.
+
+⚠️ Ограничения
+• Используй только входные данные, не придумывай фактов.
+• Итог — валидный JSON без комментариев вокруг.
+"""
+
+CLUSTER_PROMPT = """
+Ты — ведущий редактор периодических дайджестов.
+Ниже — элементы за период {start_date} → {end_date} (канал: {channel_name}),
+которые по тексту похожи и, скорее всего, относятся к одной сюжетной линии.
+
+Данные:
+json
+{items_json}
+
+Сведи их в один сюжет с учётом развития по дням; если элементы явно о разном —
+в 2–3 сюжета. Выход — JSON-массив объектов с полями
+rank, title, days_covered (["YYYY-MM-DD", …]), summary, evolution (["…"]),
+final_status (решено|спор|отложили|неясно|null), key_participants ([{{"name":"…","role":"…"}}]),
+resume (одна итоговая фраза).
+Только входные данные; русский, нейтрально-деловой, без markdown; валидный JSON без комментариев вокруг.
+"""
+
 # ─────────── helpers ───────────
 
 def _channel_row(channel_id: int) -> pd.Series:
-    return tg_etl.query_yql(
-    f"""SELECT chat, description
-    FROM hahn.`{TBL_CHATS}`
-    WHERE chat_id = {channel_id}
-    LIMIT 1;"""
-    ).iloc[0]
+    """метаданные канала из общего кэша tg_chats (см. channel_cache)."""
+    return channel_cache.get_channel(channel_id)
 
+@metrics.timed("custom.read_items")
 def _load_items(channel_id: int,
     start: dt.date,
-    end: dt.date) -> list[dict]:
+    end: dt.date,
+    data: IntervalData | None = None) -> list[dict]:
     """возвращает объединённый список items за период"""
-    topics = tg_etl.query_yql(
-    f"""
-    SELECT
-    "topic" AS type, date, summary, status, conclusions
-    FROM hahn.`{TBL_TOPICS}`
-    WHERE channel_id = {channel_id}
-    AND date BETWEEN "{start}" AND "{end}"
-    """
+    if data is not None:
+        return [
+            {"type": "topic", **rec}
+            for rec in data.topics_between(
+                channel_id, start, end, ["date", "summary", "status", "conclusions"]
+            )
+        ]
+    topics = storage.get_storage().by_channel_date(
+        TBL_TOPICS, ["date", "summary", "status", "conclusions"], start, end, [channel_id]
     )
     
     items = []
     if not topics.empty:
-        items.extend(topics.to_dict("records"))
+        items.extend({"type": "topic", **rec} for rec in topics.to_dict("records"))
     return items
 
+@metrics.timed("custom.prompt")
 def _prompt_period(start: dt.date,
     end: dt.date,
     channel: pd.Series,
@@ -152,10 +207,11 @@ def _prompt_period(start: dt.date,
     end_date=end,
     channel_name=channel["chat"],
     channel_description=channel["description"],
-    items_json=json.dumps({"items": items}, ensure_ascii=False, indent=2)
+    items_json=prompt_builder.compact_payload(items)
     )
     return [{"role": "user", "content": txt}]
 
+@metrics.timed("custom.parse")
 def _parse_stories(raw: str) -> list[dict]:
     try:
         data = json.loads(raw)
@@ -167,17 +223,367 @@ def _parse_stories(raw: str) -> list[dict]:
         raise ValueError("LLM output must be non-empty JSON array")
     return data[:10]
 
+@metrics.timed("custom.prompt")
 def _prompt_post(start: dt.date, end: dt.date,
     stories: list[dict]) -> List[Dict[str, str]]:
     txt = POST_PROMPT.format(
     start=start.strftime("%d %b"),
     end=end.strftime("%d %b"),
-    stories_json=json.dumps(stories, ensure_ascii=False, indent=2)
+    stories_json=prompt_builder.compact_payload(stories)
+    )
+    return [{"role": "user", "content": txt}]
+
+# ─────────── иерархическая свёртка ───────────
+# Для длинных периодов items не влезают в один PERIOD_PROMPT:
+#   map    — items режутся на календарные чанки (неделя / день / часть дня)
+#            по бюджету токенов, каждый чанк → сюжеты (параллельно);
+#   reduce — сюжеты всех чанков сводятся MERGE_PROMPT'ом (при необходимости
+#            в несколько уровней).
+# Промпт чанка зависит только от его содержимого, поэтому ответы по уже
+# посчитанным чанкам берутся из кэша eliza_client при расширении окна.
+
+# бюджет токенов на данные одного промпта; 0 — из контекста модели (eliza_client.prompt_budget)
+TOKEN_BUDGET = int(os.getenv("DIGEST_TOKEN_BUDGET", "0"))
+# уровней reduce, после которых сюжеты обрезаются по rank без LLM
+MAX_REDUCE_ROUNDS = int(os.getenv("DIGEST_MAX_REDUCE_ROUNDS", "4"))
+
+
+def _approx_tokens(obj: Any) -> int:
+    """оценка токенов в компактной сериализации (см. prompt_builder)."""
+    if isinstance(obj, list):
+        return prompt_builder.count_tokens(prompt_builder.compact_payload(obj))
+    return prompt_builder.count_tokens(prompt_builder.compact_json(obj))
+
+
+def _story_payload(records: list[dict]) -> str:
+    """
+    вход промптов, чей ответ повторяет формат входа (MERGE_PROMPT, CLUSTER_PROMPT):
+    полные ключи и участники как есть — иначе модель вернёт короткие ключи и
+    индексы в people, а _rank / _render_post их не поймут.
+    """
+    return prompt_builder.compact_payload(records, short_keys=False, dedupe_people=False)
+
+
+def _token_budget(model: str) -> int:
+    return TOKEN_BUDGET or eliza_client.prompt_budget(model) - prompt_builder.count_tokens(PERIOD_PROMPT)
+
+
+def _week_start(day: str) -> str:
+    d = dt.date.fromisoformat(str(day)[:10])
+    return str(d - dt.timedelta(days=d.weekday()))
+
+
+def _split_by_budget(items: list[dict], budget: int) -> list[list[dict]]:
+    """режет список на последовательные части, каждая ≤ budget токенов."""
+    parts: list[list[dict]] = [[]]
+    size = 0
+    for it in items:
+        t = _approx_tokens(it)
+        if parts[-1] and size + t > budget:
+            parts.append([])
+            size = 0
+        parts[-1].append(it)
+        size += t
+    return parts
+
+
+def _chunk_items(items: list[dict], granularity: str, budget: int) -> list[list[dict]]:
+    """
+    granularity: "week" | "day" | "auto" (неделя, а если не влезает — дни).
+    День, который сам не влезает в бюджет, режется на части.
+    """
+    by_day: Dict[str, list[dict]] = {}
+    for it in sorted(items, key=lambda x: str(x.get("date"))):
+        by_day.setdefault(str(it.get("date"))[:10], []).append(it)
+
+    if granularity == "day":
+        groups = list(by_day.values())
+    else:
+        weeks: Dict[str, list[list[dict]]] = {}
+        for day, day_items in by_day.items():
+            weeks.setdefault(_week_start(day), []).append(day_items)
+        groups = []
+        for days in weeks.values():
+            week_items = [it for d in days for it in d]
+            if granularity == "week" or _approx_tokens(week_items) <= budget:
+                groups.append(week_items)
+            else:
+                groups.extend(days)
+
+    chunks: list[list[dict]] = []
+    for g in groups:
+        chunks.extend(_split_by_budget(g, budget) if _approx_tokens(g) > budget else [g])
+    return chunks
+
+
+def _rank(story: dict) -> int:
+    """rank сюжета как int (LLM отдаёт и числа, и строки); без rank — в конец."""
+    try:
+        return int(story.get("rank"))
+    except (TypeError, ValueError):
+        return 99
+
+
+def _answer(rsp: Dict[str, Any]) -> str:
+    return rsp["response"]["Responses"][0]["Response"]
+
+
+@metrics.timed("custom.prompt")
+def _prompt_merge(start: dt.date,
+    end: dt.date,
+    channel: pd.Series,
+    stories: list[dict]) -> List[Dict[str, str]]:
+    txt = MERGE_PROMPT.format(
+    start_date=start,
+    end_date=end,
+    channel_name=channel["chat"],
+    channel_description=channel["description"],
+    stories_json=_story_payload(stories)
+    )
+    return [{"role": "user", "content": txt}]
+
+
+@metrics.timed("custom.hierarchical")
+def _stories_hierarchical(
+    start: dt.date,
+    end: dt.date,
+    channel: pd.Series,
+    items: list[dict],
+    *,
+    model: str,
+    verify: bool | str,
+    granularity: str = "auto",
+    budget: int | None = None,
+    workers: int = 4,
+) -> list[dict]:
+    """map: чанк → сюжеты (параллельно); reduce: свёртка сюжетов MERGE_PROMPT'ом."""
+    budget = budget or _token_budget(model)
+    chunks = _chunk_items(items, granularity, budget)
+    print(f"🧩 Иерархическая свёртка: {len(items)} элементов → {len(chunks)} чанков")
+
+    def _map(chunk: list[dict]) -> list[dict]:
+        dates = [str(it.get("date"))[:10] for it in chunk]
+        rsp = eliza_client.eliza_chat(
+            _prompt_period(min(dates), max(dates), channel, chunk),
+            model=model,
+            verify=verify,
+        )
+        return _parse_stories(_answer(rsp))
+
+    with ThreadPoolExecutor(max_workers=max(1, workers)) as pool:
+        stories = [s for part in pool.map(_map, chunks) for s in part]
+
+    if len(chunks) == 1:
+        return stories
+    return _reduce_stories(start, end, channel, stories, model=model, verify=verify, budget=budget, workers=workers)
+
+
+def _reduce_stories(
+    start: dt.date,
+    end: dt.date,
+    channel: pd.Series,
+    stories: list[dict],
+    *,
+    model: str,
+    verify: bool | str,
+    budget: int,
+    workers: int = 4,
+) -> list[dict]:
+    """
+    свёртка сюжетов частей MERGE_PROMPT'ом (в несколько уровней, если не влезают в budget).
+    Если уровень не уменьшает число сюжетов или уровней больше MAX_REDUCE_ROUNDS —
+    отдаются 10 самых значимых по rank.
+    """
+    def _merge(batch: list[dict]) -> list[dict]:
+        rsp = eliza_client.eliza_chat(
+            _prompt_merge(start, end, channel, batch),
+            model=model,
+            verify=verify,
+        )
+        return _parse_stories(_answer(rsp))
+
+    # reduce: пока все сюжеты не влезают в один промпт — сводим пачками
+    for _ in range(MAX_REDUCE_ROUNDS):
+        batches = _split_by_budget(stories, budget)
+        if len(batches) == 1:
+            return _merge(stories)
+        if all(len(b) == 1 for b in batches):
+            break
+        with ThreadPoolExecutor(max_workers=max(1, workers)) as pool:
+            merged = [s for part in pool.map(_merge, batches) for s in part]
+        shrunk = len(merged) < len(stories)
+        stories = merged
+        if not shrunk:
+            break
+    # свёртка не сходится — отдаём самые значимые как есть
+    metrics.inc("custom.reduce_truncated")
+    print(f"⚠️ reduce не сходится: {len(stories)} сюжетов обрезаны по rank")
+    return sorted(stories, key=_rank)[:10]
+
+
+# ─────────── предкластеризация ───────────
+# mode="clustered": самый дорогой шаг — группировка тем в сюжеты — делается
+# локально (topic_clusters: TF-IDF + average linkage). LLM получает каждый
+# кластер отдельным коротким CLUSTER_PROMPT'ом (параллельно) и только
+# оформляет сюжет; одиночные темы идут обычным PERIOD_PROMPT'ом пачками.
+# Если сюжетов ≤ 10, ранжирование локальное (по числу тем и дней),
+# иначе — MERGE_PROMPT по сюжетам, а не по сырым темам.
+
+@metrics.timed("custom.prompt")
+def _prompt_cluster(start: dt.date,
+    end: dt.date,
+    channel: pd.Series,
+    items: list[dict]) -> List[Dict[str, str]]:
+    txt = CLUSTER_PROMPT.format(
+    start_date=start,
+    end_date=end,
+    channel_name=channel["chat"],
+    items_json=_story_payload(items)
     )
     return [{"role": "user", "content": txt}]
 
+
+def _rank_locally(scored: list[tuple[int, dict]]) -> list[dict]:
+    """сюжеты по убыванию (тем в кластере, дней); rank перенумеровывается."""
+    ordered = sorted(scored, key=lambda x: (-x[0], -len(x[1].get("days_covered") or [])))
+    return [{**s, "rank": i} for i, (_, s) in enumerate(ordered[:10], 1)]
+
+
+@metrics.timed("custom.clustered")
+def _stories_clustered(
+    start: dt.date,
+    end: dt.date,
+    channel: pd.Series,
+    items: list[dict],
+    *,
+    model: str,
+    verify: bool | str,
+    budget: int,
+    workers: int = 4,
+) -> list[dict]:
+    items = sorted(items, key=lambda x: str(x.get("date")))
+    with metrics.span("custom.cluster"):
+        groups = [[items[i] for i in g] for g in topic_clusters.cluster(items)]
+    clusters = [g for g in groups if len(g) > 1]
+    singles = [g[0] for g in groups if len(g) == 1]
+    print(f"🧮 Предкластеризация: {len(items)} элементов → {len(clusters)} кластеров + {len(singles)} одиночных")
+
+    # (вес для ранжирования, промпт): кластер — целиком, если влезает в бюджет
+    jobs: list[tuple[int, List[Dict[str, str]]]] = []
+    for g in clusters:
+        for part in (_split_by_budget(g, budget) if _approx_tokens(g) > budget else [g]):
+            jobs.append((len(g), _prompt_cluster(start, end, channel, part)))
+    if singles:
+        for part in _split_by_budget(singles, budget):
+            dates = [str(it.get("date"))[:10] for it in part]
+            jobs.append((1, _prompt_period(min(dates), max(dates), channel, part)))
+    metrics.inc("custom.chunks", len(jobs), granularity="cluster")
+
+    def _map(job: tuple[int, List[Dict[str, str]]]) -> list[tuple[int, dict]]:
+        weight, prompt = job
+        rsp = eliza_client.eliza_chat(prompt, model=model, verify=verify)
+        return [(weight, s) for s in _parse_stories(_answer(rsp))]
+
+    with ThreadPoolExecutor(max_workers=max(1, workers)) as pool:
+        scored = [x for part in pool.map(_map, jobs) for x in part]
+
+    if len(scored) <= 10:
+        return _rank_locally(scored)
+    return _reduce_stories(
+        start, end, channel, [s for _, s in scored],
+        model=model, verify=verify, budget=budget, workers=workers,
+    )
+
+# ─────────── локальный рендер поста ───────────
+# Детерминированная замена второго LLM-вызова (POST_PROMPT):
+# пост собирается из rank / days_covered / title / summary сюжетов.
+
+def _parse_day(value: Any) -> dt.date | None:
+    try:
+        return dt.date.fromisoformat(str(value)[:10])
+    except ValueError:
+        return None
+
+
+def _day_intervals(days_covered: list) -> str:
+    """
+    ["2025-01-21", "2025-01-22", "2025-01-23", "2025-01-25"] → "21-23, 25".
+    Дни, которые не разбираются как YYYY-MM-DD («вчера», "2025-13-01"), пропускаются.
+    """
+    if not isinstance(days_covered, (list, tuple)):
+        days_covered = [days_covered]
+    days = sorted({d for d in map(_parse_day, days_covered) if d})
+    if not days:
+        return ""
+    fmt = "%d" if len({(d.year, d.month) for d in days}) == 1 else "%d.%m"
+    runs = [[days[0], days[0]]]
+    for d in days[1:]:
+        if d - runs[-1][1] == dt.timedelta(days=1):
+            runs[-1][1] = d
+        else:
+            runs.append([d, d])
+    return ", ".join(
+        a.strftime(fmt) if a == b else f"{a.strftime(fmt)}-{b.strftime(fmt)}"
+        for a, b in runs
+    )
+
+@metrics.timed("custom.render")
+def _render_post(start: dt.date, end: dt.date,
+    stories: list[dict]) -> str:
+    """пост-дайджест в формате POST_PROMPT без обращения к LLM."""
+    lines = [f"Дайджест:  {start.strftime('%d %b')} – {end.strftime('%d %b')}"]
+    for s in sorted(stories, key=_rank)[:10]:
+        days = _day_intervals(s.get("days_covered"))
+        prefix = f"[{days}] " if days else ""
+        lines.append(f"• {prefix}{str(s.get('title') or '').strip()}: {str(s.get('summary') or '').strip()}")
+    return "\n".join(lines)
+
+# ─────────── streaming ───────────
+
+def _stream_stories(prompt: List[Dict[str, str]],
+    *,
+    model: str,
+    verify: bool | str) -> list[dict]:
+    """сюжеты по мере генерации (печатает заголовки); на невалидном JSON — ValueError."""
+    chunks = eliza_client.eliza_chat(
+        prompt, model=model, verify=verify, stream=True, extra={"stream": True}
+    )
+    stories: list[dict] = []
+    try:
+        for _, story in json_stream.iter_items(eliza_client.iter_text(chunks)):
+            if not isinstance(story, dict):
+                raise ValueError("LLM output must be JSON array of objects")
+            stories.append(story)
+            print(f"  🧵 {story.get('rank', len(stories))}. {story.get('title', '')}", flush=True)
+            if len(stories) >= 10:
+                break
+    finally:
+        chunks.close()         # на break/ошибке соединение иначе висит до GC
+    if not stories:
+        raise ValueError("LLM output must be non-empty JSON array")
+    return stories
+
+def _stream_post(prompt: List[Dict[str, str]],
+    *,
+    model: str,
+    verify: bool | str) -> str:
+    """печатает пост по мере генерации и возвращает его целиком."""
+    chunks = eliza_client.eliza_chat(
+        prompt, model=model, verify=verify, stream=True, extra={"stream": True}
+    )
+    parts = []
+    try:
+        for delta in eliza_client.iter_text(chunks):
+            print(delta, end="", flush=True)
+            parts.append(delta)
+    finally:
+        chunks.close()
+    print()
+    return "".join(parts).strip()
+
 # ─────────── main entry ───────────
 
+@metrics.timed("custom.digest")
 def run_custom_date_digester(
     start_date: dt.date,
     end_date: dt.date,
@@ -185,12 +591,29 @@ def run_custom_date_digester(
     *,
     model: str = "yandex",
     verify: bool | str = True,
-    ) -> None:
+    data: IntervalData | None = None,
+    mode: str = "auto",
+    chunk: str = "auto",
+    token_budget: int | None = None,
+    workers: int = 4,
+    stream: bool = False,
+    render: str = "local",
+    save: bool = True,
+    ) -> Dict[str, Any] | None:
     """
     Делает дайджест за произвольный период (текст-пост) и кладёт одну строку в custom_date_digest.
+    data — заранее загруженный IntervalData (без отдельных YQL-запросов).
+    mode — "single" (один PERIOD_PROMPT), "hierarchical" (map-reduce по чанкам chunk),
+           "clustered" (map-reduce по локальным кластерам похожих тем)
+           или "auto" (hierarchical, если items не влезают в token_budget).
+    token_budget — по умолчанию DIGEST_TOKEN_BUDGET или контекст модели.
+    stream — печатать сюжеты и пост по мере генерации (для mode="single").
+    render — "local": пост собирается из сюжетов без LLM; "llm": вторым вызовом POST_PROMPT.
+    save — писать строку в YT (через буфер yt_writer); возвращает строку custom_date_digest (None — нет контента).
     """
+    token_budget = token_budget or _token_budget(model)
     channel = _channel_row(channel_id)
-    items   = _load_items(channel_id, start_date, end_date)
+    items   = _load_items(channel_id, start_date, end_date, data)
     
     
     if not items:
@@ -198,27 +621,58 @@ def run_custom_date_digester(
         return
     
     # step-1: LLM группирует сюжеты
-    rsp1 = eliza_client.eliza_chat(
-        _prompt_period(start_date, end_date, channel, items),
-        model=model,
-        verify=verify
-    )
-    stories = _parse_stories(rsp1["response"]["Responses"][0]["Response"])
+    if mode == "auto":
+        mode = "hierarchical" if _approx_tokens({"items": items}) > token_budget else "single"
+    if mode == "hierarchical":
+        stories = _stories_hierarchical(
+            start_date, end_date, channel, items,
+            model=model, verify=verify,
+            granularity=chunk, budget=token_budget, workers=workers,
+        )
+    elif mode == "clustered":
+        stories = _stories_clustered(
+            start_date, end_date, channel, items,
+            model=model, verify=verify, budget=token_budget, workers=workers,
+        )
+    elif stream:
+        print("🧵 Сюжеты:")
+        stories = _stream_stories(
+            _prompt_period(start_date, end_date, channel, items),
+            model=model,
+            verify=verify
+        )
+    else:
+        rsp1 = eliza_client.eliza_chat(
+            _prompt_period(start_date, end_date, channel, items),
+            model=model,
+            verify=verify
+        )
+        stories = _parse_stories(_answer(rsp1))
 
-    # step-2: LLM формирует финальный пост
-    rsp2 = eliza_client.eliza_chat(
-        _prompt_post(start_date, end_date, stories),
-        model=model,
-        verify=verify
-    )
-    digest_text = rsp2["response"]["Responses"][0]["Response"].strip()
-    
     # Красивый вывод результата
     print(f"\n{'='*60}")
     print(f"📊 ДАЙДЖЕСТ ЗА ПЕРИОД {start_date} – {end_date}")
     print(f"📢 Канал: {channel['chat']}")
-    print(f"{'='*60}")
-    print(f"\n{digest_text}")
+    print(f"{'='*60}\n")
+
+    # step-2: финальный пост — локально или LLM
+    if render == "local":
+        digest_text = _render_post(start_date, end_date, stories)
+        print(digest_text)
+    elif stream:
+        digest_text = _stream_post(
+            _prompt_post(start_date, end_date, stories),
+            model=model,
+            verify=verify
+        )
+    else:
+        rsp2 = eliza_client.eliza_chat(
+            _prompt_post(start_date, end_date, stories),
+            model=model,
+            verify=verify
+        )
+        digest_text = _answer(rsp2).strip()
+        print(digest_text)
     print(f"\n{'='*60}")
     
     row = {
@@ -228,5 +682,7 @@ def run_custom_date_digester(
         "end_date": str(end_date),
         "digest_text": digest_text
     }
-    tg_etl.upsert_df_to_yt(pd.DataFrame([row]), TBL_OUT, SCHEMA_OUT)
-    print(f"✅ custom date digest {start_date}–{end_date} saved → {TBL_OUT}")
+    if save:
+        yt_writer.write(TBL_OUT, SCHEMA_OUT, row)
+        print(f"✅ custom date digest {start_date}–{end_date} → буфер записи {TBL_OUT}")
+    return row
@@ -7,7 +7,7 @@
 • пишет TOP-5 в //…/daily_digest  (upsert)
 
 DEPENDENCIES
-  tg_etl.query_yql, tg_etl.upsert_df_to_yt
+  storage.get_storage() (YT или локальный SQLite), yt_writer
   eliza_client.eliza_chat
 """
 
@@ -18,8 +18,14 @@ from typing import Any, Dict, List
 import pandas as pd
 from dateutil import tz
 
-from . import tg_etl
+from . import storage
+from . import yt_writer
+from . import channel_cache
 from . import eliza_client
+from . import json_stream
+from . import metrics
+from . import prompt_builder
+from .interval_data import IntervalData
 
 
 # ─────────── YT таблицы ───────────
@@ -92,23 +98,17 @@ PROMPT_TMPL = """
 # ─────────── helpers ───────────
 
 def _get_channel(channel_id: int) -> pd.Series:
-    return tg_etl.query_yql(
-    f"""SELECT chat, description
-    FROM hahn.`{TBL_CHATS}`
-    WHERE chat_id = {channel_id}
-    LIMIT 1;"""
-    ).iloc[0]
-
-def _load_topics(channel_id: int, date: dt.date) -> list[dict]:
+    """метаданные канала из общего кэша tg_chats (см. channel_cache)."""
+    return channel_cache.get_channel(channel_id)
+
+@metrics.timed("daily.read_topics")
+def _load_topics(channel_id: int, date: dt.date, data: IntervalData | None = None) -> list[dict]:
     """возвращает [{status, conclusions, resume}, …]"""
-    df = tg_etl.query_yql(
-        f"""
-        SELECT status, conclusions, resume
-        FROM hahn.`{TBL_TOPICS}`
-        WHERE channel_id = {channel_id}
-          AND date = "{date}"
-        ORDER BY topic_id;
-        """
+    if data is not None:
+        return data.topics(channel_id, date, ["status", "conclusions", "resume"])
+    df = storage.get_storage().by_channel_date(
+        TBL_TOPICS, ["status", "conclusions", "resume"], date,
+        channel_ids=[channel_id], order_by="topic_id",
     )
     return df.to_dict("records") if not df.empty else []
 
@@ -128,11 +128,18 @@ def _load_topics(channel_id: int, date: dt.date) -> list[dict]:
 #     df["detailed_summary"] = df["detailed_summary"].apply(json.loads)
 #     return df.to_dict("records")
 
+@metrics.timed("daily.prompt")
 def _prompt(date: dt.date,
             channel: pd.Series,
-            topics: list[dict]) -> List[Dict[str, str]]:
+            topics: list[dict],
+            model: str = "yandex") -> List[Dict[str, str]]:
     
-    payload = json.dumps(topics, ensure_ascii=False, indent=2)
+    # темы — компактным JSON и не больше, чем влезает в контекст модели
+    overhead = prompt_builder.count_tokens(
+        f"{PROMPT_TMPL} {channel['chat']} {channel['description']}"
+    )
+    topics = prompt_builder.fit_records(topics, eliza_client.prompt_budget(model) - overhead)
+    payload = prompt_builder.compact_payload(topics)
     
     txt = PROMPT_TMPL.format(
         date=date,
@@ -143,6 +150,7 @@ def _prompt(date: dt.date,
     
     return [{"role": "user", "content": txt}]
 
+@metrics.timed("daily.parse")
 def _parse_answer(raw: str) -> Dict[str, Any]:
     """Парсит ответ LLM и возвращает структурированный дайджест."""
     try:
@@ -170,18 +178,65 @@ def _format_digest_text(digest_data: Dict[str, Any]) -> str:
     
     return "\n".join(lines)
 
+_SECTIONS = {"discussions": "🗣️ ОБСУЖДЕНИЯ:", "commitments": "📋 КОММИТЫ:"}
+
+def _stream_digest(prompt: List[Dict[str, str]],
+                   date: dt.date,
+                   channel: pd.Series,
+                   *,
+                   model: str,
+                   verify: bool | str) -> Dict[str, Any]:
+    """
+    Стриминговый вызов LLM: bullet'ы печатаются по мере генерации.
+    Возвращает разобранный дайджест; на невалидном JSON генерация обрывается (ValueError).
+    """
+    chunks = eliza_client.eliza_chat(
+        prompt, model=model, verify=verify, stream=True, extra={"stream": True}
+    )
+    digest_data: Dict[str, Any] = {key: [] for key in _SECTIONS}
+
+    print(f"\n{'='*60}")
+    print(f"📊 ЕЖЕДНЕВНЫЙ ДАЙДЖЕСТ {date}")
+    print(f"📢 Канал: {channel['chat']}")
+    print(f"{'='*60}\n")
+    current = None
+    try:
+        for key, item in json_stream.iter_items(eliza_client.iter_text(chunks)):
+            if key not in _SECTIONS:
+                continue
+            if key != current:
+                if current:
+                    print()
+                print(_SECTIONS[key])
+                current = key
+            print(f"  {item}", flush=True)
+            digest_data[key].append(item)
+    finally:
+        chunks.close()         # на ValueError соединение иначе висит до GC
+    print(f"\n{'='*60}")
+    return digest_data
+
 # ─────────── main entry ───────────
 
+@metrics.timed("daily.digest")
 def run_daily_digester(
     date: dt.date,
     channel_id: int,
     *,
     model: str = "yandex",
     verify: bool | str = True,
-    ) -> None:
-    """Собирает дневной дайджест и кладёт в daily_digest."""
+    data: IntervalData | None = None,
+    stream: bool = False,
+    save: bool = True,
+    ) -> Dict[str, Any] | None:
+    """
+    Собирает дневной дайджест и кладёт в daily_digest.
+    data — заранее загруженный IntervalData (без отдельных YQL-запросов).
+    stream — печатать пункты дайджеста по мере генерации.
+    save — писать строку в YT (через буфер yt_writer); возвращает строку daily_digest (None — нечего сохранять).
+    """
     channel = _get_channel(channel_id)
-    topics  = _load_topics(channel_id, date)
+    topics  = _load_topics(channel_id, date, data)
 
     # Проверяем наличие данных для анализа
     if not topics:
@@ -194,11 +249,14 @@ def run_daily_digester(
         print("⏭  Нет содержательных тем для дайджеста; пропуск")
         return
 
-    prompt = _prompt(date, channel, meaningful_topics)
-    rsp = eliza_client.eliza_chat(prompt, model=model, verify=verify)
-    raw_json = rsp["response"]["Responses"][0]["Response"]
-    
-    digest_data = _parse_answer(raw_json)
+    prompt = _prompt(date, channel, meaningful_topics, model)
+    if stream:
+        digest_data = _stream_digest(prompt, date, channel, model=model, verify=verify)
+    else:
+        rsp = eliza_client.eliza_chat(prompt, model=model, verify=verify)
+        raw_json = rsp["response"]["Responses"][0]["Response"]
+        
+        digest_data = _parse_answer(raw_json)
     
     # Проверяем, что получили содержательный дайджест
     if not digest_data or (not digest_data.get("discussions") and not digest_data.get("commitments")):
@@ -209,12 +267,13 @@ def run_daily_digester(
     digest_text = _format_digest_text(digest_data)
     
     # Красивый вывод результата (показываем как хранится в табличке)
-    print(f"\n{'='*60}")
-    print(f"📊 ЕЖЕДНЕВНЫЙ ДАЙДЖЕСТ {date}")
-    print(f"📢 Канал: {channel['chat']}")
-    print(f"{'='*60}")
-    print(f"\n{digest_text}")
-    print(f"\n{'='*60}")
+    if not stream:
+        print(f"\n{'='*60}")
+        print(f"📊 ЕЖЕДНЕВНЫЙ ДАЙДЖЕСТ {date}")
+        print(f"📢 Канал: {channel['chat']}")
+        print(f"{'='*60}")
+        print(f"\n{digest_text}")
+        print(f"\n{'='*60}")
     
     row = {
         "digest_id": f"{channel_id}_{date}",
@@ -222,5 +281,7 @@ def run_daily_digester(
         "date": str(date),
         "digest_text": digest_text
     }
-    tg_etl.upsert_df_to_yt(pd.DataFrame([row]), TBL_OUT, SCHEMA_OUT)
-    print(f"✅ daily digest ({date}) upsert → {TBL_OUT}")
\ No newline at end of file
+    if save:
+        yt_writer.write(TBL_OUT, SCHEMA_OUT, row)
+        print(f"✅ daily digest ({date}) → буфер записи {TBL_OUT}")
+    return row
\ No newline at end of file
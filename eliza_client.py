@@ -1,26 +1,351 @@
 from __future__ import annotations
-import json, logging, os, requests, time, pathlib
-from typing import Dict, Any, List, Iterable, Union
+import asyncio, functools, hashlib, json, logging, os, requests, threading, time, pathlib
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlsplit
+from typing import Dict, Any, List, Iterable, Iterator, AsyncIterator, Sequence, Union
+from requests.adapters import HTTPAdapter
 from dotenv import load_dotenv, find_dotenv
 
+from . import metrics
+from . import prompt_builder
+from . import rate_limiter
+
 # ─────────────────────────── 2 поддерживаемые модели ──────────────────────────
 _MODELS: Dict[str, Dict[str, Any]] = {
     # «большой» aligned-quantized
     "yandex": {
         "endpoint": "https://api.eliza.yandex.net/internal/zeliboba/32b_aligned_quantized_202506/generative",
         "payload_model": None,        # поле model НЕ передаём
+        "context_tokens": 32768,
+        "completion_reserve": 4096,   # сколько контекста оставляем под ответ
     },
     # communal deepseek-v3
     "deepseek": {
         "endpoint": "https://api.eliza.yandex.net/internal/zeliboba/communal-deepseek-v3-0324-in-yt/v1/chat/completions",
         "payload_model": "deepseek_v3",
+        "context_tokens": 131072,
+        "completion_reserve": 8192,
     },
 }
 
 
+# базовый URL вместо https://api.eliza.yandex.net (локальный мок, прокси);
+# пути моделей сохраняются, см. configure_endpoint
+_base_url: str | None = os.getenv("ELIZA_BASE_URL") or None
+
+
+def configure_endpoint(base_url: str | None) -> None:
+    """перенаправляет запросы всех моделей на base_url (None — боевые URL из _MODELS)."""
+    global _base_url
+    _base_url = base_url or None
+
+
+def _endpoint(model: str) -> str:
+    url = _MODELS[model]["endpoint"]
+    if _base_url:
+        url = _base_url.rstrip("/") + urlsplit(url).path
+    return url
+
+
 log = logging.getLogger(__name__)
 logging.basicConfig(level=logging.INFO, format="%(levelname)s | %(message)s")
 
+# ─────────────────────────── HTTP-сессия (keep-alive) ─────────────────────────
+_POOL_SIZE = int(os.getenv("ELIZA_POOL_SIZE", "16"))
+
+_OVERLOAD_STATUSES = (429, 503)
+
+_session_lock = threading.Lock()
+_shared_session: requests.Session | None = None
+
+
+def _new_session(pool_size: int = _POOL_SIZE) -> requests.Session:
+    """requests.Session с пулом keep-alive соединений к api.eliza."""
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=len(_MODELS), pool_maxsize=pool_size)
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+    return session
+
+
+def _session() -> requests.Session:
+    """общая на процесс сессия: TCP/TLS-соединения переиспользуются между вызовами."""
+    global _shared_session
+    if _shared_session is None:
+        with _session_lock:
+            if _shared_session is None:
+                _shared_session = _new_session()
+    return _shared_session
+
+
+# ─────────────────────── кэш ответов на диске ─────────────────────────────────
+_CACHE_DIR = os.getenv(
+    "ELIZA_CACHE_DIR",
+    str(pathlib.Path.home() / ".cache" / "tg_digester" / "eliza"),
+)
+_CACHE_MAX_MB = float(os.getenv("ELIZA_CACHE_MAX_MB", "512"))
+_CACHE_MAX_AGE_DAYS = float(os.getenv("ELIZA_CACHE_MAX_AGE_DAYS", "30"))
+
+
+def cache_key(
+    model: str,
+    messages: List[Dict[str, str]],
+    extra: Dict[str, Any] | None = None,
+    url: str | None = None,
+) -> str:
+    """
+    sha256 от канонического JSON (model, messages, extra, url).
+    url — фактический адрес запроса: ответы стаба (ELIZA_BASE_URL, endpoint=)
+    не попадают в кэш боевого эндпоинта.
+    """
+    blob = json.dumps(
+        {"model": model, "messages": messages, "extra": extra or {}, "url": url or _endpoint(model)},
+        ensure_ascii=False,
+        sort_keys=True,
+        separators=(",", ":"),
+    )
+    return hashlib.sha256(blob.encode("utf-8")).hexdigest()
+
+
+class ResponseCache:
+    """
+    Content-addressed кэш ответов LLM: один JSON-файл на ключ
+    (<dir>/<key[:2]>/<key>.json). Вытеснение — по возрасту (mtime)
+    и по суммарному размеру (самые давно использованные уходят первыми).
+    """
+
+    _EVICT_EVERY = 50      # проверять размер каждые N записей
+
+    def __init__(
+        self,
+        path: str | os.PathLike = _CACHE_DIR,
+        *,
+        max_bytes: int = int(_CACHE_MAX_MB * 1024 * 1024),
+        max_age: float = _CACHE_MAX_AGE_DAYS * 86400,
+    ) -> None:
+        self.path = pathlib.Path(path)
+        self.max_bytes = max_bytes
+        self.max_age = max_age
+        self.stats: Dict[str, int] = {"hits": 0, "misses": 0, "writes": 0, "evicted": 0}
+        self._lock = threading.Lock()
+        self._writes_since_evict = 0
+
+    def _file(self, key: str) -> pathlib.Path:
+        return self.path / key[:2] / f"{key}.json"
+
+    def _count(self, name: str, n: int = 1) -> None:
+        with self._lock:
+            self.stats[name] += n
+
+    def get(self, key: str) -> Dict[str, Any] | None:
+        f = self._file(key)
+        try:
+            if time.time() - f.stat().st_mtime > self.max_age:
+                f.unlink(missing_ok=True)
+                self._count("misses")
+                return None
+            value = json.loads(f.read_text(encoding="utf-8"))
+        except (FileNotFoundError, json.JSONDecodeError):
+            self._count("misses")
+            return None
+        os.utime(f)            # отметка использования для LRU-вытеснения
+        self._count("hits")
+        return value
+
+    def put(self, key: str, value: Dict[str, Any]) -> None:
+        f = self._file(key)
+        f.parent.mkdir(parents=True, exist_ok=True)
+        tmp = f.with_suffix(f".{os.getpid()}.{threading.get_ident()}.tmp")
+        tmp.write_text(json.dumps(value, ensure_ascii=False), encoding="utf-8")
+        os.replace(tmp, f)
+        self._count("writes")
+        with self._lock:
+            self._writes_since_evict += 1
+            due = self._writes_since_evict >= self._EVICT_EVERY
+            if due:
+                self._writes_since_evict = 0
+        if due:
+            self.evict()
+
+    def evict(self) -> int:
+        """удаляет просроченные записи и самые старые сверх max_bytes."""
+        now = time.time()
+        entries = []
+        removed = 0
+        for f in self.path.glob("*/*.json"):
+            try:
+                st = f.stat()
+            except FileNotFoundError:
+                continue
+            if now - st.st_mtime > self.max_age:
+                f.unlink(missing_ok=True)
+                removed += 1
+            else:
+                entries.append((st.st_mtime, st.st_size, f))
+
+        total = sum(size for _, size, _ in entries)
+        for _, size, f in sorted(entries, key=lambda e: e[0]):
+            if total <= self.max_bytes:
+                break
+            f.unlink(missing_ok=True)
+            total -= size
+            removed += 1
+
+        self._count("evicted", removed)
+        return removed
+
+
+_cache: ResponseCache | None = ResponseCache()
+_cache_refresh = False
+
+
+def configure_cache(
+    *,
+    enabled: bool = True,
+    refresh: bool = False,
+    path: str | os.PathLike | None = None,
+) -> None:
+    """
+    enabled=False  — не читать и не писать кэш (--no-cache)
+    refresh=True   — не читать кэш, но перезаписать свежими ответами (--refresh)
+    """
+    global _cache, _cache_refresh
+    _cache = ResponseCache(path or _CACHE_DIR) if enabled else None
+    _cache_refresh = refresh
+
+
+def cache_stats() -> Dict[str, int]:
+    """счётчики кэша: hits / misses / writes / evicted."""
+    return dict(_cache.stats) if _cache else {}
+
+
+# ─────────────────────────────── токены ───────────────────────────────────────
+_token_lock = threading.Lock()
+_token_stats: Dict[str, Dict[str, int]] = {}
+
+
+def prompt_budget(model: str) -> int:
+    """сколько токенов можно отдать под промпт модели."""
+    cfg = _MODELS[model]
+    return cfg["context_tokens"] - cfg["completion_reserve"]
+
+
+def _answer_text(data: Dict[str, Any]) -> str:
+    """текст ответа: generative-формат yandex или chat-completions."""
+    try:
+        return data["response"]["Responses"][0]["Response"]
+    except (KeyError, IndexError, TypeError):
+        pass
+    try:
+        return data["choices"][0]["message"]["content"]
+    except (KeyError, IndexError, TypeError):
+        return ""
+
+
+def _report_tokens(model: str, messages: List[Dict[str, str]], data: Dict[str, Any]) -> None:
+    """логирует prompt/completion токены вызова (usage из ответа или локальная оценка)."""
+    usage = data.get("usage") or (data.get("response") or {}).get("usage") or {}
+    prompt_tokens = usage.get("prompt_tokens") or prompt_builder.count_message_tokens(messages)
+    completion_tokens = usage.get("completion_tokens") or prompt_builder.count_tokens(_answer_text(data))
+    log.info("tokens %s: prompt=%d completion=%d", model, prompt_tokens, completion_tokens)
+    metrics.inc("llm.prompt_tokens", prompt_tokens, model=model)
+    metrics.inc("llm.completion_tokens", completion_tokens, model=model)
+    with _token_lock:
+        st = _token_stats.setdefault(model, {"calls": 0, "prompt_tokens": 0, "completion_tokens": 0})
+        st["calls"] += 1
+        st["prompt_tokens"] += prompt_tokens
+        st["completion_tokens"] += completion_tokens
+
+
+def token_stats() -> Dict[str, Dict[str, int]]:
+    """суммарные токены по моделям за процесс (только реальные вызовы, без кэша)."""
+    with _token_lock:
+        return {m: dict(st) for m, st in _token_stats.items()}
+
+
+# ─────────────────────────────── helpers ──────────────────────────────────────
+def _resolve_verify(verify: Union[bool, str]) -> Union[bool, str]:
+    """Обработка пути к сертификату"""
+    if isinstance(verify, str) and not os.path.isabs(verify):
+        # Если путь уже содержит структуру проекта, используем его как есть
+        if verify.startswith('junk/ia-nartov/hackathon_project/'):
+            # Извлекаем только имя файла и ищем его в текущей директории
+            cert_filename = verify.split('/')[-1]
+            verify = os.path.abspath(cert_filename)
+        else:
+            # Если путь относительный, делаем его относительно рабочей директории
+            verify = os.path.abspath(verify)
+        log.info(f"Resolved certificate path: {verify}")
+    return verify
+
+
+def _build_payload(
+    messages: List[Dict[str, str]],
+    model: str,
+    extra: Dict[str, Any] | None,
+) -> Dict[str, Any]:
+    if model not in _MODELS:
+        raise ValueError(f"model must be 'yandex' or 'deepseek', got {model}")
+
+    cfg = _MODELS[model]
+    payload: Dict[str, Any] = {"messages": messages}
+    if cfg["payload_model"]:
+        payload["model"] = cfg["payload_model"]
+    if extra:
+        payload.update(extra)
+    return payload
+
+
+def _chunks(resp: requests.Response) -> Iterator[Dict[str, Any]]:
+    """разбирает SSE-поток ответа: строки вида «data: {...}»."""
+    for line in resp.iter_lines(decode_unicode=True):
+        if line and line.startswith("data:"):
+            data = line.removeprefix("data:").strip()
+            if data == "[DONE]":
+                return
+            yield json.loads(data)
+
+
+class ChunkStream:
+    """
+    итератор чанков стримингового ответа eliza_chat(stream=True).
+    close() освобождает соединение пула, даже если поток не дочитан
+    (ранний break, ошибка разбора) или не начат.
+    """
+
+    def __init__(self, resp: requests.Response) -> None:
+        self._resp = resp
+        self._it = _chunks(resp)
+
+    def __iter__(self) -> "ChunkStream":
+        return self
+
+    def __next__(self) -> Dict[str, Any]:
+        return next(self._it)
+
+    def close(self) -> None:
+        self._it.close()
+        self._resp.close()
+
+
+def iter_text(chunks: Iterable[Dict[str, Any]]) -> Iterator[str]:
+    """
+    текстовые дельты из стрима eliza_chat(stream=True):
+    chat-completions отдаёт delta.content, generative-формат — накопленный текст.
+    """
+    prev = ""
+    for chunk in chunks:
+        choices = chunk.get("choices")
+        if choices:
+            delta = (choices[0].get("delta") or {}).get("content") or ""
+        else:
+            text = _answer_text(chunk)
+            delta = text[len(prev):] if text.startswith(prev) else text
+            prev = text
+        if delta:
+            yield delta
+
+
 # ──────────────────────────────── API ─────────────────────────────────────────
 def eliza_chat(
     messages: List[Dict[str, str]],
@@ -32,87 +357,245 @@ def eliza_chat(
     token: str | None = None,
     verify: Union[bool, str] = True,
     max_retries: int = 3,            # Максимальное количество попыток
-    retry_delay: float = 5.0,        # Задержка между попытками
+    retry_delay: float = 5.0,        # Базовая задержка backoff между попытками
+    endpoint: str | None = None,     # переопределение URL (локальный стаб и т.п.)
+    session: requests.Session | None = None,
+    use_cache: bool = True,
 ) -> Union[Dict[str, Any], Iterable[Dict[str, Any]]]:
     """
     Отправляет chat-prompt в Eliza и возвращает:
         • dict  (если stream=False)
-        • iterator[dict] (если stream=True)
+        • ChunkStream — iterator[dict] (если stream=True; после чтения — close())
 
     model : "yandex"  → 32b_aligned_quantized_202506 (без поля "model")
             "deepseek" → communal-deepseek-v3-0324-in-yt  (+ "model": "deepseek_v3")
+
+    Запросы идут через общую keep-alive сессию (или переданную session).
+    Нестриминговые ответы кэшируются на диске по хэшу (model, messages, extra, url),
+    см. configure_cache.
     """
 
-    if model not in _MODELS:
-        raise ValueError(f"model must be 'yandex' or 'deepseek', got {model}")
+    payload = _build_payload(messages, model, extra)
+    url = endpoint or _endpoint(model)
+
+    cache = _cache if (use_cache and not stream) else None
+    key = cache_key(model, messages, extra, url) if cache else None
+    if cache and not _cache_refresh:
+        cached = cache.get(key)
+        if cached is not None:
+            log.info("cache hit → %s", model)
+            metrics.inc("llm.cache_hits", model=model)
+            return cached
+        metrics.inc("llm.cache_misses", model=model)
 
     token = token or os.getenv("SOY_TOKEN")
     if not token:
         raise RuntimeError("SOY_TOKEN not set")
 
-    cfg = _MODELS[model]
-    payload: Dict[str, Any] = {"messages": messages}
-    if cfg["payload_model"]:
-        payload["model"] = cfg["payload_model"]
-    if extra:
-        payload.update(extra)
+    http = session or _session()
 
     log.info("sent prompt → %s", model)
     
-    # Обработка пути к сертификату
-    if isinstance(verify, str) and not os.path.isabs(verify):
-        # Если путь уже содержит структуру проекта, используем его как есть
-        if verify.startswith('junk/ia-nartov/hackathon_project/'):
-            # Извлекаем только имя файла и ищем его в текущей директории
-            cert_filename = verify.split('/')[-1]
-            verify = os.path.abspath(cert_filename)
-        else:
-            # Если путь относительный, делаем его относительно рабочей директории
-            verify = os.path.abspath(verify)
-        log.info(f"Resolved certificate path: {verify}")
+    verify = _resolve_verify(verify)
     
-    # Retry логика
-    last_exception = None
+    limiter = rate_limiter.get_limiter(model)
+
+    # Retry логика: таймауты, обрывы, 429 и 5xx повторяем с jitter-backoff;
+    # 429/503 сужают окно параллелизма, Retry-After ставит общую паузу
+    last_exception: Exception | None = None
     for attempt in range(max_retries):
+        delay = rate_limiter.backoff_delay(attempt, retry_delay)
         try:
-            resp = requests.post(
-                cfg["endpoint"],
-                json=payload,
-                headers={
-                    "Authorization": f"OAuth {token}",
-                    "Content-Type": "application/json",
-                },
-                timeout=timeout,
-                stream=stream,
-                verify=verify,
-            )
-            if resp.status_code != 200:
-                raise RuntimeError(f"{resp.status_code}: {resp.text}")
-
-            if not stream:
-                return resp.json()
-
-            def _chunks() -> Iterable[Dict[str, Any]]:
-                for line in resp.iter_lines(decode_unicode=True):
-                    if line.startswith("data:"):
-                        yield json.loads(line.removeprefix("data:").strip())
-
-            return _chunks()
-            
+            t_wait = time.perf_counter()
+            with limiter.slot(), metrics.span("llm.request", model=model):
+                metrics.observe("llm.limiter_wait", time.perf_counter() - t_wait, model=model)
+                resp = http.post(
+                    url,
+                    json=payload,
+                    headers={
+                        "Authorization": f"OAuth {token}",
+                        "Content-Type": "application/json",
+                    },
+                    timeout=timeout,
+                    stream=stream,
+                    verify=verify,
+                )
+        except rate_limiter.CircuitOpenError as e:
+            log.error(f"{model}: {e}")
+            raise
         except (requests.exceptions.Timeout, requests.exceptions.ConnectionError) as e:
+            limiter.record_failure()
+            metrics.inc("llm.errors", model=model, error=type(e).__name__)
             last_exception = e
-            if attempt < max_retries - 1:
-                log.warning(f"Attempt {attempt + 1} failed with {type(e).__name__}: {e}. Retrying in {retry_delay}s...")
-                time.sleep(retry_delay)
-                retry_delay *= 1.5  # Экспоненциальная задержка
+        else:
+            metrics.inc("llm.responses", model=model, status=resp.status_code)
+            if resp.status_code == 200:
+                limiter.record_success()
+                if not stream:
+                    metrics.inc("llm.bytes_received", len(resp.content), model=model)
+                    with metrics.span("llm.decode", model=model):
+                        data = resp.json()
+                    _report_tokens(model, messages, data)
+                    if cache:
+                        try:
+                            cache.put(key, data)
+                        except OSError as e:
+                            # ответ уже оплачен: сбой диска не повод его терять
+                            log.warning(f"cache write failed: {e}")
+                            metrics.inc("llm.cache_errors", model=model)
+                    return data
+                return ChunkStream(resp)
+
+            err = RuntimeError(f"{resp.status_code}: {resp.text}")
+            if resp.status_code in _OVERLOAD_STATUSES:
+                retry_after = rate_limiter.parse_retry_after(resp.headers.get("Retry-After"))
+                limiter.record_overload(retry_after)
+                if resp.status_code == 503:
+                    limiter.record_failure()
+                if retry_after:
+                    delay = max(delay, retry_after)
+            elif resp.status_code >= 500:
+                limiter.record_failure()
             else:
-                log.error(f"All {max_retries} attempts failed. Last error: {e}")
-                raise
-        except Exception as e:
-            # Для других ошибок не делаем retry
-            log.error(f"Non-retryable error: {e}")
-            raise
-    
-    # Этот код не должен выполняться, но на всякий случай
-    if last_exception:
-        raise last_exception
\ No newline at end of file
+                # 4xx: эндпоинт жив, но запрос некорректный — retry не поможет
+                limiter.breaker.record_success()
+                log.error(f"Non-retryable error: {err}")
+                raise err
+            last_exception = err
+
+        if attempt < max_retries - 1:
+            metrics.inc("llm.retries", model=model)
+            log.warning(f"Attempt {attempt + 1} failed with {type(last_exception).__name__}: {last_exception}. Retrying in {delay:.1f}s...")
+            time.sleep(delay)
+
+    log.error(f"All {max_retries} attempts failed. Last error: {last_exception}")
+    raise last_exception
+
+
+# ─────────────────────────────── async API ────────────────────────────────────
+class AsyncElizaClient:
+    """
+    Асинхронный клиент поверх собственной keep-alive сессии.
+
+    HTTP-вызовы выполняются в пуле из `concurrency` потоков (requests блокирующий),
+    одновременно в полёте не больше `concurrency` запросов. Retry, выбор модели
+    через _MODELS и разбор стрима — те же, что у eliza_chat.
+
+        async with AsyncElizaClient(model="deepseek", concurrency=8) as client:
+            answers = await client.achat_many([prompt1, prompt2, ...])
+    """
+
+    def __init__(
+        self,
+        *,
+        model: str = "yandex",
+        concurrency: int = 8,
+        timeout: int = 180,
+        token: str | None = None,
+        verify: Union[bool, str] = True,
+        max_retries: int = 3,
+        retry_delay: float = 5.0,
+        endpoint: str | None = None,
+    ) -> None:
+        if model not in _MODELS:
+            raise ValueError(f"model must be 'yandex' or 'deepseek', got {model}")
+        self.model = model
+        self.concurrency = max(1, concurrency)
+        self._chat_kwargs: Dict[str, Any] = {
+            "timeout": timeout,
+            "token": token,
+            "verify": _resolve_verify(verify),
+            "max_retries": max_retries,
+            "retry_delay": retry_delay,
+            "endpoint": endpoint,
+        }
+        self._session = _new_session(pool_size=self.concurrency)
+        self._executor = ThreadPoolExecutor(
+            max_workers=self.concurrency, thread_name_prefix="eliza"
+        )
+        self._sem: asyncio.Semaphore | None = None
+
+    async def __aenter__(self) -> "AsyncElizaClient":
+        return self
+
+    async def __aexit__(self, *exc) -> None:
+        self.close()
+
+    def close(self) -> None:
+        self._executor.shutdown(wait=False)
+        self._session.close()
+
+    def _semaphore(self) -> asyncio.Semaphore:
+        # создаём лениво — семафор должен принадлежать работающему event loop
+        if self._sem is None:
+            self._sem = asyncio.Semaphore(self.concurrency)
+        return self._sem
+
+    async def _call(self, fn, *args):
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._executor, fn, *args)
+
+    async def achat(
+        self,
+        messages: List[Dict[str, str]],
+        *,
+        model: str | None = None,
+        extra: Dict[str, Any] | None = None,
+    ) -> Dict[str, Any]:
+        """один запрос; возвращает dict ответа, как eliza_chat(stream=False)."""
+        call = functools.partial(
+            eliza_chat,
+            messages,
+            model=model or self.model,
+            extra=extra,
+            session=self._session,
+            **self._chat_kwargs,
+        )
+        async with self._semaphore():
+            return await self._call(call)
+
+    async def achat_many(
+        self,
+        prompts: Sequence[List[Dict[str, str]]],
+        *,
+        model: str | None = None,
+        extra: Dict[str, Any] | None = None,
+        return_exceptions: bool = False,
+    ) -> List[Any]:
+        """
+        Пачка запросов; результаты в том же порядке, что и prompts.
+        return_exceptions=True — ошибка одного запроса не роняет остальные.
+        """
+        return await asyncio.gather(
+            *(self.achat(p, model=model, extra=extra) for p in prompts),
+            return_exceptions=return_exceptions,
+        )
+
+    async def astream(
+        self,
+        messages: List[Dict[str, str]],
+        *,
+        model: str | None = None,
+        extra: Dict[str, Any] | None = None,
+    ) -> AsyncIterator[Dict[str, Any]]:
+        """стриминговый запрос: асинхронно отдаёт чанки «data: {...}»."""
+        call = functools.partial(
+            eliza_chat,
+            messages,
+            model=model or self.model,
+            extra=extra,
+            stream=True,
+            session=self._session,
+            **self._chat_kwargs,
+        )
+        async with self._semaphore():
+            chunks = await self._call(call)
+            done = object()
+            try:
+                while True:
+                    chunk = await self._call(next, chunks, done)
+                    if chunk is done:
+                        return
+                    yield chunk
+            finally:
+                chunks.close()
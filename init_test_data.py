@@ -4,7 +4,6 @@
 Основан на блоке из Jupyter ноутбука upload_massages.ipynb
 """
 
-import asyncio
 import os
 import pathlib
 from dotenv import load_dotenv
@@ -13,7 +12,9 @@ from dotenv import load_dotenv
 env_path = pathlib.Path(__file__).parent / '.env'
 load_dotenv(env_path)
 
-from . import tg_etl
+from . import channel_cache
+from . import storage
+from . import tg_ingest
 from . import test_data
 
 def init_test_data(days_back_start: int = 3, days_back_end: int = 0):
@@ -39,7 +40,7 @@ def init_test_data(days_back_start: int = 3, days_back_end: int = 0):
     
     # Загружаем в YT
     print(f"Загружаем пользователей в {users_table}...")
-    tg_etl.upload_df_to_yt(
+    storage.get_storage().upload(
         df_users,
         users_table,
         test_data.USER_SCHEMA,
@@ -47,12 +48,13 @@ def init_test_data(days_back_start: int = 3, days_back_end: int = 0):
     )
     
     print(f"Загружаем чаты в {chats_table}...")
-    tg_etl.upload_df_to_yt(
+    storage.get_storage().upload(
         df_chats,
         chats_table,
         test_data.CHAT_SCHEMA,
         overwrite=True
     )
+    channel_cache.invalidate()
     
     # Выгружаем сообщения из Telegram чатов
     print(f"\n🔄 Выгружаем сообщения из Telegram за период:")
@@ -61,24 +63,18 @@ def init_test_data(days_back_start: int = 3, days_back_end: int = 0):
     print(f"Чаты для выгрузки: {len(test_data.TG_CHATS)}")
     
     try:
-        # Используем asyncio для вызова асинхронной функции dump_chats
-        df_messages = asyncio.run(tg_etl.dump_chats(
-            test_data.TG_CHATS,
-            days_back_start=days_back_start,
-            days_back_end=days_back_end
-        ))
-        
-        print(f"Получено сообщений: {len(df_messages)}")
-        
-        # Загружаем сообщения в YT
+        # Чаты выгружаются конкурентно и пишутся порциями (tg_ingest)
         print(f"Загружаем сообщения в {messages_table}...")
-        tg_etl.upload_df_to_yt(
-            df_messages,
+        written = tg_ingest.full_dump(
+            test_data.TG_CHATS,
             messages_table,
             test_data.MSG_SCHEMA,
-            overwrite=True
+            days_back_start=days_back_start,
+            days_back_end=days_back_end
         )
         
+        print(f"Получено сообщений: {written}")
+        
         print("✅ Сообщения из Telegram выгружены и загружены в YT!")
         
     except Exception as e:
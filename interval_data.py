@@ -0,0 +1,114 @@
+# interval_data.py
+# ─────────────────────────────────────────────────────────────
+# Пакетное чтение из хранилища (YT / SQLite, см. storage): один запрос на таблицу за весь интервал
+# [start; end] и все нужные каналы вместо запроса на каждую пару
+# (канал, день). Дальше срезы по (канал, день) отдаются из памяти;
+# метаданные каналов — из общего channel_cache.
+#
+#   data = IntervalData.load(start, end, channel_ids)
+#   run_daily_digester(day, ch, data=data)
+
+from __future__ import annotations
+import datetime as dt, os
+from collections import defaultdict
+from typing import Dict, Iterable, List, Tuple
+
+import pandas as pd
+
+from . import channel_cache
+from . import metrics
+from . import storage
+
+
+ROOT            = os.getenv("YT_ROOT", "//tmp/ia-nartov/hackathon")
+TBL_ANALYSIS    = f"{ROOT}/topic_analysis"
+TBL_DAILY       = f"{ROOT}/daily_topics"
+
+ANALYSIS_FIELDS = ["topic_id", "channel_id", "date", "summary", "status", "conclusions", "resume"]
+
+Key = Tuple[int, str]      # (channel_id, "YYYY-MM-DD")
+
+
+class IntervalData:
+    """срез topic_analysis / daily_topics за интервал, сгруппированный по (канал, день)."""
+
+    def __init__(
+        self,
+        start: dt.date,
+        end: dt.date,
+        analysis: pd.DataFrame,
+        daily_topics: pd.DataFrame,
+    ) -> None:
+        self.start = start
+        self.end = end
+
+        self._analysis: Dict[Key, List[dict]] = defaultdict(list)
+        for rec in analysis.sort_values("topic_id").to_dict("records") if not analysis.empty else []:
+            self._analysis[(int(rec["channel_id"]), str(rec["date"]))].append(rec)
+
+        self._topic_ids: Dict[Key, List[str]] = defaultdict(list)
+        for rec in daily_topics.to_dict("records") if not daily_topics.empty else []:
+            self._topic_ids[(int(rec["channel_id"]), str(rec["date"]))].append(rec["topic_id"])
+
+    # ─────────── загрузка ───────────
+    @classmethod
+    @metrics.timed("read.interval_data")
+    def load(
+        cls,
+        start: dt.date,
+        end: dt.date,
+        channel_ids: Iterable[int] | None = None,
+    ) -> "IntervalData":
+        """два запроса на весь интервал (пустой channel_ids — все каналы)."""
+        channel_ids = list(channel_ids or [])
+        st = storage.get_storage()
+
+        analysis = st.by_channel_date(TBL_ANALYSIS, ANALYSIS_FIELDS, start, end, channel_ids)
+
+        try:
+            daily_topics = st.by_channel_date(
+                TBL_DAILY, ["channel_id", "date", "topic_id"], start, end, channel_ids
+            )
+        except Exception as e:
+            # Таблица может не существовать, если extractor ещё не создал тем
+            print(f"⏭  Нет таблицы daily_topics: {e}")
+            daily_topics = pd.DataFrame(columns=["channel_id", "date", "topic_id"])
+
+        return cls(start, end, analysis, daily_topics)
+
+    # ─────────── срезы ───────────
+    def _check_range(self, day: dt.date) -> None:
+        if not (self.start <= day <= self.end):
+            raise KeyError(f"{day} вне загруженного интервала {self.start}–{self.end}")
+
+    def channel(self, channel_id: int) -> pd.Series:
+        """строка tg_chats (chat, description)."""
+        return channel_cache.get_channel(channel_id)
+
+    def topics(self, channel_id: int, day: dt.date, fields: List[str]) -> list[dict]:
+        """темы из topic_analysis за день, упорядоченные по topic_id."""
+        self._check_range(day)
+        return [
+            {f: rec.get(f) for f in fields}
+            for rec in self._analysis.get((int(channel_id), str(day)), [])
+        ]
+
+    def topics_between(
+        self,
+        channel_id: int,
+        start: dt.date,
+        end: dt.date,
+        fields: List[str],
+    ) -> list[dict]:
+        """темы из topic_analysis за [start; end]."""
+        self._check_range(start)
+        self._check_range(end)
+        out = []
+        for i in range((end - start).days + 1):
+            out.extend(self.topics(channel_id, start + dt.timedelta(days=i), fields))
+        return out
+
+    def topic_ids(self, channel_id: int, day: dt.date) -> List[str]:
+        """topic_id-ы из daily_topics за день."""
+        self._check_range(day)
+        return list(self._topic_ids.get((int(channel_id), str(day)), []))
@@ -0,0 +1,155 @@
+# job_queue.py
+# ─────────────────────────────────────────────────────────────
+# Локальная очередь заданий для `serve` (SQLite):
+#   jobs — команда CLI и её аргументы (JSON), статус, время постановки,
+#          старта и завершения, pid взявшего задание воркера, ошибка
+#
+# queued → running → done | failed.  Задание берётся атомарно
+# (BEGIN IMMEDIATE), поэтому очередь могут разбирать несколько процессов.
+# Задания, зависшие в running у умершего процесса, при старте воркера
+# возвращаются в queued.
+
+from __future__ import annotations
+import json, os, pathlib, sqlite3, threading, time
+from dataclasses import dataclass
+from typing import Any, Dict, List
+
+
+DB_PATH = os.getenv(
+    "JOB_QUEUE_DB",
+    str(pathlib.Path.home() / ".cache" / "tg_digester" / "jobs.sqlite"),
+)
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    id          INTEGER PRIMARY KEY AUTOINCREMENT,
+    command     TEXT    NOT NULL,
+    args        TEXT    NOT NULL,
+    status      TEXT    NOT NULL DEFAULT 'queued',
+    attempts    INTEGER NOT NULL DEFAULT 0,
+    pid         INTEGER,
+    enqueued_at REAL    NOT NULL,
+    started_at  REAL,
+    finished_at REAL,
+    error       TEXT
+);
+CREATE INDEX IF NOT EXISTS jobs_status ON jobs (status, id);
+"""
+
+
+@dataclass
+class Job:
+    id: int
+    command: str
+    args: Dict[str, Any]
+    attempts: int
+
+
+def _alive(pid: int) -> bool:
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+class JobQueue:
+    """очередь заданий CLI в SQLite."""
+
+    def __init__(self, path: str | os.PathLike = DB_PATH) -> None:
+        self.path = pathlib.Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        # autocommit: транзакции открываем сами, чтобы claim был атомарным
+        self._conn = sqlite3.connect(
+            self.path, check_same_thread=False, isolation_level=None, timeout=30,
+        )
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.executescript(_SCHEMA)
+        self._lock = threading.Lock()
+
+    def close(self) -> None:
+        self._conn.close()
+
+    def put(self, command: str, args: Dict[str, Any]) -> int:
+        """ставит задание в очередь; возвращает его id."""
+        with self._lock:
+            cur = self._conn.execute(
+                "INSERT INTO jobs (command, args, enqueued_at) VALUES (?, ?, ?)",
+                (command, json.dumps(args, ensure_ascii=False, default=str), time.time()),
+            )
+            return cur.lastrowid
+
+    def claim(self) -> Job | None:
+        """берёт самое старое задание из queued (или None, если очередь пуста)."""
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                row = self._conn.execute(
+                    "SELECT id, command, args, attempts FROM jobs WHERE status = 'queued' ORDER BY id LIMIT 1"
+                ).fetchone()
+                if row is None:
+                    self._conn.execute("COMMIT")
+                    return None
+                self._conn.execute(
+                    "UPDATE jobs SET status = 'running', attempts = attempts + 1, pid = ?, started_at = ? WHERE id = ?",
+                    (os.getpid(), time.time(), row[0]),
+                )
+                self._conn.execute("COMMIT")
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+        return Job(id=row[0], command=row[1], args=json.loads(row[2]), attempts=row[3] + 1)
+
+    def finish(self, job_id: int, error: str | None = None) -> None:
+        """отмечает задание выполненным (error=None) или упавшим."""
+        with self._lock:
+            self._conn.execute(
+                "UPDATE jobs SET status = ?, finished_at = ?, error = ? WHERE id = ?",
+                ("failed" if error else "done", time.time(), error, job_id),
+            )
+
+    def release(self, job_id: int) -> None:
+        """возвращает взятое задание в очередь (например, при остановке воркера)."""
+        with self._lock:
+            self._conn.execute(
+                "UPDATE jobs SET status = 'queued', pid = NULL, started_at = NULL WHERE id = ?",
+                (job_id,),
+            )
+
+    def requeue_orphans(self) -> int:
+        """running-задания умерших процессов → queued; возвращает их число."""
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT id, pid FROM jobs WHERE status = 'running'"
+            ).fetchall()
+            orphans = [jid for jid, pid in rows if not pid or (pid != os.getpid() and not _alive(pid))]
+            for jid in orphans:
+                self._conn.execute(
+                    "UPDATE jobs SET status = 'queued', pid = NULL, started_at = NULL WHERE id = ?",
+                    (jid,),
+                )
+        return len(orphans)
+
+    def counts(self) -> Dict[str, int]:
+        """число заданий по статусам."""
+        with self._lock:
+            rows = self._conn.execute("SELECT status, COUNT(*) FROM jobs GROUP BY status").fetchall()
+        return {status: n for status, n in rows}
+
+    def recent(self, limit: int = 20) -> List[Dict[str, Any]]:
+        """последние задания с длительностью выполнения."""
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT id, command, status, attempts, started_at, finished_at, error "
+                "FROM jobs ORDER BY id DESC LIMIT ?",
+                (limit,),
+            ).fetchall()
+        return [
+            {
+                "id": jid, "command": cmd, "status": st, "attempts": att,
+                "duration": (fin - start) if start and fin else None, "error": err,
+            }
+            for jid, cmd, st, att, start, fin, err in rows
+        ]
@@ -0,0 +1,137 @@
+# json_stream.py
+# ─────────────────────────────────────────────────────────────
+# Инкрементальный разбор JSON-ответа LLM, пока он ещё генерируется.
+#
+# Отдаёт элементы массивов верхнего уровня, как только элемент закрыт:
+#   {"discussions": ["• …", …], "commitments": [...]}  → ("discussions", "• …"), …
+#   [{"rank": 1, …}, {"rank": 2, …}]                   → (None, {"rank": 1, …}), …
+#
+# Мусор до первой «{» / «[» (```json и т.п.) пропускается; если JSON так
+# и не начался за MAX_PREAMBLE символов или элемент не парсится —
+# ValueError, и вызывающий может оборвать генерацию.
+
+from __future__ import annotations
+import json
+from typing import Any, Iterable, Iterator, List, Tuple
+
+MAX_PREAMBLE = 200
+
+Item = Tuple[str | None, Any]
+
+
+class JSONItemStream:
+    """
+    parser = JSONItemStream()
+    for delta in text_deltas:
+        for key, value in parser.feed(delta):
+            ...
+    """
+
+    def __init__(self, max_preamble: int = MAX_PREAMBLE) -> None:
+        self.max_preamble = max_preamble
+        self.text = ""            # весь полученный текст (для финального разбора)
+        self.done = False         # корневой JSON закрыт
+        self._pos = 0
+        self._started = False
+        self._stack: List[str] = []
+        self._in_str = False
+        self._esc = False
+        self._expect_key = False
+        self._key_start: int | None = None
+        self._key: str | None = None
+        self._elem_start: int | None = None
+        self._elem_depth = 0
+
+    def _in_target(self) -> bool:
+        """находимся прямо внутри массива верхнего уровня (или массива-значения корневого объекта)."""
+        st = self._stack
+        return bool(st) and st[-1] == "[" and (len(st) == 1 or (len(st) == 2 and st[0] == "{"))
+
+    def _open_elem(self, i: int) -> None:
+        if self._elem_start is None and self._in_target():
+            self._elem_start = i
+            self._elem_depth = len(self._stack)
+
+    def _close_elem(self, end: int, out: List[Item]) -> None:
+        raw = self.text[self._elem_start:end].strip()
+        self._elem_start = None
+        try:
+            value = json.loads(raw)
+        except json.JSONDecodeError as e:
+            raise ValueError(f"malformed LLM output near: {raw[:80]!r}") from e
+        out.append((self._key if self._stack[0] == "{" else None, value))
+
+    def _at_elem_depth(self) -> bool:
+        return self._elem_start is not None and len(self._stack) == self._elem_depth
+
+    def feed(self, delta: str) -> List[Item]:
+        """добавляет кусок текста; возвращает элементы, закрытые этим куском."""
+        self.text += delta
+        out: List[Item] = []
+        buf = self.text
+        while self._pos < len(buf):
+            i = self._pos
+            c = buf[i]
+            self._pos += 1
+
+            if self.done:
+                break
+
+            if not self._started:
+                if c in "{[":
+                    self._started = True
+                    self._stack.append(c)
+                    self._expect_key = c == "{"
+                elif i >= self.max_preamble:
+                    raise ValueError("LLM output does not look like JSON")
+                continue
+
+            if self._in_str:
+                if self._esc:
+                    self._esc = False
+                elif c == "\\":
+                    self._esc = True
+                elif c == '"':
+                    self._in_str = False
+                    if self._key_start is not None:
+                        self._key = json.loads(buf[self._key_start:i + 1])
+                        self._key_start = None
+                        self._expect_key = False
+                    elif self._at_elem_depth():
+                        self._close_elem(i + 1, out)
+                continue
+
+            if c == '"':
+                self._in_str = True
+                if self._expect_key and self._stack == ["{"]:
+                    self._key_start = i
+                else:
+                    self._open_elem(i)
+            elif c in "{[":
+                self._open_elem(i)
+                self._stack.append(c)
+            elif c in "}]":
+                if self._at_elem_depth():
+                    self._close_elem(i, out)            # примитив перед «]»
+                self._stack.pop()
+                if self._at_elem_depth():
+                    self._close_elem(i + 1, out)        # закрылся вложенный объект/массив
+                if not self._stack:
+                    self.done = True
+            elif c == ",":
+                if self._at_elem_depth():
+                    self._close_elem(i, out)
+                if self._stack == ["{"]:
+                    self._expect_key = True
+            elif not c.isspace() and c != ":":
+                self._open_elem(i)                      # число / true / false / null
+        return out
+
+
+def iter_items(deltas: Iterable[str]) -> Iterator[Item]:
+    """(ключ, элемент) по мере генерации; ключ None для массива верхнего уровня."""
+    parser = JSONItemStream()
+    for delta in deltas:
+        yield from parser.feed(delta)
+        if parser.done:
+            return
@@ -0,0 +1,217 @@
+# metrics.py
+# ─────────────────────────────────────────────────────────────
+# Спаны и счётчики этапов конвейера (на процесс, потокобезопасно):
+#
+#   with metrics.span("daily.prompt"): ...        # время этапа
+#   @metrics.timed("daily.digest")                 # то же для функции
+#   metrics.inc("llm.retries", model=model)        # счётчик с метками
+#
+# По имени этапа копятся count / sum / max и p50/p95 по последним
+# _RESERVOIR замерам. Выход:
+#   • METRICS_JSONL — каждый закрытый спан строкой JSON (ts, span, sec, labels)
+#   • METRICS_PROM  — Prometheus text-файл (textfile-коллектор node_exporter),
+#                     пишется в report()
+#   • report()      — сводная таблица в конце прогона
+#
+# Спаны в разных потоках пересекаются: сумма по этапам может превышать wall-time.
+
+from __future__ import annotations
+import functools, json, os, pathlib, re, statistics, threading, time
+from collections import deque
+from contextlib import contextmanager
+from typing import Any, Callable, Deque, Dict, Iterator, Tuple
+
+
+JSONL_PATH = os.getenv("METRICS_JSONL") or None
+PROM_PATH  = os.getenv("METRICS_PROM") or None
+
+_RESERVOIR = 2048
+_PREFIX = "tg_digester"
+
+Labels = Tuple[Tuple[str, str], ...]
+
+
+class _Timer:
+    def __init__(self) -> None:
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+        self.errors = 0
+        self.samples: Deque[float] = deque(maxlen=_RESERVOIR)
+
+    def add(self, sec: float, error: bool) -> None:
+        self.count += 1
+        self.total += sec
+        self.max = max(self.max, sec)
+        self.errors += error
+        self.samples.append(sec)
+
+    def pct(self, q: int) -> float:
+        s = sorted(self.samples)
+        if len(s) < 2:
+            return s[0] if s else 0.0
+        return statistics.quantiles(s, n=100, method="inclusive")[q - 1]
+
+
+_lock = threading.Lock()
+_timers: Dict[str, _Timer] = {}
+_counters: Dict[Tuple[str, Labels], float] = {}
+_started = time.time()
+_jsonl = None
+
+
+def configure(jsonl: str | None = None, prom: str | None = None) -> None:
+    """переопределяет пути выгрузки (по умолчанию METRICS_JSONL / METRICS_PROM)."""
+    global JSONL_PATH, PROM_PATH, _jsonl
+    with _lock:
+        if _jsonl is not None:
+            _jsonl.close()
+            _jsonl = None
+        JSONL_PATH, PROM_PATH = jsonl or JSONL_PATH, prom or PROM_PATH
+
+
+def _labels(labels: Dict[str, Any]) -> Labels:
+    return tuple(sorted((k, str(v)) for k, v in labels.items() if v is not None))
+
+
+def _emit(rec: Dict[str, Any]) -> None:
+    """строка в JSONL-синк (вызывается под _lock)."""
+    global _jsonl
+    if not JSONL_PATH:
+        return
+    if _jsonl is None:
+        pathlib.Path(JSONL_PATH).parent.mkdir(parents=True, exist_ok=True)
+        _jsonl = open(JSONL_PATH, "a", encoding="utf-8")
+    _jsonl.write(json.dumps(rec, ensure_ascii=False, default=str) + "\n")
+
+
+# ─────────── API ───────────
+def observe(name: str, sec: float, *, error: bool = False, **labels: Any) -> None:
+    """замер длительности этапа name (секунды)."""
+    with _lock:
+        _timers.setdefault(name, _Timer()).add(sec, error)
+        _emit({
+            "ts": round(time.time(), 3), "span": name, "sec": round(sec, 6),
+            "labels": dict(_labels(labels)), "error": error,
+            "thread": threading.current_thread().name,
+        })
+
+
+@contextmanager
+def span(name: str, **labels: Any) -> Iterator[None]:
+    """время блока как этап name; исключение помечает замер error и пробрасывается."""
+    t0 = time.perf_counter()
+    error = False
+    try:
+        yield
+    except BaseException:
+        error = True
+        raise
+    finally:
+        observe(name, time.perf_counter() - t0, error=error, **labels)
+
+
+def timed(name: str) -> Callable:
+    """декоратор: каждый вызов функции — спан name."""
+    def deco(fn: Callable) -> Callable:
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            with span(name):
+                return fn(*args, **kwargs)
+        return wrapper
+    return deco
+
+
+def inc(name: str, value: float = 1, **labels: Any) -> None:
+    """счётчик name (+value) с метками."""
+    key = (name, _labels(labels))
+    with _lock:
+        _counters[key] = _counters.get(key, 0) + value
+
+
+def snapshot() -> Dict[str, Any]:
+    """{"spans": {этап: {count, total, avg, p50, p95, max, errors}}, "counters": {...}}."""
+    with _lock:
+        spans = {
+            name: {
+                "count": t.count, "total": t.total, "avg": t.total / t.count if t.count else 0.0,
+                "p50": t.pct(50), "p95": t.pct(95), "max": t.max, "errors": t.errors,
+            }
+            for name, t in _timers.items()
+        }
+        counters = {
+            name + ("{" + ",".join(f"{k}={v}" for k, v in lbl) + "}" if lbl else ""): val
+            for (name, lbl), val in sorted(_counters.items())
+        }
+    return {"wall": time.time() - _started, "spans": spans, "counters": counters}
+
+
+# ─────────── выгрузка ───────────
+def _prom_name(name: str) -> str:
+    return f"{_PREFIX}_" + re.sub(r"[^a-zA-Z0-9_]", "_", name)
+
+
+def _prom_labels(lbl: Labels) -> str:
+    if not lbl:
+        return ""
+    return "{" + ",".join(f'{k}="{v}"' for k, v in lbl) + "}"
+
+
+def write_prometheus(path: str | os.PathLike) -> None:
+    """Prometheus text-формат; файл заменяется атомарно."""
+    snap = snapshot()
+    lines = [
+        f"# TYPE {_PREFIX}_stage_seconds summary",
+    ]
+    for name, s in sorted(snap["spans"].items()):
+        stage = f'stage="{name}"'
+        lines += [
+            f'{_PREFIX}_stage_seconds{{{stage},quantile="0.5"}} {s["p50"]:.6f}',
+            f'{_PREFIX}_stage_seconds{{{stage},quantile="0.95"}} {s["p95"]:.6f}',
+            f"{_PREFIX}_stage_seconds_sum{{{stage}}} {s['total']:.6f}",
+            f"{_PREFIX}_stage_seconds_count{{{stage}}} {s['count']}",
+        ]
+    lines.append(f"# TYPE {_PREFIX}_stage_errors_total counter")
+    lines += [
+        f"{_PREFIX}_stage_errors_total{{stage=\"{name}\"}} {s['errors']}"
+        for name, s in sorted(snap["spans"].items())
+    ]
+    with _lock:
+        counters = sorted(_counters.items())
+    typed = set()
+    for (name, lbl), val in counters:
+        metric = _prom_name(name) + "_total"
+        if metric not in typed:
+            lines.append(f"# TYPE {metric} counter")
+            typed.add(metric)
+        lines.append(f"{metric}{_prom_labels(lbl)} {val:g}")
+
+    path = pathlib.Path(path)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp = path.with_suffix(path.suffix + ".tmp")
+    tmp.write_text("\n".join(lines) + "\n", encoding="utf-8")
+    os.replace(tmp, path)
+
+
+def report() -> None:
+    """сводная таблица этапов и счётчиков; выгрузка в METRICS_PROM / METRICS_JSONL."""
+    snap = snapshot()
+    if snap["spans"]:
+        print(f"\n⏱  Этапы (wall {snap['wall']:.1f}s):")
+        print(f"   {'stage':<26}{'count':>7}{'total, s':>10}{'avg, ms':>10}{'p50, ms':>10}{'p95, ms':>10}{'max, ms':>10}{'err':>5}")
+        for name, s in sorted(snap["spans"].items(), key=lambda kv: kv[1]["total"], reverse=True):
+            print(
+                f"   {name:<26}{s['count']:>7}{s['total']:>10.2f}{s['avg'] * 1000:>10.1f}"
+                f"{s['p50'] * 1000:>10.1f}{s['p95'] * 1000:>10.1f}{s['max'] * 1000:>10.1f}{s['errors']:>5}"
+            )
+    if snap["counters"]:
+        print("   " + ", ".join(f"{k}={v:g}" for k, v in snap["counters"].items()))
+
+    if PROM_PATH:
+        write_prometheus(PROM_PATH)
+        print(f"📈 метрики → {PROM_PATH}")
+    with _lock:
+        if JSONL_PATH and (snap["spans"] or snap["counters"]):
+            _emit({"ts": round(time.time(), 3), "summary": snap})
+        if _jsonl is not None:
+            _jsonl.flush()
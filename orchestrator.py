@@ -1,41 +1,45 @@
 # ─────────────────────────────────────────────────────────────
 import datetime as dt
 import os
-from typing import List
+import queue
+import threading
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from typing import Dict, List, Set, Tuple
 
-from . import tg_etl
+import pandas as pd
+
+from . import checkpoint
+from . import custom_date_digester
+from . import daily_digester
+from . import metrics
+from . import rate_limiter
+from . import state_store
+from . import storage
 from . import topic_extractor
 from . import topic_resumator_chat
+from . import yt_writer
+from .interval_data import IntervalData
 
 
 ROOT       = os.getenv("YT_ROOT", "//tmp/ia-nartov/hackathon")
 TBL_MSG    = f"{ROOT}/tg_raw_enriched"     # сырьё
 TBL_TOPICS = f"{ROOT}/daily_topics"        # результат topic_extractor
 
+# колонки tg_raw_enriched для отпечатка дня в инкрементальном режиме
+MSG_ID_COL   = os.getenv("MSG_ID_COLUMN", "message_id")
+MSG_EDIT_COL = os.getenv("MSG_EDIT_COLUMN", "edit_dttm")
+
 
+@metrics.timed("read.channels")
 def _channels_with_msgs(start: dt.date, end: dt.date) -> List[int]:
     """возвращает list(chat_id), у которых есть сообщения в диапазоне."""
-    df = tg_etl.query_yql(
-        f"""
-        SELECT DISTINCT chat_id
-        FROM hahn.`{TBL_MSG}`
-        WHERE DateTime::MakeDate(DateTime::ParseIso8601(dttm)) BETWEEN Date("{start}") AND Date("{end}");
-        """
-    )
-    return df["chat_id"].tolist()
+    return storage.get_storage().channels_with_messages(TBL_MSG, start, end)
 
 
 def _topic_ids(channel_id: int, day: dt.date) -> List[str]:
     """возвращает topic_id-ы, созданные extractor'ом по (канал,дата)."""
     try:
-        df = tg_etl.query_yql(
-            f"""
-            SELECT topic_id
-            FROM hahn.`{TBL_TOPICS}`
-            WHERE channel_id = {channel_id}
-              AND date = "{day}";
-            """
-        )
+        df = storage.get_storage().by_channel_date(TBL_TOPICS, ["topic_id"], day, channel_ids=[channel_id])
         return df["topic_id"].tolist()
     except Exception as e:
         # Таблица может не существовать, если extractor не создал тем
@@ -43,7 +47,263 @@ def _topic_ids(channel_id: int, day: dt.date) -> List[str]:
         return []
 
 
+def _extracted_topic_ids(result, channel_id: int, day: dt.date) -> List[str]:
+    """
+    topic_id-ы из результата run_topic_extractor (list[str] / DataFrame / list[dict]).
+    Если extractor ничего не вернул или вернул что-то другое — fallback на запрос
+    к daily_topics.
+    """
+    if isinstance(result, pd.DataFrame) and "topic_id" in result.columns:
+        return result["topic_id"].tolist()
+    if isinstance(result, (list, tuple)):
+        tids = [r.get("topic_id") if isinstance(r, dict) else r for r in result]
+        if all(isinstance(t, str) and t for t in tids):
+            return tids
+    if result is not None:
+        print(f"⚠️ extractor {channel_id=} {day}: неожиданный результат {type(result).__name__}, темы — из daily_topics")
+    return _topic_ids(channel_id, day)
+
+
+_STOP = object()      # сигнал остановки для resumator-воркеров
+
+Pair = Tuple[int, dt.date]      # (канал, день)
+
+
+@metrics.timed("read.fingerprints")
+def _day_fingerprints(
+    start: dt.date,
+    end: dt.date,
+    channels: List[int],
+) -> Dict[Tuple[int, str], str]:
+    """отпечатки входа по (канал, день) одним запросом к tg_raw_enriched."""
+    df = storage.get_storage().message_fingerprints(
+        TBL_MSG, start, end, channels, MSG_ID_COL, MSG_EDIT_COL
+    )
+    return {
+        (int(r["chat_id"]), str(r["day"])): state_store.fingerprint(r["msg_count"], r["max_id"], r["max_edit"])
+        for r in df.to_dict("records")
+    }
+
+
+@metrics.timed("interval.extract")
+def _extract_day(
+    ch: int,
+    day: dt.date,
+    out: "queue.Queue",
+    *,
+    model: str,
+    verify: bool | str,
+    journal: checkpoint.Journal | None = None,
+) -> bool:
+    """
+    extractor для пары (канал, день); найденные темы кладёт в очередь resumator'ов
+    как (канал, день, topic_id). False — extractor упал.
+    journal — статус дня и список его тем пишутся в журнал прогона.
+    """
+    rate_limiter.get_limiter(model).wait_ready()
+    try:
+        result = topic_extractor.run_topic_extractor(
+            date=day,
+            channel_id=ch,
+            model=model,
+            verify=verify,
+        )
+    except Exception as e:
+        print(f"⚠️ extractor fail {ch=} {day}: {e}")
+        metrics.inc("interval.failures", stage="extract")
+        if journal:
+            journal.mark("extract", checkpoint.pair_unit(ch, day), ch, day, error=str(e))
+        return False
+
+    tids = _extracted_topic_ids(result, ch, day)
+    if journal:
+        journal.extracted(ch, day, tids)
+    for tid in tids:
+        out.put((ch, day, tid))
+    return True
+
+
+def _resumator_worker(
+    q: "queue.Queue",
+    *,
+    model: str,
+    verify: bool | str,
+    journal: checkpoint.Journal | None = None,
+) -> None:
+    """забирает темы из очереди и прогоняет resumator, пока не придёт _STOP."""
+    while True:
+        item = q.get()
+        try:
+            if item is _STOP:
+                return
+            ch, day, tid = item
+            # не шлём новые запросы, пока эндпоинт просит паузу или breaker открыт
+            rate_limiter.get_limiter(model).wait_ready()
+            with metrics.span("interval.resume"):
+                topic_resumator_chat.run_topic_resumator(
+                    topic_id=tid,
+                    model=model,
+                    verify=verify,
+                )
+            if journal:
+                journal.mark("resume", tid, ch, day)
+        except Exception as e:
+            print(f"⚠️ resumator fail {tid}: {e}")
+            metrics.inc("interval.failures", stage="resume")
+            if journal:
+                journal.mark("resume", tid, ch, day, error=str(e))
+        finally:
+            q.task_done()
+
+
+def _upsert_rows(rows: List[dict], table: str, schema: list) -> None:
+    """
+    все строки одним upsert'ом (через буфер yt_writer) вместо записи на каждый канал.
+    Не записалось — yt_writer.WriteError (строки остаются в spill до следующего flush).
+    """
+    if not rows:
+        return
+    writer = yt_writer.get_writer()
+    writer.write_many(table, schema, rows)
+    writer.flush(table)
+
+
+@metrics.timed("interval.daily_digests")
+def run_daily_digests(
+    start: dt.date,
+    end: dt.date,
+    channels: List[int],
+    *,
+    model: str = "yandex",
+    verify: bool | str = True,
+    pairs: List[Pair] | None = None,
+    workers: int = 1,
+    errors: Dict[Pair, str] | None = None,
+) -> Set[Pair]:
+    """
+    daily_digester для всех (канал, день); данные читаются одним IntervalData.load
+    на весь интервал, а не парой YQL-запросов на каждый дайджест,
+    результаты пишутся одним upsert'ом.
+    pairs — только эти (канал, день) (по умолчанию весь интервал).
+    Возвращает пары, для которых дайджестер отработал без ошибок;
+    ошибки остальных пар складываются в errors (если передан).
+    """
+    if pairs is None:
+        days = [start + dt.timedelta(days=i) for i in range((end - start).days + 1)]
+        pairs = [(ch, day) for ch in channels for day in days]
+    if not pairs:
+        return set()
+
+    data = IntervalData.load(start, end, channels)
+
+    def _one(ch: int, day: dt.date) -> dict | None:
+        return daily_digester.run_daily_digester(
+            date=day,
+            channel_id=ch,
+            model=model,
+            verify=verify,
+            data=data,
+            save=False,
+        )
+
+    done: Set[Pair] = set()
+    rows: List[dict] = []
+    written: List[Pair] = []        # пары, чьи строки уходят в upsert
+    with ThreadPoolExecutor(max_workers=max(1, workers)) as pool:
+        futures = {pool.submit(_one, ch, day): (ch, day) for ch, day in pairs}
+        for fut in as_completed(futures):
+            ch, day = futures[fut]
+            try:
+                row = fut.result()
+            except Exception as e:
+                print(f"⚠️ daily digest fail {ch=} {day}: {e}")
+                metrics.inc("interval.failures", stage="daily_digest")
+                if errors is not None:
+                    errors[(ch, day)] = str(e)
+                continue
+            done.add((ch, day))
+            if row:
+                rows.append(row)
+                written.append((ch, day))
+
+    try:
+        _upsert_rows(rows, daily_digester.TBL_OUT, daily_digester.SCHEMA_OUT)
+    except yt_writer.WriteError as e:
+        # дайджесты посчитаны, но не записаны — готовыми их не считаем
+        metrics.inc("interval.failures", len(written), stage="daily_digest_write")
+        for pair in written:
+            done.discard(pair)
+            if errors is not None:
+                errors[pair] = f"upsert: {e}"
+    return done
+
+
+def run_daily_all(
+    date: dt.date,
+    *,
+    model: str = "yandex",
+    verify: bool | str = True,
+    workers: int = 4,
+) -> None:
+    """дневные дайджесты для всех каналов, где были сообщения за date."""
+    channels = _channels_with_msgs(date, date)
+    print(f"📊 Найдено каналов с сообщениями: {len(channels)}")
+    if not channels:
+        return
+    done = run_daily_digests(date, date, channels, model=model, verify=verify, workers=workers)
+    print(f"✅ daily-all {date}: {len(done)}/{len(channels)} каналов")
+
+
+def run_custom_all(
+    start: dt.date,
+    end: dt.date,
+    *,
+    model: str = "yandex",
+    verify: bool | str = True,
+    workers: int = 4,
+    render: str = "local",
+) -> None:
+    """
+    custom-дайджесты за [start; end] для всех каналов с сообщениями:
+    один IntervalData на все каналы, параллельный прогон, один upsert.
+    """
+    channels = _channels_with_msgs(start, end)
+    print(f"📊 Найдено каналов с сообщениями: {len(channels)}")
+    if not channels:
+        return
+    data = IntervalData.load(start, end, channels)
+
+    def _one(ch: int) -> dict | None:
+        return custom_date_digester.run_custom_date_digester(
+            start_date=start,
+            end_date=end,
+            channel_id=ch,
+            model=model,
+            verify=verify,
+            data=data,
+            render=render,
+            save=False,
+        )
+
+    rows: List[dict] = []
+    with ThreadPoolExecutor(max_workers=max(1, workers)) as pool:
+        futures = {pool.submit(_one, ch): ch for ch in channels}
+        for fut in as_completed(futures):
+            ch = futures[fut]
+            try:
+                row = fut.result()
+            except Exception as e:
+                print(f"⚠️ custom digest fail {ch=}: {e}")
+                continue
+            if row:
+                rows.append(row)
+
+    _upsert_rows(rows, custom_date_digester.TBL_OUT, custom_date_digester.SCHEMA_OUT)
+    print(f"✅ custom-all {start}–{end}: {len(rows)}/{len(channels)} каналов")
+
+
 # ─────────────────────────────────────────────────────────────
+@metrics.timed("interval.total")
 def process_interval(
     start: dt.date,
     end: dt.date,
@@ -51,11 +311,33 @@ def process_interval(
     channel_id: int = None,
     model: str = "yandex",
     verify: bool | str = True,
-) -> None:
+    workers: int = 1,
+    resume_workers: int | None = None,
+    with_daily: bool = False,
+    incremental: bool = False,
+    resume: bool = False,
+) -> List[Dict]:
     """
     Прогоны topic_extractor  ➜  topic_resumator_chat
     для всех каналов (или конкретного канала), где были сообщения в [start; end] (включительно).
+
+    Конвейер: extractor'ы (workers потоков) кладут topic_id в очередь,
+    пул из resume_workers потоков (по умолчанию = workers) сразу их анализирует.
+    Темы дня попадают в очередь только после завершения extractor'а этого дня,
+    а extraction следующего дня идёт параллельно с анализом предыдущего.
+    with_daily — после анализа тем собрать дневные дайджесты (run_daily_digests).
+    incremental — пропускать дни, вход которых (tg_raw_enriched) не менялся
+    с прошлого успешного прогона (см. state_store); дайджесты пересчитываются
+    только для изменившихся дней.
+    resume — продолжить прерванный прогон с теми же start/end/channel_id:
+    по журналу (checkpoint) пропускаются уже выполненные extract'ы, темы
+    и дайджесты, повторяются только упавшие и недоделанные. Без resume
+    журнал прогона начинается заново. В конце печатается отчёт о сбоях.
+    Возвращает незавершённые единицы работы (checkpoint.Journal.failures).
+    Только для STORAGE_BACKEND=yt (storage.require_yt).
     """
+    storage.require_yt("interval")
+
     if channel_id:
         # Обрабатываем только указанный канал
         channels = [channel_id]
@@ -67,38 +349,121 @@ def process_interval(
     
     if not channels:
         print("⏭  Сообщений в интервале нет — делать нечего")
-        return
+        return []
 
     days = [
         start + dt.timedelta(days=i)
         for i in range((end - start).days + 1)
     ]
+    all_pairs: List[Pair] = [(ch, day) for ch in channels for day in days]
+    jobs = all_pairs
 
-    for ch in channels:
-        print(f"\n🔄 Обрабатываем канал {ch}")
-        for day in days:
-            # 1) daily extractor
-            try:
-                topic_extractor.run_topic_extractor(
-                    date=day,
-                    channel_id=ch,
-                    model=model,
-                    verify=verify,
-                )
-            except Exception as e:
-                print(f"⚠️ extractor fail {ch=} {day}: {e}")
-                continue
+    store = None
+    fps: Dict[Tuple[int, str], str] = {}
+    if incremental:
+        store = state_store.StateStore()
+        fps = _day_fingerprints(start, end, channels)
+        jobs = store.stale(all_pairs, fps, "topics")
+        print(f"♻️  Инкрементальный режим: к пересчёту {len(jobs)} из {len(all_pairs)} (канал × день)")
+    stale_pairs = set(jobs)
+
+    journal = checkpoint.Journal(checkpoint.run_key(start, end, channel_id))
+    pending_topics: List[Tuple[int, dt.date, str]] = []
+    if resume:
+        done_extract = journal.done("extract")
+        pending_topics = journal.pending_topics()
+        jobs = [(ch, day) for ch, day in jobs if checkpoint.pair_unit(ch, day) not in done_extract]
+        print(f"⏯  Продолжаем прогон: extract {len(jobs)} (канал × день), "
+              f"недоразобранных тем {len(pending_topics)}")
+    else:
+        journal.reset()
+
+    topics_q: queue.Queue = queue.Queue()
+    n_consumers = max(1, resume_workers or workers)
+    consumers = [
+        threading.Thread(
+            target=_resumator_worker,
+            args=(topics_q,),
+            kwargs={"model": model, "verify": verify, "journal": journal},
+            name=f"resumator-{i}",
+            daemon=True,
+        )
+        for i in range(n_consumers)
+    ]
+    for t in consumers:
+        t.start()
+    # темы дней, извлечённых в прерванном прогоне, — сразу resumator'ам
+    for item in pending_topics:
+        topics_q.put(item)
+
+    try:
+        if workers <= 1:
+            current = None
+            for ch, day in jobs:
+                if ch != current:
+                    print(f"\n🔄 Обрабатываем канал {ch}")
+                    current = ch
+                _extract_day(ch, day, topics_q, model=model, verify=verify, journal=journal)
+        else:
+            print(f"\n🔄 Запускаем {len(jobs)} задач (канал × день) в {workers} потоков")
+            with ThreadPoolExecutor(max_workers=workers) as pool:
+                futures = {
+                    pool.submit(
+                        _extract_day, ch, day, topics_q, model=model, verify=verify, journal=journal
+                    ): (ch, day)
+                    for ch, day in jobs
+                }
+                for fut in as_completed(futures):
+                    ch, day = futures[fut]
+                    try:
+                        fut.result()
+                    except Exception as e:
+                        print(f"⚠️ job fail {ch=} {day}: {e}")
+    finally:
+        # extractor'ы закончили — дожидаемся, пока resumator'ы разберут очередь
+        for _ in consumers:
+            topics_q.put(_STOP)
+        for t in consumers:
+            t.join()
+
+    # день готов, если extract выполнен (в этом или прерванном прогоне) и все его темы разобраны
+    extracted = journal.done("extract")
+    unfinished = journal.unfinished_days()
+    done = {
+        (ch, day) for ch, day in all_pairs
+        if checkpoint.pair_unit(ch, day) in extracted and (ch, day) not in unfinished
+    }
+    if store:
+        for ch, day in done & stale_pairs:
+            store.record(ch, day, fps.get((ch, str(day)), state_store.EMPTY), "topics")
+
+    if with_daily:
+        print("\n📰 Собираем дневные дайджесты")
+        broken = stale_pairs - done
+        daily_pairs = [p for p in all_pairs if p not in broken]
+        if store:
+            daily_pairs = store.stale(daily_pairs, fps, "daily_digest")
+        if resume:
+            digested_before = journal.done("daily_digest")
+            daily_pairs = [p for p in daily_pairs if checkpoint.pair_unit(*p) not in digested_before]
+        errors: Dict[Pair, str] = {}
+        digested = run_daily_digests(
+            start, end, channels, model=model, verify=verify, pairs=daily_pairs, workers=workers,
+            errors=errors,
+        )
+        for ch, day in daily_pairs:
+            journal.mark("daily_digest", checkpoint.pair_unit(ch, day), ch, day, error=errors.get((ch, day)))
+        if store:
+            for ch, day in digested:
+                store.record(ch, day, fps.get((ch, str(day)), state_store.EMPTY), "daily_digest")
 
-            # 2) resumator для новых тем
-            topic_ids = _topic_ids(ch, day)
-            for tid in topic_ids:
-                try:
-                    topic_resumator_chat.run_topic_resumator(
-                        topic_id=tid,
-                        model=model,
-                        verify=verify,
-                    )
-                except Exception as e:
-                    print(f"⚠️ resumator fail {tid}: {e}")
+    if store:
+        store.close()
+    failures = journal.report()
+    journal.close()
 
+    lim = rate_limiter.get_limiter(model).snapshot()
+    print(f"📈 LLM {model}: запросов {lim['requests']}, 429/503 {lim['overloaded']}, "
+          f"ошибок {lim['failed']}, окно параллелизма {lim['concurrency_limit']}")
     print("✅ interval processing finished")
+    return failures
@@ -0,0 +1,162 @@
+# prompt_builder.py
+# ─────────────────────────────────────────────────────────────
+# Компактная сборка входных данных для промптов дайджестеров:
+#   • count_tokens      — локальная приблизительная оценка числа токенов
+#   • compact_payload   — JSON без отступов, короткие ключи (с легендой),
+#                         повторяющиеся участники вынесены в общий список
+#   • fit_records       — усечение длинных полей и отбор самых содержательных
+#                         записей под бюджет токенов модели
+#
+# Бюджеты моделей — eliza_client.prompt_budget(model).
+
+from __future__ import annotations
+import json, re
+from typing import Any, Callable, Dict, List
+
+
+# ─────────── токены ───────────
+# Приближение BPE-токенизатора: латиница/цифры ≈ 4 символа на токен,
+# кириллица ≈ 3 символа, каждый знак пунктуации — отдельный токен.
+_TOKEN_RE = re.compile(r"[A-Za-z0-9_]+|[А-Яа-яЁё]+|[^\sA-Za-z0-9_А-Яа-яЁё]")
+
+
+def count_tokens(text: str) -> int:
+    """приблизительное число токенов в тексте."""
+    n = 0
+    for m in _TOKEN_RE.finditer(text):
+        w = m.group()
+        if w[0].isascii() and (w[0].isalnum() or w[0] == "_"):
+            n += (len(w) + 3) // 4
+        elif w[0].isalpha():
+            n += (len(w) + 2) // 3
+        else:
+            n += 1
+    return n
+
+
+def count_message_tokens(messages: List[Dict[str, str]]) -> int:
+    """токены chat-промпта (+4 на служебную разметку каждого сообщения)."""
+    return sum(count_tokens(m.get("content", "")) + 4 for m in messages)
+
+
+# ─────────── компактная сериализация ───────────
+SHORT_KEYS: Dict[str, str] = {
+    "type": "t",
+    "date": "d",
+    "summary": "sm",
+    "status": "st",
+    "conclusions": "cn",
+    "resume": "rs",
+    "rank": "r",
+    "title": "ti",
+    "days_covered": "dc",
+    "evolution": "ev",
+    "final_status": "fs",
+    "key_participants": "kp",
+}
+
+
+def compact_json(obj: Any) -> str:
+    """JSON без пробелов и отступов, кириллица как есть."""
+    return json.dumps(obj, ensure_ascii=False, separators=(",", ":"), default=str)
+
+
+def _is_person(x: Any) -> bool:
+    return isinstance(x, dict) and "name" in x and set(x) <= {"name", "role"}
+
+
+def compact_payload(
+    records: List[Dict[str, Any]],
+    *,
+    short_keys: bool = True,
+    dedupe_people: bool = True,
+) -> str:
+    """
+    {"keys": {короткий: полный}, "people": [{name, role}], "items": [...]}
+
+    short_keys    — поля из SHORT_KEYS заменяются короткими, легенда в "keys";
+    dedupe_people — участники ({name, role}) из списков заменяются индексом в "people".
+    """
+    people: List[Dict[str, Any]] = []
+    people_idx: Dict[str, int] = {}
+    used: Dict[str, str] = {}
+
+    def _person(p: Dict[str, Any]) -> int:
+        key = compact_json(p)
+        if key not in people_idx:
+            people_idx[key] = len(people)
+            people.append(p)
+        return people_idx[key]
+
+    def _value(v: Any) -> Any:
+        if dedupe_people and isinstance(v, list) and v and all(_is_person(x) for x in v):
+            return [_person(x) for x in v]
+        return v
+
+    items = []
+    for rec in records:
+        row = {}
+        for k, v in rec.items():
+            if v is None or v == "" or v == []:
+                continue
+            sk = SHORT_KEYS.get(k, k) if short_keys else k
+            if sk != k:
+                used[sk] = k
+            row[sk] = _value(v)
+        items.append(row)
+
+    obj: Dict[str, Any] = {}
+    if used:
+        obj["keys"] = used
+    if people:
+        obj["people"] = people
+    obj["items"] = items
+    return compact_json(obj)
+
+
+# ─────────── бюджет ───────────
+
+def _truncate(rec: Dict[str, Any], max_chars: int) -> Dict[str, Any]:
+    return {
+        k: (v[: max_chars - 1] + "…" if isinstance(v, str) and len(v) > max_chars else v)
+        for k, v in rec.items()
+    }
+
+
+def _content_size(rec: Dict[str, Any]) -> int:
+    return sum(len(v) for v in rec.values() if isinstance(v, str))
+
+
+def fit_records(
+    records: List[Dict[str, Any]],
+    budget: int,
+    *,
+    rank: Callable[[Dict[str, Any]], Any] | None = None,
+    max_field_chars: int = 1200,
+) -> List[Dict[str, Any]]:
+    """
+    Записи, которые помещаются в budget токенов (в компактной сериализации).
+    Влезающие записи возвращаются как есть. Иначе длинные строковые поля
+    усекаются до max_field_chars; если всё равно не влезает — оставляются
+    записи с наибольшим rank (по умолчанию — самые содержательные),
+    исходный порядок сохраняется.
+    """
+    if count_tokens(compact_payload(records)) <= budget:
+        return records
+    records = [_truncate(r, max_field_chars) for r in records]
+    if count_tokens(compact_payload(records)) <= budget:
+        return records
+
+    rank = rank or _content_size
+    order = sorted(range(len(records)), key=lambda i: rank(records[i]), reverse=True)
+    keep: List[int] = []
+    # легенда ключей + обёртка; записи считаем с полными ключами — оценка сверху
+    used = count_tokens(compact_json({"keys": SHORT_KEYS, "items": []}))
+    for i in order:
+        t = count_tokens(compact_json(records[i])) + 1
+        if used + t > budget:
+            continue
+        keep.append(i)
+        used += t
+    print(f"✂️  Бюджет {budget} токенов: оставлено {len(keep)} из {len(records)} записей")
+    return [records[i] for i in sorted(keep)]
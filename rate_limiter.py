@@ -0,0 +1,311 @@
+# rate_limiter.py
+# ─────────────────────────────────────────────────────────────
+# Общий на процесс ограничитель нагрузки на LLM-эндпоинты:
+#   • token bucket         — не больше N запросов в секунду
+#   • адаптивный параллелизм (AIMD) — на 429/503 окно режется вдвое,
+#     на успехах плавно растёт обратно
+#   • Retry-After          — пауза для всех потоков, а не только для одного
+#   • circuit breaker      — пока эндпоинт лежит, запросы падают сразу
+#
+# Один EndpointLimiter на модель (см. get_limiter); его состояние
+# (snapshot / wait_ready) использует orchestrator для троттлинга воркеров.
+
+from __future__ import annotations
+import email.utils, os, random, threading, time
+from contextlib import contextmanager
+from typing import Any, Dict, Iterator
+
+
+class CircuitOpenError(RuntimeError):
+    """эндпоинт помечен как недоступный — запрос не отправляем."""
+
+
+# ─────────── helpers ───────────
+
+def backoff_delay(attempt: int, base: float, cap: float = 120.0) -> float:
+    """экспоненциальная задержка с jitter: половина фиксированная, половина случайная."""
+    d = min(cap, base * (2 ** attempt))
+    return d / 2 + random.uniform(0, d / 2)
+
+
+def parse_retry_after(value: str | None) -> float | None:
+    """Retry-After: число секунд или HTTP-дата → секунды ожидания."""
+    if not value:
+        return None
+    value = value.strip()
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        when = email.utils.parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+    return max(0.0, when.timestamp() - time.time())
+
+
+# ─────────── building blocks ───────────
+
+class TokenBucket:
+    """rate токенов в секунду, ёмкость burst; rate <= 0 — без ограничения."""
+
+    def __init__(self, rate: float, burst: float) -> None:
+        self.rate = rate
+        self.burst = max(1.0, burst)
+        self._tokens = self.burst
+        self._ts = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self) -> None:
+        if self.rate <= 0:
+            return
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._tokens = min(self.burst, self._tokens + (now - self._ts) * self.rate)
+                self._ts = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                wait = (1 - self._tokens) / self.rate
+            time.sleep(wait)
+
+
+class AdaptiveConcurrency:
+    """AIMD-окно одновременных запросов: +1/limit за успех, ×0.5 за перегрузку."""
+
+    def __init__(self, initial: int, minimum: int = 1, maximum: int = 64) -> None:
+        self.minimum = max(1, minimum)
+        self.maximum = max(self.minimum, maximum)
+        self.limit = float(min(max(initial, self.minimum), self.maximum))
+        self.in_flight = 0
+        self._cond = threading.Condition()
+
+    def acquire(self) -> None:
+        with self._cond:
+            while self.in_flight >= int(self.limit):
+                self._cond.wait()
+            self.in_flight += 1
+
+    def release(self) -> None:
+        with self._cond:
+            self.in_flight -= 1
+            self._cond.notify()
+
+    def on_success(self) -> None:
+        with self._cond:
+            self.limit = min(self.maximum, self.limit + 1 / self.limit)
+            self._cond.notify()
+
+    def on_overload(self) -> None:
+        with self._cond:
+            self.limit = max(self.minimum, self.limit / 2)
+
+
+class CircuitBreaker:
+    """
+    closed    — запросы идут;
+    open      — после failure_threshold ошибок подряд, reset_timeout секунд отказываем сразу;
+    half_open — пропускаем один пробный запрос, по его итогу closed/open
+                (перегрузка 429/503 на пробе — тоже open).
+    """
+
+    def __init__(self, failure_threshold: int = 5, reset_timeout: float = 60.0) -> None:
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.state = "closed"
+        self.failures = 0
+        self._opened_at = 0.0
+        self._probe = False
+        self._lock = threading.Lock()
+        self._probe_done = threading.Condition(self._lock)
+
+    def remaining(self) -> float:
+        """сколько секунд ещё открыт (0 — можно пробовать)."""
+        with self._lock:
+            if self.state != "open":
+                return 0.0
+            return max(0.0, self._opened_at + self.reset_timeout - time.monotonic())
+
+    def wait_probe(self) -> bool:
+        """ждёт итога пробного запроса half_open; True — если ждал."""
+        with self._lock:
+            waited = False
+            while self.state == "half_open" and self._probe:
+                self._probe_done.wait()
+                waited = True
+            return waited
+
+    def allow(self) -> None:
+        with self._lock:
+            if self.state == "open":
+                if time.monotonic() - self._opened_at < self.reset_timeout:
+                    raise CircuitOpenError("circuit open: endpoint is failing, request skipped")
+                self.state = "half_open"
+                self._probe = False
+            if self.state == "half_open":
+                if self._probe:
+                    raise CircuitOpenError("circuit half-open: probe request in flight")
+                self._probe = True
+
+    def record_success(self) -> None:
+        with self._lock:
+            self.state = "closed"
+            self.failures = 0
+            self._probe = False
+            self._probe_done.notify_all()
+
+    def record_failure(self) -> None:
+        with self._lock:
+            self.failures += 1
+            if self.state == "half_open" or self.failures >= self.failure_threshold:
+                self.state = "open"
+                self._opened_at = time.monotonic()
+            self._probe = False
+            self._probe_done.notify_all()
+
+    def record_overload(self) -> None:
+        """429/503: в closed ошибкой не считается, пробу в half_open проваливает."""
+        with self._lock:
+            if self.state == "half_open":
+                self.state = "open"
+                self._opened_at = time.monotonic()
+                self._probe = False
+                self._probe_done.notify_all()
+
+    def release_probe(self) -> None:
+        """проба оборвалась без итога (исключение) — следующий запрос пробует снова."""
+        with self._lock:
+            if self.state == "half_open":
+                self._probe = False
+                self._probe_done.notify_all()
+
+
+# ─────────── per-endpoint limiter ───────────
+
+class EndpointLimiter:
+    """token bucket + адаптивный параллелизм + circuit breaker для одного эндпоинта."""
+
+    def __init__(
+        self,
+        name: str,
+        *,
+        rate: float = 0.0,
+        burst: float = 10.0,
+        concurrency: int = 8,
+        max_concurrency: int = 64,
+        failure_threshold: int = 5,
+        reset_timeout: float = 60.0,
+    ) -> None:
+        self.name = name
+        self.bucket = TokenBucket(rate, burst)
+        self.concurrency = AdaptiveConcurrency(concurrency, maximum=max_concurrency)
+        self.breaker = CircuitBreaker(failure_threshold, reset_timeout)
+        self._blocked_until = 0.0
+        self._lock = threading.Lock()
+        self.stats: Dict[str, int] = {"requests": 0, "ok": 0, "overloaded": 0, "failed": 0, "rejected": 0}
+
+    def _count(self, name: str) -> None:
+        with self._lock:
+            self.stats[name] += 1
+
+    def wait_ready(self) -> None:
+        """
+        блокирует, пока действует Retry-After-пауза, открыт breaker или
+        в half_open идёт пробный запрос (иначе slot() отклонил бы вызов).
+        """
+        while True:
+            with self._lock:
+                pause = self._blocked_until - time.monotonic()
+            pause = max(pause, self.breaker.remaining())
+            if pause > 0:
+                time.sleep(pause)
+                continue
+            if not self.breaker.wait_probe():
+                return
+
+    @contextmanager
+    def slot(self) -> Iterator[None]:
+        """разрешение на один HTTP-запрос: breaker → пауза → bucket → окно параллелизма."""
+        try:
+            self.breaker.allow()
+        except CircuitOpenError:
+            self._count("rejected")
+            raise
+        acquired = False
+        try:
+            with self._lock:
+                pause = self._blocked_until - time.monotonic()
+            if pause > 0:
+                time.sleep(pause)
+            self.bucket.acquire()
+            self.concurrency.acquire()
+            acquired = True
+            self._count("requests")
+            yield
+        except BaseException:
+            # исход запроса не записан — не держим пробу half_open вечно
+            self.breaker.release_probe()
+            raise
+        finally:
+            if acquired:
+                self.concurrency.release()
+
+    def record_success(self) -> None:
+        self._count("ok")
+        self.breaker.record_success()
+        self.concurrency.on_success()
+
+    def record_overload(self, retry_after: float | None = None) -> None:
+        """429/503: сужаем окно и, если сервер просил, ставим общую паузу."""
+        self._count("overloaded")
+        self.concurrency.on_overload()
+        self.breaker.record_overload()
+        if retry_after:
+            with self._lock:
+                self._blocked_until = max(self._blocked_until, time.monotonic() + retry_after)
+
+    def record_failure(self) -> None:
+        """5xx / таймаут / обрыв соединения."""
+        self._count("failed")
+        self.breaker.record_failure()
+
+    def snapshot(self) -> Dict[str, Any]:
+        with self._lock:
+            blocked = max(0.0, self._blocked_until - time.monotonic())
+            stats = dict(self.stats)
+        return {
+            "endpoint": self.name,
+            "state": self.breaker.state,
+            "concurrency_limit": int(self.concurrency.limit),
+            "in_flight": self.concurrency.in_flight,
+            "blocked_for": round(blocked, 1),
+            **stats,
+        }
+
+
+_limiters: Dict[str, EndpointLimiter] = {}
+_registry_lock = threading.Lock()
+
+
+def get_limiter(name: str) -> EndpointLimiter:
+    """общий на процесс лимитер для модели/эндпоинта; параметры — из ELIZA_* env."""
+    with _registry_lock:
+        if name not in _limiters:
+            _limiters[name] = EndpointLimiter(
+                name,
+                rate=float(os.getenv("ELIZA_RPS", "0")),
+                burst=float(os.getenv("ELIZA_BURST", "10")),
+                concurrency=int(os.getenv("ELIZA_CONCURRENCY", "8")),
+                max_concurrency=int(os.getenv("ELIZA_MAX_CONCURRENCY", "64")),
+                failure_threshold=int(os.getenv("ELIZA_BREAKER_FAILURES", "5")),
+                reset_timeout=float(os.getenv("ELIZA_BREAKER_RESET", "60")),
+            )
+        return _limiters[name]
+
+
+def snapshot() -> Dict[str, Dict[str, Any]]:
+    """состояние всех лимитеров процесса."""
+    with _registry_lock:
+        limiters = list(_limiters.values())
+    return {lim.name: lim.snapshot() for lim in limiters}
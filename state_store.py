@@ -0,0 +1,128 @@
+# state_store.py
+# ─────────────────────────────────────────────────────────────
+# Локальное состояние инкрементальных прогонов (SQLite):
+#   fingerprints — отпечаток входа по (канал, день): число сообщений,
+#                  max id и max время правки в tg_raw_enriched
+#   outputs      — какие стадии для (канал, день) уже посчитаны
+#                  на этом отпечатке ("topics", "daily_digest")
+#   ingest_watermarks — до какого сообщения (id, время, время правки)
+#                  чат уже выгружен в tg_raw_enriched (dump --incremental)
+#
+# День пересчитывается, только если отпечаток изменился
+# или нужная стадия ещё не была посчитана.
+
+from __future__ import annotations
+import os, pathlib, sqlite3, threading, time
+from typing import Iterable, NamedTuple, Tuple
+
+
+DB_PATH = os.getenv(
+    "STATE_DB",
+    str(pathlib.Path.home() / ".cache" / "tg_digester" / "state.sqlite"),
+)
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS fingerprints (
+    channel_id  INTEGER NOT NULL,
+    day         TEXT    NOT NULL,
+    fingerprint TEXT    NOT NULL,
+    updated_at  REAL    NOT NULL,
+    PRIMARY KEY (channel_id, day)
+);
+CREATE TABLE IF NOT EXISTS outputs (
+    channel_id  INTEGER NOT NULL,
+    day         TEXT    NOT NULL,
+    stage       TEXT    NOT NULL,
+    fingerprint TEXT    NOT NULL,
+    produced_at REAL    NOT NULL,
+    PRIMARY KEY (channel_id, day, stage)
+);
+CREATE TABLE IF NOT EXISTS ingest_watermarks (
+    chat        TEXT    PRIMARY KEY,
+    chat_id     INTEGER,
+    last_id     INTEGER NOT NULL,
+    last_dttm   TEXT    NOT NULL,
+    last_edit   TEXT,
+    updated_at  REAL    NOT NULL
+);
+"""
+
+
+def fingerprint(msg_count: int, max_id, max_edit) -> str:
+    """отпечаток входа за (канал, день)."""
+    return f"{int(msg_count)}:{max_id}:{max_edit}"
+
+
+EMPTY = fingerprint(0, None, None)      # день без сообщений
+
+
+class Watermark(NamedTuple):
+    chat_id: int | None
+    last_id: int
+    last_dttm: str
+    last_edit: str | None
+    updated_at: float | None = None      # когда выгружали (time.time()); пишет set_watermark
+
+
+class StateStore:
+    """отпечатки входа и посчитанные стадии по (канал, день)."""
+
+    def __init__(self, path: str | os.PathLike = DB_PATH) -> None:
+        self.path = pathlib.Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self._conn = sqlite3.connect(self.path, check_same_thread=False)
+        self._conn.executescript(_SCHEMA)
+        self._lock = threading.Lock()
+
+    def close(self) -> None:
+        self._conn.close()
+
+    def is_fresh(self, channel_id: int, day, fp: str, stage: str) -> bool:
+        """стадия уже посчитана на том же входе → можно пропустить."""
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT fingerprint FROM outputs WHERE channel_id = ? AND day = ? AND stage = ?",
+                (int(channel_id), str(day), stage),
+            ).fetchone()
+        return row is not None and row[0] == fp
+
+    def record(self, channel_id: int, day, fp: str, stage: str) -> None:
+        """запоминает отпечаток входа и факт расчёта стадии."""
+        now = time.time()
+        with self._lock, self._conn:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO fingerprints VALUES (?, ?, ?, ?)",
+                (int(channel_id), str(day), fp, now),
+            )
+            self._conn.execute(
+                "INSERT OR REPLACE INTO outputs VALUES (?, ?, ?, ?, ?)",
+                (int(channel_id), str(day), stage, fp, now),
+            )
+
+    def stale(
+        self,
+        pairs: Iterable[Tuple[int, object]],
+        fps: dict,
+        stage: str,
+    ) -> list[Tuple[int, object]]:
+        """(канал, день), которые нужно пересчитать для стадии."""
+        return [
+            (ch, day) for ch, day in pairs
+            if not self.is_fresh(ch, day, fps.get((int(ch), str(day)), EMPTY), stage)
+        ]
+
+    def watermark(self, chat: str) -> Watermark | None:
+        """докуда чат уже выгружен (None — ещё не выгружался)."""
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT chat_id, last_id, last_dttm, last_edit, updated_at FROM ingest_watermarks WHERE chat = ?",
+                (chat,),
+            ).fetchone()
+        return Watermark(*row) if row else None
+
+    def set_watermark(self, chat: str, wm: Watermark) -> None:
+        with self._lock, self._conn:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO ingest_watermarks VALUES (?, ?, ?, ?, ?, ?)",
+                (chat, wm.chat_id, int(wm.last_id), wm.last_dttm, wm.last_edit, time.time()),
+            )
@@ -0,0 +1,455 @@
+# storage.py
+# ─────────────────────────────────────────────────────────────
+# Хранилище таблиц проекта за одним интерфейсом — ровно те операции,
+# которые используют дайджестеры и orchestrator:
+#   • by_channel_date      — topic_analysis / daily_topics по каналам и датам
+#   • chats                — справочник tg_chats
+#   • messages             — сырые сообщения tg_raw_enriched за интервал
+#   • channels_with_messages / message_fingerprints — агрегаты по tg_raw_enriched
+#   • upsert / upload      — запись по ключу (sort_order в схеме) / заливка целиком
+#
+# Реализации:
+#   YTStorage      — YQL-запросы и upsert через tg_etl (по умолчанию)
+#   SQLiteStorage  — локальный файл: таблица на каждый путь YT (по последнему
+#                    сегменту), индексы по (channel_id, date) / (chat_id, dttm);
+#                    для локальных прогонов и небольших инсталляций
+#   ArchiveStorage — поверх любого из них: tg_raw_enriched читается из
+#                    локального архива выгрузок (tg_archive), остальное — из базового;
+#                    запись сообщений идёт в базовый и дублируется в архив
+#
+# Выбор — STORAGE_BACKEND=yt|sqlite, путь к файлу — STORAGE_PATH;
+# MESSAGES_SOURCE=archive — сообщения читаются из архива.
+# topic_extractor / topic_resumator_chat этот интерфейс не используют: читают
+# tg_raw_enriched и пишут темы в YT напрямую, поэтому interval / extract /
+# resume / watch требуют STORAGE_BACKEND=yt и MESSAGES_SOURCE=storage (require_yt).
+
+from __future__ import annotations
+import datetime as dt
+import abc, json, math, os, pathlib, re, sqlite3, threading
+from typing import Any, Dict, Iterable, List
+
+import pandas as pd
+
+
+BACKEND = os.getenv("STORAGE_BACKEND", "yt")
+MESSAGES_SOURCE = os.getenv("MESSAGES_SOURCE", "storage")
+DB_PATH = os.getenv(
+    "STORAGE_PATH",
+    str(pathlib.Path.home() / ".cache" / "tg_digester" / "storage.sqlite"),
+)
+
+
+def _ids(channel_ids: Iterable[int] | None) -> List[int]:
+    return sorted({int(c) for c in channel_ids or []})
+
+
+class Storage(abc.ABC):
+    """интерфейс хранилища; таблицы адресуются путями YT."""
+
+    @abc.abstractmethod
+    def by_channel_date(
+        self,
+        table: str,
+        columns: List[str],
+        start: dt.date,
+        end: dt.date | None = None,
+        channel_ids: Iterable[int] | None = None,
+        *,
+        order_by: str | None = None,
+    ) -> pd.DataFrame:
+        """строки с date в [start; end] (end=None — один день) и channel_id из channel_ids (пусто — все)."""
+
+    @abc.abstractmethod
+    def chats(self, table: str) -> pd.DataFrame:
+        """tg_chats целиком: chat_id, chat, description."""
+
+    @abc.abstractmethod
+    def messages(
+        self,
+        table: str,
+        start: dt.date,
+        end: dt.date,
+        channel_ids: Iterable[int] | None = None,
+        columns: List[str] | None = None,
+    ) -> pd.DataFrame:
+        """сообщения с днём dttm в [start; end] (columns=None — все колонки)."""
+
+    @abc.abstractmethod
+    def channels_with_messages(self, table: str, start: dt.date, end: dt.date) -> List[int]:
+        """chat_id, у которых есть сообщения в [start; end]."""
+
+    @abc.abstractmethod
+    def message_fingerprints(
+        self,
+        table: str,
+        start: dt.date,
+        end: dt.date,
+        channel_ids: Iterable[int],
+        id_col: str,
+        edit_col: str,
+    ) -> pd.DataFrame:
+        """chat_id, day, msg_count, max_id, max_edit по (канал, день)."""
+
+    @abc.abstractmethod
+    def upsert(self, df: pd.DataFrame, table: str, schema: list) -> None:
+        """запись по ключу (колонки схемы с sort_order)."""
+
+    @abc.abstractmethod
+    def upload(self, df: pd.DataFrame, table: str, schema: list, *, overwrite: bool = False) -> None:
+        """заливка таблицы (overwrite — с заменой содержимого)."""
+
+
+# ─────────── YT ───────────
+def _channel_filter(channel_ids: Iterable[int] | None, column: str) -> str:
+    ids = _ids(channel_ids)
+    if not ids:
+        return ""
+    return f"AND {column} IN ({', '.join(map(str, ids))})"
+
+
+class YTStorage(Storage):
+    """YTsaurus: чтение YQL-запросами, запись через tg_etl."""
+
+    def __init__(self) -> None:
+        from . import tg_etl          # yt/yql-клиенты нужны только этому бэкенду
+        self._etl = tg_etl
+
+    def by_channel_date(self, table, columns, start, end=None, channel_ids=None, *, order_by=None):
+        where = f'date = "{start}"' if end is None else f'date BETWEEN "{start}" AND "{end}"'
+        order = f"ORDER BY {order_by}" if order_by else ""
+        return self._etl.query_yql(
+            f"""
+            SELECT {", ".join(columns)}
+            FROM hahn.`{table}`
+            WHERE {where}
+            {_channel_filter(channel_ids, "channel_id")}
+            {order};
+            """
+        )
+
+    def chats(self, table):
+        return self._etl.query_yql(
+            f"""SELECT chat_id, chat, description
+            FROM hahn.`{table}`;"""
+        )
+
+    def messages(self, table, start, end, channel_ids=None, columns=None):
+        return self._etl.query_yql(
+            f"""
+            SELECT {", ".join(columns) if columns else "*"}
+            FROM hahn.`{table}`
+            WHERE DateTime::MakeDate(DateTime::ParseIso8601(dttm)) BETWEEN Date("{start}") AND Date("{end}")
+              {_channel_filter(channel_ids, "chat_id")}
+            ORDER BY chat_id, dttm;
+            """
+        )
+
+    def channels_with_messages(self, table, start, end):
+        df = self._etl.query_yql(
+            f"""
+            SELECT DISTINCT chat_id
+            FROM hahn.`{table}`
+            WHERE DateTime::MakeDate(DateTime::ParseIso8601(dttm)) BETWEEN Date("{start}") AND Date("{end}");
+            """
+        )
+        return df["chat_id"].tolist()
+
+    def message_fingerprints(self, table, start, end, channel_ids, id_col, edit_col):
+        return self._etl.query_yql(
+            f"""
+            SELECT
+                chat_id,
+                CAST(DateTime::MakeDate(DateTime::ParseIso8601(dttm)) AS String) AS day,
+                COUNT(*) AS msg_count,
+                MAX({id_col}) AS max_id,
+                MAX({edit_col}) AS max_edit
+            FROM hahn.`{table}`
+            WHERE DateTime::MakeDate(DateTime::ParseIso8601(dttm)) BETWEEN Date("{start}") AND Date("{end}")
+              {_channel_filter(channel_ids, "chat_id")}
+            GROUP BY chat_id, day;
+            """
+        )
+
+    def upsert(self, df, table, schema):
+        self._etl.upsert_df_to_yt(df, table, schema)
+
+    def upload(self, df, table, schema, *, overwrite=False):
+        self._etl.upload_df_to_yt(df, table, schema, overwrite=overwrite)
+
+
+# ─────────── SQLite ───────────
+_SQL_TYPES = {
+    "int8": "INTEGER", "int16": "INTEGER", "int32": "INTEGER", "int64": "INTEGER",
+    "uint8": "INTEGER", "uint16": "INTEGER", "uint32": "INTEGER", "uint64": "INTEGER",
+    "boolean": "INTEGER", "double": "REAL", "float": "REAL",
+    "string": "TEXT", "utf8": "TEXT",
+}
+
+# индексы, которые строятся, если в таблице есть эти колонки
+_INDEXES = (("channel_id", "date"), ("chat_id", "dttm"))
+
+
+def _table_name(path: str) -> str:
+    return re.sub(r"\W+", "_", path.rstrip("/").rsplit("/", 1)[-1])
+
+
+def _to_sql(value: Any, yt_type: str) -> Any:
+    if value is None or (isinstance(value, float) and math.isnan(value)):
+        return None
+    if hasattr(value, "item") and not isinstance(value, (list, dict)):
+        value = value.item()                       # numpy-скаляры
+    if yt_type not in _SQL_TYPES:
+        return json.dumps(value, ensure_ascii=False, default=str)     # any / yson
+    if isinstance(value, (dt.date, dt.datetime, pd.Timestamp)):
+        return value.isoformat()
+    if isinstance(value, (list, dict)):
+        return json.dumps(value, ensure_ascii=False, default=str)
+    return value
+
+
+class SQLiteStorage(Storage):
+    """локальный SQLite-файл; схема и ключи таблиц — из схем YT."""
+
+    def __init__(self, path: str | os.PathLike = DB_PATH) -> None:
+        self.path = pathlib.Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self._conn = sqlite3.connect(self.path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS _schemas (name TEXT PRIMARY KEY, schema TEXT NOT NULL)"
+        )
+        self._lock = threading.RLock()
+        self._schemas: Dict[str, list] = {
+            name: json.loads(s) for name, s in self._conn.execute("SELECT name, schema FROM _schemas")
+        }
+
+    def close(self) -> None:
+        self._conn.close()
+
+    # ─────────── схема ───────────
+    def _ensure_table(self, name: str, schema: list) -> None:
+        known = self._schemas.get(name)
+        if known is None:
+            cols = [f'"{c["name"]}" {_SQL_TYPES.get(c["type"], "TEXT")}' for c in schema]
+            keys = [c["name"] for c in schema if c.get("sort_order")]
+            if keys:
+                cols.append(f"PRIMARY KEY ({', '.join(keys)})")
+            self._conn.execute(f'CREATE TABLE IF NOT EXISTS "{name}" ({", ".join(cols)})')
+            names = {c["name"] for c in schema}
+            for idx in _INDEXES:
+                if set(idx) <= names:
+                    self._conn.execute(
+                        f'CREATE INDEX IF NOT EXISTS "{name}_{"_".join(idx)}" ON "{name}" ({", ".join(idx)})'
+                    )
+        else:
+            # новые колонки схемы — ALTER TABLE, ключ не меняется
+            have = {c["name"] for c in known}
+            for c in schema:
+                if c["name"] not in have:
+                    self._conn.execute(
+                        f'ALTER TABLE "{name}" ADD COLUMN "{c["name"]}" {_SQL_TYPES.get(c["type"], "TEXT")}'
+                    )
+            schema = known + [c for c in schema if c["name"] not in have]
+        self._schemas[name] = schema
+        self._conn.execute(
+            "INSERT OR REPLACE INTO _schemas VALUES (?, ?)", (name, json.dumps(schema, ensure_ascii=False))
+        )
+
+    def _query(self, name: str, columns: List[str], sql: str, params: list) -> pd.DataFrame:
+        if name not in self._schemas:
+            return pd.DataFrame(columns=columns)
+        with self._lock:
+            cur = self._conn.execute(sql, params)
+            cols = [d[0] for d in cur.description]
+            rows = cur.fetchall()
+        df = pd.DataFrame.from_records(rows, columns=cols)
+        for c in self._schemas[name]:
+            if c["name"] in df.columns and c["type"] not in _SQL_TYPES:
+                df[c["name"]] = df[c["name"]].map(lambda v: json.loads(v) if isinstance(v, str) else v)
+        return df
+
+    # ─────────── чтение ───────────
+    def by_channel_date(self, table, columns, start, end=None, channel_ids=None, *, order_by=None):
+        name = _table_name(table)
+        ids = _ids(channel_ids)
+        sql = f'SELECT {", ".join(columns)} FROM "{name}" WHERE date BETWEEN ? AND ?'
+        params: list = [str(start), str(end or start)]
+        if ids:
+            sql += f" AND channel_id IN ({', '.join('?' * len(ids))})"
+            params += ids
+        if order_by:
+            sql += f" ORDER BY {order_by}"
+        return self._query(name, columns, sql, params)
+
+    def chats(self, table):
+        name = _table_name(table)
+        return self._query(name, ["chat_id", "chat", "description"],
+                           f'SELECT chat_id, chat, description FROM "{name}"', [])
+
+    def messages(self, table, start, end, channel_ids=None, columns=None):
+        name = _table_name(table)
+        if columns is None:
+            columns = [c["name"] for c in self._schemas.get(name, [])]
+        ids = _ids(channel_ids)
+        sql = f'SELECT {", ".join(columns)} FROM "{name}" WHERE date(dttm) BETWEEN ? AND ?'
+        params: list = [str(start), str(end)]
+        if ids:
+            sql += f" AND chat_id IN ({', '.join('?' * len(ids))})"
+            params += ids
+        return self._query(name, columns, sql + " ORDER BY chat_id, dttm", params)
+
+    def channels_with_messages(self, table, start, end):
+        name = _table_name(table)
+        df = self._query(
+            name, ["chat_id"],
+            f'SELECT DISTINCT chat_id FROM "{name}" WHERE date(dttm) BETWEEN ? AND ?',
+            [str(start), str(end)],
+        )
+        return df["chat_id"].tolist()
+
+    def message_fingerprints(self, table, start, end, channel_ids, id_col, edit_col):
+        name = _table_name(table)
+        ids = _ids(channel_ids)
+        sql = f"""
+            SELECT chat_id, date(dttm) AS day, COUNT(*) AS msg_count,
+                   MAX({id_col}) AS max_id, MAX({edit_col}) AS max_edit
+            FROM "{name}"
+            WHERE date(dttm) BETWEEN ? AND ?"""
+        params: list = [str(start), str(end)]
+        if ids:
+            sql += f" AND chat_id IN ({', '.join('?' * len(ids))})"
+            params += ids
+        sql += " GROUP BY chat_id, day"
+        return self._query(name, ["chat_id", "day", "msg_count", "max_id", "max_edit"], sql, params)
+
+    # ─────────── запись ───────────
+    def _insert(self, df: pd.DataFrame, name: str, schema: list) -> None:
+        types = {c["name"]: c["type"] for c in schema}
+        cols = [c for c in df.columns if c in types]
+        rows = [
+            tuple(_to_sql(rec[c], types[c]) for c in cols)
+            for rec in df.to_dict("records")
+        ]
+        self._conn.executemany(
+            f'INSERT OR REPLACE INTO "{name}" ({", ".join(cols)}) VALUES ({", ".join("?" * len(cols))})',
+            rows,
+        )
+
+    def upsert(self, df, table, schema):
+        name = _table_name(table)
+        with self._lock, self._conn:
+            self._ensure_table(name, schema)
+            self._insert(df, name, schema)
+
+    def upload(self, df, table, schema, *, overwrite=False):
+        name = _table_name(table)
+        with self._lock, self._conn:
+            if overwrite:
+                self._conn.execute(f'DROP TABLE IF EXISTS "{name}"')
+                self._schemas.pop(name, None)
+            self._ensure_table(name, schema)
+            self._insert(df, name, schema)
+
+
+# ─────────── архив ───────────
+MESSAGES_TABLE = os.getenv("YT_MESSAGES_TABLE", "//tmp/ia-nartov/hackathon/tg_raw_enriched")
+
+
+class ArchiveStorage(Storage):
+    """
+    tg_raw_enriched читается из локального архива выгрузок (tg_archive), остальные
+    таблицы — из base. Запись — в base (с тем же overwrite) и копия сообщений в архив.
+    """
+
+    def __init__(self, base: Storage, archive=None) -> None:
+        from . import tg_archive
+        self.base = base
+        self.archive = archive or tg_archive.Archive()
+
+    def _is_messages(self, table: str) -> bool:
+        return _table_name(table) == _table_name(MESSAGES_TABLE)
+
+    def by_channel_date(self, table, columns, start, end=None, channel_ids=None, *, order_by=None):
+        return self.base.by_channel_date(table, columns, start, end, channel_ids, order_by=order_by)
+
+    def chats(self, table):
+        return self.base.chats(table)
+
+    def messages(self, table, start, end, channel_ids=None, columns=None):
+        if not self._is_messages(table):
+            return self.base.messages(table, start, end, channel_ids, columns)
+        df = self.archive.read(start, end, channel_ids, columns)
+        if {"chat_id", "dttm"} <= set(df.columns):
+            df = df.sort_values(["chat_id", "dttm"], kind="stable").reset_index(drop=True)
+        return df
+
+    def channels_with_messages(self, table, start, end):
+        if not self._is_messages(table):
+            return self.base.channels_with_messages(table, start, end)
+        return sorted({chat_id for chat_id, _, _ in self.archive.partitions(start, end)})
+
+    def message_fingerprints(self, table, start, end, channel_ids, id_col, edit_col):
+        if not self._is_messages(table):
+            return self.base.message_fingerprints(table, start, end, channel_ids, id_col, edit_col)
+        from . import tg_archive
+        cols = ["chat_id", "day", "msg_count", "max_id", "max_edit"]
+        df = self.archive.read(start, end, channel_ids, ["chat_id", "dttm", id_col, edit_col])
+        if df.empty:
+            return pd.DataFrame(columns=cols)
+        df["day"] = tg_archive.message_days(df["dttm"])
+        out = df.groupby(["chat_id", "day"], as_index=False).agg(
+            msg_count=(id_col, "size"), max_id=(id_col, "max"), max_edit=(edit_col, "max"),
+        )
+        return out[cols]
+
+    def upsert(self, df, table, schema):
+        self.base.upsert(df, table, schema)
+        if self._is_messages(table):
+            self.archive.append(df)
+
+    def upload(self, df, table, schema, *, overwrite=False):
+        self.base.upload(df, table, schema, overwrite=overwrite)
+        if self._is_messages(table):
+            self.archive.append(df)          # архив append-only: overwrite = новая версия сообщений
+
+
+# ─────────── выбор бэкенда ───────────
+_storage: Storage | None = None
+_storage_lock = threading.Lock()
+
+
+def get_storage() -> Storage:
+    """общее на процесс хранилище (STORAGE_BACKEND)."""
+    global _storage
+    with _storage_lock:
+        if _storage is None:
+            if BACKEND == "sqlite":
+                _storage = SQLiteStorage(DB_PATH)
+            elif BACKEND == "yt":
+                _storage = YTStorage()
+            else:
+                raise ValueError(f"STORAGE_BACKEND={BACKEND!r}: ожидается yt или sqlite")
+            if MESSAGES_SOURCE == "archive":
+                _storage = ArchiveStorage(_storage)
+            elif MESSAGES_SOURCE != "storage":
+                raise ValueError(f"MESSAGES_SOURCE={MESSAGES_SOURCE!r}: ожидается storage или archive")
+        return _storage
+
+
+def require_yt(what: str) -> None:
+    """
+    topic_extractor и topic_resumator_chat читают tg_raw_enriched и пишут
+    daily_topics / topic_analysis только в YT, мимо storage. На другом бэкенде
+    прогон молча не дал бы тем, а с MESSAGES_SOURCE=archive каналы и отпечатки
+    считались бы по архиву, а темы — по таблице YT. Отказываемся сразу.
+    """
+    if BACKEND != "yt":
+        raise RuntimeError(
+            f"{what}: извлечение и анализ тем пишут только в YT, "
+            f"а STORAGE_BACKEND={BACKEND!r}; с этим бэкендом доступны daily / custom"
+        )
+    if MESSAGES_SOURCE != "storage":
+        raise RuntimeError(
+            f"{what}: topic_extractor читает сообщения из YT, а не через storage, "
+            f"поэтому MESSAGES_SOURCE={MESSAGES_SOURCE!r} не поддерживается"
+        )
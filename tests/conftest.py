@@ -0,0 +1,50 @@
+# conftest.py
+# ─────────────────────────────────────────────────────────────
+# Модули проекта импортируются относительно пакета hackathon_project
+# (в Аркадии это каталог junk/ia-nartov/hackathon_project). Локальный
+# checkout может называться иначе — регистрируем корень репозитория
+# как пакет hackathon_project.
+
+import pathlib
+import sys
+import types
+
+ROOT = pathlib.Path(__file__).resolve().parents[1]
+
+if "hackathon_project" not in sys.modules:
+    pkg = types.ModuleType("hackathon_project")
+    pkg.__path__ = [str(ROOT)]
+    sys.modules["hackathon_project"] = pkg
+
+
+# ─────────── стенд LLM ───────────
+import pytest  # noqa: E402
+
+
+@pytest.fixture(scope="session")
+def _mock_llm_server():
+    from hackathon_project.benchmarks import mock_llm
+
+    mock = mock_llm.MockLLM(latency="fixed:0", stream_delay=0)
+    server = mock_llm.start(mock)
+    host, port = server.server_address[:2]
+    yield mock, f"http://{host}:{port}"
+    server.shutdown()
+    server.server_close()
+
+
+@pytest.fixture
+def stand(_mock_llm_server, monkeypatch, tmp_path):
+    """mock_llm с чистыми счётчиками; кэш и лимитеры — свои на тест."""
+    from hackathon_project import eliza_client
+    from hackathon_project import rate_limiter
+
+    mock, url = _mock_llm_server
+    monkeypatch.setattr(mock, "stats", {"requests": 0, "by_model": {}, "errors": 0, "rate_limited": 0, "streams": 0})
+    monkeypatch.setattr(mock, "error_rate", 0.0)
+    monkeypatch.setattr(eliza_client, "_base_url", url)
+    monkeypatch.setattr(eliza_client, "_cache", eliza_client.ResponseCache(tmp_path / "eliza"))
+    monkeypatch.setattr(eliza_client, "_cache_refresh", False)
+    monkeypatch.setattr(rate_limiter, "_limiters", {})
+    monkeypatch.setenv("SOY_TOKEN", "mock")
+    return mock
@@ -0,0 +1,75 @@
+import json
+import threading
+import time
+
+import pandas as pd
+import pytest
+
+from hackathon_project import channel_cache
+from hackathon_project import storage
+
+
+class _SlowChats:
+    def __init__(self):
+        self.calls = 0
+
+    def chats(self, table):
+        self.calls += 1
+        time.sleep(0.05)
+        return pd.DataFrame([{"chat_id": 1, "chat": "Chat", "description": "D"}])
+
+
+def test_expired_cache_is_refreshed_once(monkeypatch):
+    fake = _SlowChats()
+    monkeypatch.setattr(storage, "get_storage", lambda: fake)
+    cache = channel_cache.ChannelCache(ttl=3600, snapshot_path=None)
+
+    threads = [threading.Thread(target=cache.get, args=(1,)) for _ in range(8)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+
+    assert fake.calls == 1
+    assert cache.get(1)["chat"] == "Chat"
+    assert fake.calls == 1
+
+
+class _Chats:
+    def __init__(self):
+        self.calls = 0
+
+    def chats(self, table):
+        self.calls += 1
+        return pd.DataFrame([{"chat_id": 1, "chat": "Chat", "description": "D"}])
+
+
+@pytest.mark.parametrize("body", [
+    '{"loaded_at": 1e18}',                               # нет rows
+    '{"loaded_at": "вчера", "rows": []}',                # loaded_at не число
+    '{"loaded_at": 1e18, "rows": [1, 2]}',               # строки не словари
+    '[1, 2]',
+    '{"loaded_at": 1e18, "rows": [',
+])
+def test_malformed_snapshot_is_ignored(monkeypatch, tmp_path, body):
+    fake = _Chats()
+    monkeypatch.setattr(storage, "get_storage", lambda: fake)
+    snap = tmp_path / "chats.json"
+    snap.write_text(body, encoding="utf-8")
+    cache = channel_cache.ChannelCache(ttl=3600, snapshot_path=snap)
+
+    assert cache.get(1)["chat"] == "Chat"
+    assert fake.calls == 1
+    assert json.loads(snap.read_text(encoding="utf-8"))["rows"][0]["chat_id"] == 1
+
+
+def test_snapshot_write_failure_keeps_refresh(monkeypatch, tmp_path, capsys):
+    fake = _Chats()
+    monkeypatch.setattr(storage, "get_storage", lambda: fake)
+    blocker = tmp_path / "file"
+    blocker.write_text("", encoding="utf-8")
+    cache = channel_cache.ChannelCache(ttl=3600, snapshot_path=blocker / "chats.json")
+
+    assert cache.get(1)["chat"] == "Chat"
+    assert "снапшот каналов не сохранён" in capsys.readouterr().out
+    assert list(tmp_path.iterdir()) == [blocker]
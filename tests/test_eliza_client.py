@@ -0,0 +1,93 @@
+import asyncio
+import random
+
+import pytest
+
+from hackathon_project import eliza_client
+from hackathon_project.benchmarks import mock_llm
+
+
+def _prompt(text):
+    return [{"role": "user", "content": text}]
+
+
+class _Lines:
+    def __init__(self, lines):
+        self.lines = lines
+
+    def iter_lines(self, decode_unicode=False):
+        yield from self.lines
+
+
+# ─────────── eliza_chat ───────────
+@pytest.mark.parametrize("model", ["yandex", "deepseek"])
+def test_eliza_chat_both_formats(stand, model):
+    data = eliza_client.eliza_chat(_prompt("привет"), model=model, verify=False, use_cache=False)
+
+    assert eliza_client._answer_text(data) == mock_llm.answer_for("привет")
+    assert stand.snapshot()["by_model"] == {model: 1}
+
+
+def test_eliza_chat_retries_server_errors(stand, monkeypatch):
+    monkeypatch.setattr(stand, "error_rate", 0.5)
+    monkeypatch.setattr(stand, "_rng", random.Random(1))   # броски 0.13, 0.85: 500, затем 200
+    data = eliza_client.eliza_chat(
+        _prompt("повтор"), model="deepseek", verify=False, use_cache=False, retry_delay=0,
+    )
+
+    assert eliza_client._answer_text(data) == mock_llm.answer_for("повтор")
+    stats = stand.snapshot()
+    assert (stats["requests"], stats["errors"]) == (2, 1)
+
+
+def test_eliza_chat_stream(stand):
+    chunks = eliza_client.eliza_chat(
+        _prompt("поток"), model="yandex", verify=False, stream=True, extra={"stream": True},
+    )
+    try:
+        text = "".join(eliza_client.iter_text(chunks))
+    finally:
+        chunks.close()
+
+    assert text == mock_llm.answer_for("поток")
+    assert stand.snapshot()["streams"] == 1
+
+
+# ─────────── SSE ───────────
+def test_chunks_stop_at_done():
+    resp = _Lines([
+        ": keep-alive",
+        "",
+        'data: {"n": 1}',
+        "event: ping",
+        'data:{"n": 2}',
+        "data: [DONE]",
+        'data: {"n": 3}',
+    ])
+    assert list(eliza_client._chunks(resp)) == [{"n": 1}, {"n": 2}]
+
+
+# ─────────── async ───────────
+def test_achat_many_keeps_order(stand):
+    prompts = [_prompt(f"вопрос {i}") for i in range(6)]
+
+    async def run():
+        async with eliza_client.AsyncElizaClient(model="deepseek", concurrency=3, verify=False) as client:
+            return await client.achat_many(prompts)
+
+    answers = asyncio.run(run())
+
+    assert [eliza_client._answer_text(a) for a in answers] == [
+        mock_llm.answer_for(f"вопрос {i}") for i in range(6)
+    ]
+    assert stand.snapshot()["requests"] == 6
+
+
+def test_astream(stand):
+    async def run():
+        async with eliza_client.AsyncElizaClient(model="deepseek", verify=False) as client:
+            return [c async for c in client.astream(_prompt("async поток"), extra={"stream": True})]
+
+    chunks = asyncio.run(run())
+
+    assert "".join(eliza_client.iter_text(chunks)) == mock_llm.answer_for("async поток")
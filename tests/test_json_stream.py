@@ -0,0 +1,52 @@
+import json
+
+import pytest
+
+from hackathon_project import json_stream
+
+
+ANSWER = {
+    "discussions": ["• запуск [v2], {без} «кавычек»", 'строка с \\"экранированием\\"'],
+    "count": 5,
+    "commitments": [{"who": "Аня", "what": ["a", "b"]}],
+}
+
+
+def _deltas(text, size):
+    return [text[i:i + size] for i in range(0, len(text), size)]
+
+
+@pytest.mark.parametrize("size", [1, 3, 1000])
+def test_object_items_any_split(size):
+    text = "```json\n" + json.dumps(ANSWER, ensure_ascii=False) + "\n```"
+
+    items = list(json_stream.iter_items(_deltas(text, size)))
+
+    assert items == [
+        ("discussions", ANSWER["discussions"][0]),
+        ("discussions", ANSWER["discussions"][1]),
+        ("commitments", ANSWER["commitments"][0]),
+    ]
+
+
+def test_top_level_array_items_arrive_before_end():
+    parser = json_stream.JSONItemStream()
+
+    assert parser.feed('[{"rank": 1, "title": "a"}, {"rank"') == [(None, {"rank": 1, "title": "a"})]
+    assert parser.feed(': 2}]') == [(None, {"rank": 2})]
+    assert parser.done
+
+
+def test_stops_after_root_closes():
+    items = list(json_stream.iter_items(['[1, 2]', ' и ещё [3]']))
+    assert items == [(None, 1), (None, 2)]
+
+
+def test_rejects_non_json():
+    with pytest.raises(ValueError):
+        list(json_stream.iter_items(["x" * (json_stream.MAX_PREAMBLE + 1)]))
+
+
+def test_rejects_malformed_item():
+    with pytest.raises(ValueError):
+        list(json_stream.iter_items(['[{"a": }]']))
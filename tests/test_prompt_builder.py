@@ -0,0 +1,31 @@
+from hackathon_project import prompt_builder
+
+
+def _records(n, size):
+    return [{"summary": f"{i} " + "слово " * size, "status": "решено"} for i in range(n)]
+
+
+def test_fit_records_keeps_fitting_records_intact():
+    records = _records(3, 400)          # поля длиннее max_field_chars
+    budget = prompt_builder.count_tokens(prompt_builder.compact_payload(records))
+
+    assert prompt_builder.fit_records(records, budget) == records
+
+
+def test_fit_records_truncates_only_over_budget():
+    records = _records(3, 400)
+    truncated = prompt_builder.fit_records(records, prompt_builder.count_tokens(
+        prompt_builder.compact_payload(records)) - 1)
+
+    assert len(truncated) == 3
+    assert all(len(r["summary"]) <= 1200 and r["summary"].endswith("…") for r in truncated)
+
+
+def test_fit_records_drops_least_ranked():
+    records = _records(5, 100)
+    one = prompt_builder.count_tokens(prompt_builder.compact_json(records[0]))
+
+    kept = prompt_builder.fit_records(records, 3 * one, rank=lambda r: -int(r["summary"].split()[0]))
+
+    assert 0 < len(kept) < 5
+    assert [int(r["summary"].split()[0]) for r in kept] == list(range(len(kept)))
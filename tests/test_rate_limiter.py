@@ -0,0 +1,144 @@
+import threading
+import time
+
+import pytest
+
+from hackathon_project import rate_limiter
+
+
+RESET = 0.05
+
+
+def _limiter() -> rate_limiter.EndpointLimiter:
+    return rate_limiter.EndpointLimiter("test", failure_threshold=2, reset_timeout=RESET)
+
+
+def _open(lim: rate_limiter.EndpointLimiter) -> None:
+    for _ in range(2):
+        with lim.slot():
+            pass
+        lim.record_failure()
+    assert lim.breaker.state == "open"
+
+
+def test_breaker_recovers_after_overloaded_probe():
+    lim = _limiter()
+    _open(lim)
+    with pytest.raises(rate_limiter.CircuitOpenError):
+        with lim.slot():
+            pass
+
+    time.sleep(RESET * 1.2)
+    with lim.slot():
+        assert lim.breaker.state == "half_open"
+        # пока проба в полёте, остальные запросы отклоняются
+        with pytest.raises(rate_limiter.CircuitOpenError):
+            with lim.slot():
+                pass
+    lim.record_overload(None)            # проба получила 429
+    assert lim.breaker.state == "open"
+    assert lim.breaker.remaining() > 0
+
+    t0 = time.monotonic()
+    lim.wait_ready()                     # ждёт reset_timeout, а не возвращается сразу
+    assert time.monotonic() - t0 >= RESET * 0.5
+
+    with lim.slot():
+        assert lim.breaker.state == "half_open"
+    lim.record_success()
+    assert lim.breaker.state == "closed"
+    with lim.slot():
+        pass
+    lim.record_success()
+    assert lim.stats["overloaded"] == 1
+
+
+def test_probe_exception_releases_probe():
+    lim = _limiter()
+    _open(lim)
+    time.sleep(RESET * 1.2)
+
+    with pytest.raises(ValueError):
+        with lim.slot():
+            raise ValueError("unexpected")
+    assert lim.breaker.state == "half_open"
+
+    # следующий запрос снова становится пробой, а не получает «probe in flight»
+    with lim.slot():
+        pass
+    lim.record_success()
+    assert lim.breaker.state == "closed"
+
+
+def test_overload_in_closed_state_does_not_trip_breaker():
+    lim = _limiter()
+    for _ in range(5):
+        with lim.slot():
+            pass
+        lim.record_overload(None)
+    assert lim.breaker.state == "closed"
+    assert lim.concurrency.limit < 8
+
+
+def test_retry_after_pauses_all_callers():
+    lim = _limiter()
+    lim.record_overload(0.05)
+    t0 = time.monotonic()
+    lim.wait_ready()
+    assert time.monotonic() - t0 >= 0.04
+
+
+def test_concurrency_window_bounds_in_flight():
+    lim = rate_limiter.EndpointLimiter("test", concurrency=2, max_concurrency=2)
+    peak = 0
+    lock = threading.Lock()
+
+    def call():
+        nonlocal peak
+        with lim.slot():
+            with lock:
+                peak = max(peak, lim.concurrency.in_flight)
+            time.sleep(0.01)
+
+    threads = [threading.Thread(target=call) for _ in range(8)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    assert peak == 2
+
+
+@pytest.mark.parametrize("value, expected", [("7", 7.0), ("-3", 0.0), (None, None), ("soon", None)])
+def test_parse_retry_after(value, expected):
+    assert rate_limiter.parse_retry_after(value) == expected
+
+
+def test_wait_ready_blocks_while_probe_in_flight():
+    lim = _limiter()
+    _open(lim)
+    time.sleep(RESET * 1.2)
+    probing = threading.Event()
+    results = []
+
+    def probe():
+        with lim.slot():
+            probing.set()
+            time.sleep(RESET)
+        lim.record_success()
+
+    def worker():
+        probing.wait()
+        lim.wait_ready()
+        try:
+            with lim.slot():
+                results.append(lim.breaker.state)
+        except rate_limiter.CircuitOpenError as e:
+            results.append(e)
+
+    threads = [threading.Thread(target=probe)] + [threading.Thread(target=worker) for _ in range(3)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join(timeout=5)
+
+    assert results == ["closed"] * 3
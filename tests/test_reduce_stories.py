@@ -0,0 +1,88 @@
+import datetime as dt
+import json
+
+import pandas as pd
+
+from hackathon_project import custom_date_digester as cdd
+
+
+CHANNEL = pd.Series({"chat": "Chat", "description": "D"})
+
+
+def _stories(n):
+    # rank то числом, то строкой — как бывает в ответах LLM
+    return [
+        {"rank": i if i % 2 else str(i), "title": f"story {i}", "summary": "x" * 200}
+        for i in range(n, 0, -1)
+    ]
+
+
+def _patch_llm(monkeypatch, merge):
+    calls = []
+
+    def fake_chat(prompt, **kw):
+        calls.append(prompt)
+        return {"response": {"Responses": [{"Response": json.dumps(merge(prompt), ensure_ascii=False)}]}}
+
+    monkeypatch.setattr(cdd, "_prompt_merge", lambda start, end, channel, batch: batch)
+    monkeypatch.setattr(cdd.eliza_client, "eliza_chat", fake_chat)
+    return calls
+
+
+def _reduce(stories, budget):
+    return cdd._reduce_stories(
+        dt.date(2025, 1, 1), dt.date(2025, 1, 31), CHANNEL, stories,
+        model="yandex", verify=False, budget=budget, workers=2,
+    )
+
+
+def test_reduce_stops_when_batches_do_not_shrink(monkeypatch):
+    calls = _patch_llm(monkeypatch, merge=lambda batch: batch)     # LLM ничего не сливает
+    stories = _stories(30)
+    budget = cdd._approx_tokens(stories[:3])
+
+    out = _reduce(stories, budget)
+
+    assert [cdd._rank(s) for s in out] == list(range(1, 11))
+    assert len(calls) <= len(cdd._split_by_budget(stories, budget))
+
+
+def test_reduce_converges_when_batches_shrink(monkeypatch):
+    calls = _patch_llm(monkeypatch, merge=lambda batch: batch[:1])
+    stories = _stories(30)
+
+    out = _reduce(stories, cdd._approx_tokens(stories[:3]))
+
+    assert len(out) == 1
+    assert len(calls) > 1
+
+
+def test_reduce_round_cap(monkeypatch):
+    # каждый уровень теряет по одному сюжету — сходилось бы очень долго
+    calls = _patch_llm(monkeypatch, merge=lambda batch: batch[:-1] if len(batch) > 1 else batch)
+    monkeypatch.setattr(cdd, "MAX_REDUCE_ROUNDS", 2)
+    stories = _stories(40)
+    budget = cdd._approx_tokens(stories[:10])
+    first = len(cdd._split_by_budget(stories, budget))
+
+    out = _reduce(stories, budget)
+
+    assert [cdd._rank(s) for s in out] == sorted(cdd._rank(s) for s in out)
+    assert len(out) == 10
+    assert len(calls) <= 2 * first
+
+
+def test_rank_coerces_mixed_values():
+    ranked = sorted([{"rank": "2"}, {"rank": 1}, {}, {"rank": None}, {"rank": "x"}], key=cdd._rank)
+    assert [s.get("rank") for s in ranked[:2]] == [1, "2"]
+
+
+def test_merge_prompt_keeps_story_format():
+    story = {
+        "rank": 1, "title": "t", "days_covered": ["2025-01-21"],
+        "key_participants": [{"name": "Аня", "role": "автор"}],
+    }
+    content = cdd._prompt_merge(dt.date(2025, 1, 1), dt.date(2025, 1, 31), CHANNEL, [story, story])[0]["content"]
+    payload = json.loads(content.split("json\n", 1)[1].split("\n\n", 1)[0])
+
+    assert payload == {"items": [story, story]}
@@ -0,0 +1,27 @@
+import datetime as dt
+
+from hackathon_project import custom_date_digester as cdd
+
+
+def test_day_intervals():
+    assert cdd._day_intervals(["2025-01-21", "2025-01-22", "2025-01-23", "2025-01-25"]) == "21-23, 25"
+    assert cdd._day_intervals(["2025-01-31", "2025-02-01"]) == "31.01-01.02"
+
+
+def test_day_intervals_skips_bad_days():
+    assert cdd._day_intervals(["вчера", "2025-13-01", None, "2025-01-21"]) == "21"
+    assert cdd._day_intervals("вчера") == ""
+    assert cdd._day_intervals(None) == ""
+
+
+def test_render_post_tolerates_llm_garbage():
+    stories = [
+        {"rank": "2", "title": None, "summary": "второй", "days_covered": ["вчера"]},
+        {"rank": 1, "title": " первый ", "summary": None, "days_covered": ["2025-01-21"]},
+        {"title": "без ранга", "summary": "s"},
+    ]
+    post = cdd._render_post(dt.date(2025, 1, 20), dt.date(2025, 1, 26), stories)
+    lines = post.splitlines()
+    assert lines[1] == "• [21] первый: "
+    assert lines[2] == "• : второй"
+    assert lines[3] == "• без ранга: s"
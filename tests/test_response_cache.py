@@ -0,0 +1,46 @@
+import os
+
+from hackathon_project import eliza_client
+from hackathon_project.benchmarks import mock_llm
+
+
+def _prompt(text):
+    return [{"role": "user", "content": text}]
+
+
+def test_cache_hit_skips_request(stand):
+    first = eliza_client.eliza_chat(_prompt("кэш"), model="deepseek", verify=False)
+    second = eliza_client.eliza_chat(_prompt("кэш"), model="deepseek", verify=False)
+
+    assert first == second
+    assert stand.snapshot()["requests"] == 1
+    assert eliza_client.cache_stats()["hits"] == 1
+
+
+def test_cache_key_includes_endpoint():
+    msgs = _prompt("x")
+    assert eliza_client.cache_key("yandex", msgs, url="http://a/x") != eliza_client.cache_key("yandex", msgs, url="http://b/x")
+    assert eliza_client.cache_key("yandex", msgs, url="http://a/x") == eliza_client.cache_key("yandex", msgs, url="http://a/x")
+
+
+def test_cache_write_failure_keeps_response(stand, monkeypatch):
+    def broken(self, key, value):
+        raise OSError("disk full")
+
+    monkeypatch.setattr(eliza_client.ResponseCache, "put", broken)
+    data = eliza_client.eliza_chat(_prompt("диск"), model="yandex", verify=False)
+
+    assert eliza_client._answer_text(data) == mock_llm.answer_for("диск")
+
+
+def test_response_cache_evicts_oldest(tmp_path):
+    cache = eliza_client.ResponseCache(tmp_path, max_bytes=100)
+    cache.max_age = float("inf")
+    for i in range(5):
+        key = f"{i:02d}" + "k" * 62
+        cache.put(key, {"v": "x" * 30})
+        os.utime(cache._file(key), (1000 + i, 1000 + i))     # 00 — самый давний
+
+    assert cache.evict() == 3
+    assert cache.get("00" + "k" * 62) is None
+    assert cache.get("04" + "k" * 62) == {"v": "x" * 30}
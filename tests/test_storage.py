@@ -0,0 +1,69 @@
+import datetime as dt
+
+import pandas as pd
+import pytest
+
+from hackathon_project import storage
+
+
+def test_incomplete_backend_fails_on_construction():
+    class _ReadOnly(storage.Storage):
+        def chats(self, table):
+            return None
+
+    with pytest.raises(TypeError):
+        _ReadOnly()
+
+
+def test_sqlite_storage_implements_interface(tmp_path):
+    st = storage.SQLiteStorage(str(tmp_path / "s.sqlite"))
+    assert isinstance(st, storage.Storage)
+    st.close()
+
+
+def test_topics_require_yt(monkeypatch):
+    monkeypatch.setattr(storage, "BACKEND", "sqlite")
+    with pytest.raises(RuntimeError, match="interval"):
+        storage.require_yt("interval")
+
+    monkeypatch.setattr(storage, "BACKEND", "yt")
+    storage.require_yt("interval")
+
+
+def test_topics_reject_archive_messages(monkeypatch):
+    monkeypatch.setattr(storage, "BACKEND", "yt")
+    monkeypatch.setattr(storage, "MESSAGES_SOURCE", "archive")
+    with pytest.raises(RuntimeError, match="MESSAGES_SOURCE"):
+        storage.require_yt("watch")
+
+
+class _FakeArchive:
+    def __init__(self):
+        self.appended = []
+
+    def append(self, df):
+        self.appended.append(df)
+        return 1
+
+
+def test_archive_storage_tees_messages(tmp_path):
+    base = storage.SQLiteStorage(str(tmp_path / "s.sqlite"))
+    archive = _FakeArchive()
+    st = storage.ArchiveStorage(base, archive)
+    schema = [
+        {"name": "chat_id", "type": "int64", "sort_order": "ascending"},
+        {"name": "message_id", "type": "int64", "sort_order": "ascending"},
+        {"name": "dttm", "type": "string"},
+    ]
+
+    def _msgs(*ids):
+        return pd.DataFrame([{"chat_id": 1, "message_id": i, "dttm": "2025-01-21T10:00:00+00:00"} for i in ids])
+
+    st.upload(_msgs(1, 2), storage.MESSAGES_TABLE, schema, overwrite=True)
+    st.upload(_msgs(3), storage.MESSAGES_TABLE, schema, overwrite=True)     # удалённые 1, 2 уходят из base
+    st.upsert(_msgs(4), storage.MESSAGES_TABLE, schema)
+
+    got = base.messages(storage.MESSAGES_TABLE, dt.date(2025, 1, 21), dt.date(2025, 1, 21))
+    assert sorted(got["message_id"]) == [3, 4]
+    assert [len(df) for df in archive.appended] == [2, 1, 1]
+    base.close()
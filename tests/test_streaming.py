@@ -0,0 +1,60 @@
+import json
+
+import pytest
+
+from hackathon_project import custom_date_digester as cdd
+from hackathon_project import eliza_client
+
+
+class _FakeResponse:
+    """requests.Response со SSE-телом; помнит, закрыли ли его."""
+
+    def __init__(self, text: str, pieces: int = 40):
+        step = max(1, len(text) // pieces)
+        self._lines = [
+            "data: " + json.dumps({"choices": [{"delta": {"content": text[i:i + step]}}]})
+            for i in range(0, len(text), step)
+        ] + ["data: [DONE]"]
+        self.closed = False
+        self.read = 0
+
+    def iter_lines(self, decode_unicode=False):
+        for line in self._lines:
+            self.read += 1
+            yield line
+
+    def close(self):
+        self.closed = True
+
+
+def _patch_stream(monkeypatch, text):
+    resp = _FakeResponse(text)
+    monkeypatch.setattr(
+        eliza_client, "eliza_chat", lambda *a, **kw: eliza_client.ChunkStream(resp)
+    )
+    return resp
+
+
+def test_stream_stories_closes_response_on_early_break(monkeypatch):
+    stories = [{"rank": i, "title": f"t{i}"} for i in range(1, 16)]
+    resp = _patch_stream(monkeypatch, json.dumps(stories))
+
+    out = cdd._stream_stories([], model="deepseek", verify=False)
+
+    assert len(out) == 10
+    assert resp.closed
+    assert resp.read < len(resp._lines)      # хвост потока не дочитывался
+
+
+def test_stream_stories_closes_response_on_invalid_json(monkeypatch):
+    resp = _patch_stream(monkeypatch, '[1, 2, 3]')
+
+    with pytest.raises(ValueError):
+        cdd._stream_stories([], model="deepseek", verify=False)
+    assert resp.closed
+
+
+def test_chunk_stream_close_before_iteration():
+    resp = _FakeResponse("[]")
+    eliza_client.ChunkStream(resp).close()
+    assert resp.closed
@@ -0,0 +1,28 @@
+import datetime as dt
+
+import pandas as pd
+import pytest
+
+from hackathon_project import tg_archive
+
+
+def test_message_days_mixed_iso_formats():
+    days = tg_archive.message_days(pd.Series([
+        "2025-01-21T23:30:00-03:00", "2025-01-21 10:00:00", "2025-01-21T10:00:00.123456Z", "вчера", None,
+    ]))
+    assert days.tolist()[:3] == ["2025-01-22", "2025-01-21", "2025-01-21"]
+    assert days.iloc[3:].isna().all()
+
+
+def test_append_reports_unparsable_dttm(tmp_path, capsys):
+    pytest.importorskip("pyarrow")
+    archive = tg_archive.Archive(tmp_path, compression="none")
+    df = pd.DataFrame([
+        {"chat_id": 1, "message_id": 1, "dttm": "2025-01-21T10:00:00+00:00", "text": "ok"},
+        {"chat_id": 1, "message_id": 2, "dttm": "вчера", "text": "lost"},
+    ])
+
+    assert archive.append(df) == 1
+    assert "1 из 2" in capsys.readouterr().out
+    got = archive.read(dt.date(2025, 1, 21), dt.date(2025, 1, 21))
+    assert got["message_id"].tolist() == [1]
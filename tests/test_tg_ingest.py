@@ -0,0 +1,153 @@
+import datetime as dt
+import importlib
+import sys
+import types
+
+import pandas as pd
+import pytest
+
+from hackathon_project import storage
+
+
+TABLE = "//tmp/test/tg_raw_enriched"
+SCHEMA = [
+    {"name": "chat_id", "type": "int64", "sort_order": "ascending"},
+    {"name": "message_id", "type": "int64", "sort_order": "ascending"},
+    {"name": "dttm", "type": "string"},
+    {"name": "edit_dttm", "type": "string"},
+    {"name": "text", "type": "string"},
+]
+NOW = dt.datetime.now(dt.timezone.utc)
+
+
+class _FloodWaitError(Exception):
+    def __init__(self, seconds):
+        super().__init__(f"wait {seconds}")
+        self.seconds = seconds
+
+
+def _history(chat_id, n):
+    """сообщения от новых к старым, по одному в час."""
+    return [
+        types.SimpleNamespace(chat_id=chat_id, id=i, date=NOW - dt.timedelta(hours=n - i))
+        for i in range(n, 0, -1)
+    ]
+
+
+class _FakeClient:
+    def __init__(self, history, broken=(), flood=()):
+        self.history = history
+        self.broken = set(broken)       # чат падает на второй странице
+        self.flood = set(flood)         # чат один раз получает FloodWait
+        self.requests = {}
+        self.disconnected = False
+
+    async def start(self):
+        pass
+
+    async def disconnect(self):
+        self.disconnected = True
+
+    async def get_entity(self, chat):
+        return chat
+
+    async def get_messages(self, entity, limit, offset_date=None, offset_id=None):
+        n = self.requests[entity] = self.requests.get(entity, 0) + 1
+        if entity in self.flood:
+            self.flood.discard(entity)
+            raise _FloodWaitError(0)
+        if entity in self.broken and n > 1:
+            raise ValueError("no access")
+        msgs = self.history[entity]
+        if offset_id:
+            msgs = [m for m in msgs if m.id < offset_id]
+        if offset_date:
+            msgs = [m for m in msgs if m.date < offset_date]
+        return msgs[:limit]
+
+
+async def _enrich(client, entity, messages):
+    return pd.DataFrame([
+        {"chat_id": m.chat_id, "message_id": m.id, "dttm": m.date.isoformat(),
+         "edit_dttm": None, "text": f"{entity} {m.id}"}
+        for m in messages
+    ])
+
+
+@pytest.fixture
+def ingest(monkeypatch, tmp_path):
+    etl = types.ModuleType("hackathon_project.tg_etl")
+    etl.enrich_messages = _enrich
+    monkeypatch.setitem(sys.modules, "hackathon_project.tg_etl", etl)
+    monkeypatch.delitem(sys.modules, "hackathon_project.tg_ingest", raising=False)
+    mod = importlib.import_module("hackathon_project.tg_ingest")
+    monkeypatch.setattr(mod, "TG_PAGE_ROWS", 10)
+
+    st = storage.SQLiteStorage(tmp_path / "storage.sqlite")
+    monkeypatch.setattr(storage, "get_storage", lambda: st)
+    yield mod, st
+    st.close()
+
+
+def _rows(st):
+    df = st.messages(TABLE, dt.date(2000, 1, 1), dt.date(2100, 1, 1))
+    return sorted(zip(df["chat_id"], df["message_id"]))
+
+
+def test_full_dump_pages_one_client(monkeypatch, ingest):
+    tg_ingest, st = ingest
+    client = _FakeClient({"a": _history(1, 25), "b": _history(2, 100)}, flood={"a"})
+    monkeypatch.setattr(tg_ingest, "_client", lambda: client)
+
+    written = tg_ingest.full_dump(["a", "b"], TABLE, SCHEMA, days_back_start=2)
+
+    # b: за двое суток 48 сообщений из 100; листание останавливается на первом старом
+    assert written == 25 + 48
+    assert _rows(st) == [(1, i) for i in range(1, 26)] + [(2, i) for i in range(53, 101)]
+    assert client.requests == {"a": 1 + 3, "b": 5}
+    assert client.disconnected
+
+
+def test_full_dump_keeps_table_when_chat_fails(monkeypatch, ingest):
+    tg_ingest, st = ingest
+    st.upload(
+        pd.DataFrame([{"chat_id": 7, "message_id": 1, "dttm": "2024-01-01T00:00:00+00:00",
+                       "edit_dttm": None, "text": "old"}]),
+        TABLE, SCHEMA, overwrite=True,
+    )
+    client = _FakeClient({"a": _history(1, 5), "b": _history(2, 30)}, broken={"b"})
+    monkeypatch.setattr(tg_ingest, "_client", lambda: client)
+
+    with pytest.raises(RuntimeError, match="b"):
+        tg_ingest.full_dump(["a", "b"], TABLE, SCHEMA, days_back_start=3)
+
+    assert _rows(st) == [(7, 1)]
+    assert client.disconnected
+
+
+def test_incremental_window_anchored_on_last_dump(monkeypatch, ingest, tmp_path):
+    tg_ingest, st = ingest
+    store_path = tmp_path / "state.sqlite"
+    monkeypatch.setattr(
+        tg_ingest.state_store, "StateStore",
+        lambda real=tg_ingest.state_store.StateStore: real(store_path),
+    )
+    # тихий чат: последнее сообщение месяц назад, выгружали час назад
+    quiet = [
+        types.SimpleNamespace(chat_id=1, id=i, date=NOW - dt.timedelta(days=30, hours=100 - i))
+        for i in range(100, 0, -1)
+    ]
+    fresh = [types.SimpleNamespace(chat_id=1, id=101, date=NOW - dt.timedelta(days=40))]
+    store = tg_ingest.state_store.StateStore()
+    store.set_watermark("a", tg_ingest.state_store.Watermark(1, 100, quiet[0].date.isoformat(), None))
+    store.close()
+    client = _FakeClient({"a": fresh + quiet})
+    monkeypatch.setattr(tg_ingest, "_client", lambda: client)
+
+    written = tg_ingest.incremental_dump(["a"], TABLE, SCHEMA, lookback_hours=48)
+
+    # новое по id берётся даже со старой датой; за месяц назад не листаем
+    assert written == 1
+    assert client.requests == {"a": 1}
+    wm = tg_ingest.state_store.StateStore().watermark("a")
+    assert wm.last_id == 101 and wm.updated_at is not None
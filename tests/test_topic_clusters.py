@@ -0,0 +1,35 @@
+import numpy as np
+
+from hackathon_project import topic_clusters
+
+
+def _topic(summary, status="", conclusions=""):
+    return {"summary": summary, "status": status, "conclusions": conclusions}
+
+
+ITEMS = [
+    _topic("Релиз мобильного приложения перенесли на пятницу", "ждём ревью", "релиз в пятницу"),
+    _topic("Бюджет маркетинга на квартал согласован", "согласовано", "бюджет утверждён"),
+    _topic("Релиз мобильного приложения переносится на пятницу", "ревью", "релиз мобильного приложения"),
+    _topic("Миграция базы данных на новый кластер в пятницу", "в работе", "миграция к понедельнику"),
+]
+
+
+def test_near_duplicates_merge_unrelated_stay_apart():
+    # 3 делит с 0 и 2 только «пятницу» — близость ниже порога
+    assert topic_clusters.cluster(ITEMS, threshold=topic_clusters.CLUSTER_THRESHOLD) == [[0, 2], [1], [3]]
+
+
+def test_fewer_than_two_items():
+    assert topic_clusters.cluster([]) == []
+    assert topic_clusters.cluster(ITEMS[:1]) == [[0]]
+
+
+def test_empty_texts_are_zero_vectors_and_singletons():
+    items = [_topic(""), ITEMS[0], _topic("и на не"), ITEMS[2]]
+
+    x = topic_clusters.tfidf([topic_clusters.item_text(it) for it in items])
+
+    assert np.isfinite(x).all()
+    assert np.allclose(np.linalg.norm(x, axis=1), [0, 1, 0, 1])
+    assert topic_clusters.cluster(items) == [[0], [1, 3], [2]]
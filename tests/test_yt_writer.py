@@ -0,0 +1,125 @@
+import os
+import threading
+
+import pytest
+
+from hackathon_project import storage
+from hackathon_project import yt_writer
+
+
+TABLE = "//tmp/test/daily_digest"
+SCHEMA = [
+    {"name": "digest_id", "type": "string", "sort_order": "ascending"},
+    {"name": "digest_text", "type": "string"},
+]
+
+
+class _FakeStorage:
+    def __init__(self):
+        self.fail = False
+        self.rows = {}
+        self.entered = threading.Event()
+        self.release = threading.Event()
+        self.release.set()
+
+    def upsert(self, df, table, schema):
+        self.entered.set()
+        self.release.wait(5)
+        if self.fail:
+            raise RuntimeError("yt is down")
+        for rec in df.to_dict("records"):
+            self.rows[rec["digest_id"]] = rec["digest_text"]
+
+
+@pytest.fixture
+def fake(monkeypatch):
+    st = _FakeStorage()
+    monkeypatch.setattr(storage, "get_storage", lambda: st)
+    return st
+
+
+def _writer(path):
+    return yt_writer.BufferedWriter(path, batch_size=100, flush_interval=3600)
+
+
+def _orphan(spill_dir):
+    """spill текущего процесса → spill «умершего» процесса."""
+    for f in spill_dir.glob(f"*.{os.getpid()}.jsonl"):
+        f.rename(f.with_name(f.name.replace(f".{os.getpid()}.", ".999999999.")))
+
+
+def test_flush_raises_and_keeps_rows(tmp_path, fake):
+    w = _writer(tmp_path)
+    w.write(TABLE, SCHEMA, {"digest_id": "a", "digest_text": "v1"})
+    fake.fail = True
+    with pytest.raises(yt_writer.WriteError) as exc:
+        w.flush(TABLE)
+    assert TABLE in exc.value.failed
+    assert w.pending() == {TABLE: 1}
+
+    fake.fail = False
+    w.flush()
+    assert fake.rows == {"a": "v1"}
+    assert w.pending() == {}
+    w.close()
+
+
+def test_flush_keeps_latest_row_per_key(tmp_path, fake):
+    w = _writer(tmp_path)
+    w.write(TABLE, SCHEMA, {"digest_id": "a", "digest_text": "old"})
+    w.write(TABLE, SCHEMA, {"digest_id": "a", "digest_text": "new"})
+    w.flush()
+    assert fake.rows == {"a": "new"}
+    w.close()
+
+
+def test_spill_replay_does_not_overwrite_newer_rows(tmp_path, fake):
+    # процесс A записал строки в spill и умер, не дойдя до YT
+    a = _writer(tmp_path)
+    a.write(TABLE, SCHEMA, {"digest_id": "k", "digest_text": "stale"})
+    a.write(TABLE, SCHEMA, {"digest_id": "other", "digest_text": "only in spill"})
+    a._stop.set()
+    a._buffers.clear()
+
+    # процесс B, живший параллельно, позже пересчитал и записал k
+    b = _writer(tmp_path)
+    _orphan(tmp_path)
+    b.write(TABLE, SCHEMA, {"digest_id": "k", "digest_text": "fresh"})
+    b.flush()
+    b.close()
+
+    # процесс C подбирает spill A: k старее записанного, other — нет
+    c = _writer(tmp_path)
+    c.flush()
+    c.close()
+    assert fake.rows == {"k": "fresh", "other": "only in spill"}
+    assert not list(tmp_path.glob("*.jsonl"))
+
+
+@pytest.mark.parametrize("fail", [False, True])
+def test_write_during_upsert_is_not_blocked_or_lost(tmp_path, fake, fail):
+    w = _writer(tmp_path)
+    w.write(TABLE, SCHEMA, {"digest_id": "a", "digest_text": "v1"})
+    fake.fail = fail
+    fake.release.clear()
+    flusher = threading.Thread(target=w.flush, kwargs={"raise_errors": False})
+    flusher.start()
+    assert fake.entered.wait(5)
+
+    # upsert висит — write() не ждёт его
+    writer = threading.Thread(target=w.write, args=(TABLE, SCHEMA, {"digest_id": "b", "digest_text": "v2"}))
+    writer.start()
+    writer.join(1)
+    alive = writer.is_alive()
+    fake.release.set()
+    flusher.join()
+    writer.join()
+    assert not alive
+
+    assert w.pending() == {TABLE: 2 if fail else 1}
+    assert fake.rows == ({} if fail else {"a": "v1"})
+    fake.fail = False
+    w.flush()
+    assert fake.rows == {"a": "v1", "b": "v2"}
+    assert not list(tmp_path.glob("*.jsonl"))
+    w.close()
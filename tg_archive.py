@@ -0,0 +1,181 @@
+# tg_archive.py
+# ─────────────────────────────────────────────────────────────
+# Локальный архив выгрузок Telegram для офлайн-повторов (dump --archive).
+#
+# Раскладка: <TG_ARCHIVE_DIR>/chat_id=<id>/day=<YYYY-MM-DD>/<ns>-<pid>.arrow
+#   • append-only: каждая запись — новый сегмент (Arrow IPC, колоночный),
+#     существующие файлы не переписываются; сегмент появляется атомарно
+#   • сжатие TG_ARCHIVE_COMPRESSION = zstd | lz4 | none; без сжатия сегмент
+#     читается из memory map без копирования
+#   • чтение — по каталогам (канал, день) интервала; одно сообщение в
+#     нескольких сегментах (правки, повторные выгрузки) — берётся последний
+#   • TG_ARCHIVE_AS_OF (ISO-время) — читать архив таким, каким он был на этот
+#     момент: повтор прогона на том же входе
+#
+# Конвейер читает tg_raw_enriched из архива при MESSAGES_SOURCE=archive
+# (см. storage.ArchiveStorage). Нужен pyarrow.
+
+from __future__ import annotations
+import datetime as dt
+import json, os, pathlib, time
+from typing import Any, Dict, Iterable, Iterator, List, Tuple
+
+import pandas as pd
+
+from . import metrics
+
+
+ARCHIVE_DIR = os.getenv(
+    "TG_ARCHIVE_DIR",
+    str(pathlib.Path.home() / ".cache" / "tg_digester" / "archive"),
+)
+COMPRESSION = os.getenv("TG_ARCHIVE_COMPRESSION", "zstd")
+AS_OF       = os.getenv("TG_ARCHIVE_AS_OF") or None
+
+MSG_ID_COL = os.getenv("MSG_ID_COLUMN", "message_id")
+
+_SUFFIX = ".arrow"
+
+
+def _arrow():
+    try:
+        import pyarrow as pa
+        import pyarrow.ipc  # noqa: F401
+    except ImportError as e:
+        raise ImportError("архиву нужен pyarrow: pip install pyarrow") from e
+    return pa
+
+
+def message_days(dttm: pd.Series) -> pd.Series:
+    """
+    день сообщения в UTC — как date(dttm) в SQLite и DateTime::MakeDate в YQL;
+    неразборчивый dttm — NaN. format="ISO8601" (pandas >= 2.0) принимает
+    ISO-строки со смещением и без вперемешку.
+    """
+    return pd.to_datetime(dttm, utc=True, errors="coerce", format="ISO8601").dt.strftime("%Y-%m-%d")
+
+
+def _as_of_ns(as_of: str | dt.datetime | None) -> int | None:
+    if as_of is None:
+        return None
+    ts = pd.Timestamp(as_of)
+    return (ts.tz_localize("UTC") if ts.tzinfo is None else ts).value
+
+
+class Archive:
+    """append-only архив сообщений по (канал, день)."""
+
+    def __init__(self, root: str | os.PathLike = ARCHIVE_DIR, compression: str = COMPRESSION) -> None:
+        self.root = pathlib.Path(root)
+        self.compression = None if compression in ("", "none") else compression
+
+    # ─────────── запись ───────────
+    def _table(self, df: pd.DataFrame):
+        pa = _arrow()
+        try:
+            return pa.Table.from_pandas(df, preserve_index=False)
+        except (pa.ArrowInvalid, pa.ArrowTypeError):
+            # разнотипные any-колонки (реакции, вложения) — в JSON-строки
+            df = df.copy()
+            for col in df.columns[df.dtypes == object]:
+                if df[col].map(lambda v: isinstance(v, (list, dict))).any():
+                    df[col] = df[col].map(
+                        lambda v: None if v is None else json.dumps(v, ensure_ascii=False, default=str)
+                    )
+            return pa.Table.from_pandas(df, preserve_index=False)
+
+    def append(self, df: pd.DataFrame) -> int:
+        """дописывает сообщения (нужны chat_id и dttm); возвращает число сегментов."""
+        if df.empty:
+            return 0
+        pa = _arrow()
+        options = pa.ipc.IpcWriteOptions(compression=self.compression)
+        days = message_days(df["dttm"])
+        bad = int(days.isna().sum())
+        if bad:
+            # groupby молча выбросил бы такие строки
+            metrics.inc("archive.bad_dttm", bad)
+            print(f"⚠️ архив: {bad} из {len(df)} сообщений без разборчивого dttm не записаны")
+        written = 0
+        for (chat_id, day), part in df.groupby([df["chat_id"], days], sort=False):
+            folder = self.root / f"chat_id={int(chat_id)}" / f"day={day}"
+            folder.mkdir(parents=True, exist_ok=True)
+            path = folder / f"{time.time_ns()}-{os.getpid()}{_SUFFIX}"
+            tmp = path.with_suffix(".tmp")
+            table = self._table(part)
+            with pa.OSFile(str(tmp), "wb") as sink, pa.ipc.new_file(sink, table.schema, options=options) as w:
+                w.write_table(table)
+            os.replace(tmp, path)
+            written += 1
+        return written
+
+    # ─────────── чтение ───────────
+    def _chat_dirs(self, channel_ids: Iterable[int] | None) -> Iterator[Tuple[int, pathlib.Path]]:
+        ids = {int(c) for c in channel_ids or []}
+        if not self.root.exists():
+            return
+        for d in sorted(self.root.glob("chat_id=*")):
+            chat_id = int(d.name.split("=", 1)[1])
+            if not ids or chat_id in ids:
+                yield chat_id, d
+
+    def partitions(
+        self, start: dt.date, end: dt.date, channel_ids: Iterable[int] | None = None,
+    ) -> Iterator[Tuple[int, str, pathlib.Path]]:
+        """(chat_id, день, каталог) с day в [start; end]."""
+        lo, hi = str(start), str(end)
+        for chat_id, d in self._chat_dirs(channel_ids):
+            for day_dir in sorted(d.glob("day=*")):
+                day = day_dir.name.split("=", 1)[1]
+                if lo <= day <= hi:
+                    yield chat_id, day, day_dir
+
+    def _segments(self, folder: pathlib.Path, as_of_ns: int | None) -> List[pathlib.Path]:
+        segs = sorted(folder.glob(f"*{_SUFFIX}"), key=lambda p: int(p.name.split("-", 1)[0]))
+        if as_of_ns is not None:
+            segs = [p for p in segs if int(p.name.split("-", 1)[0]) <= as_of_ns]
+        return segs
+
+    def _read_segment(self, path: pathlib.Path, columns: List[str] | None) -> pd.DataFrame:
+        pa = _arrow()
+        with pa.memory_map(str(path), "r") as source:
+            table = pa.ipc.open_file(source).read_all()
+        if columns is not None:
+            table = table.select([c for c in columns if c in table.column_names])
+        return table.to_pandas()
+
+    def read(
+        self,
+        start: dt.date,
+        end: dt.date,
+        channel_ids: Iterable[int] | None = None,
+        columns: List[str] | None = None,
+        *,
+        as_of: str | dt.datetime | None = AS_OF,
+    ) -> pd.DataFrame:
+        """сообщения за [start; end] (последняя версия каждого сообщения)."""
+        as_of_ns = _as_of_ns(as_of)
+        need = None if columns is None else list(dict.fromkeys([*columns, "chat_id", MSG_ID_COL]))
+        frames = [
+            self._read_segment(seg, need)
+            for _, _, folder in self.partitions(start, end, channel_ids)
+            for seg in self._segments(folder, as_of_ns)
+        ]
+        if not frames:
+            return pd.DataFrame(columns=columns or [])
+        df = pd.concat(frames, ignore_index=True)
+        if MSG_ID_COL in df.columns:
+            df = df.drop_duplicates(subset=["chat_id", MSG_ID_COL], keep="last").reset_index(drop=True)
+        return df[columns] if columns is not None else df
+
+    def stats(self) -> Dict[str, Any]:
+        """каналов, (канал, день), сегментов, байт на диске."""
+        chats, days, segs, size = set(), 0, 0, 0
+        for chat_id, d in self._chat_dirs(None):
+            chats.add(chat_id)
+            for day_dir in d.glob("day=*"):
+                days += 1
+                for seg in day_dir.glob(f"*{_SUFFIX}"):
+                    segs += 1
+                    size += seg.stat().st_size
+        return {"chats": len(chats), "days": days, "segments": segs, "bytes": size}
@@ -0,0 +1,355 @@
+# tg_ingest.py
+# ─────────────────────────────────────────────────────────────
+# Выгрузка Telegram → tg_raw_enriched (команда dump).
+#
+# Все чаты выгружаются одним клиентом telethon (сессия TG_INGEST_SESSION)
+# в одном event loop. Чат читается страницами по TG_PAGE_ROWS сообщений
+# (от новых к старым); каждый запрос страницы идёт под семафором — не больше
+# TG_CONCURRENCY запросов к Telegram одновременно. FloodWait приостанавливает
+# только свой чат (слот семафора на время ожидания отпускается), остальные
+# продолжают. Страницы копятся до TG_CHUNK_ROWS сообщений, превращаются
+# в строки tg_raw_enriched (tg_etl.enrich_messages) и сразу пишутся
+# в хранилище — в памяти не больше порции на чат.
+#
+# Полная выгрузка (dump) заменяет таблицу целиком, поэтому порции сначала
+# складываются во временный каталог и заливаются, только когда выгрузились
+# все чаты: упавший чат не стирает уже лежащие в таблице строки.
+#
+# Инкрементальный режим (dump --incremental): по каждому чату в state_store
+# хранится водяной знак: max id, время и время правки уже выгруженных
+# сообщений и момент прошлой выгрузки. Следующая выгрузка читает все
+# сообщения с id > last_id и, для правок, сообщения, написанные не раньше
+# прошлой выгрузки минус EDIT_LOOKBACK_HOURS; листание останавливается на
+# первом сообщении, не попавшем ни под одно условие. upsert'ом пишутся только
+# новые (id > last_id) и изменённые после прошлой выгрузки сообщения —
+# объём работы растёт с трафиком, а не с давностью последнего сообщения.
+#
+# archive — те же порции дописываются в локальный архив (tg_archive)
+# для офлайн-повторов конвейера.
+#
+# Водяной знак сдвигается только после записи всех порций чата (at-least-once;
+# повторная запись безопасна — upsert идемпотентен по ключу).
+
+from __future__ import annotations
+import asyncio, os, tempfile, time
+from typing import Any, AsyncIterator, Awaitable, Callable, Dict, List, NamedTuple, Tuple
+
+import pandas as pd
+
+from . import metrics
+from . import state_store
+from . import storage
+from . import tg_archive
+from . import tg_etl
+
+
+MSG_ID_COL   = os.getenv("MSG_ID_COLUMN", "message_id")
+MSG_EDIT_COL = os.getenv("MSG_EDIT_COLUMN", "edit_dttm")
+
+EDIT_LOOKBACK_HOURS = float(os.getenv("INGEST_EDIT_LOOKBACK_HOURS", "48"))
+
+TG_SESSION        = os.getenv("TG_INGEST_SESSION", "tg_digester_ingest")
+TG_CONCURRENCY    = int(os.getenv("TG_CONCURRENCY", "4"))
+TG_PAGE_ROWS      = int(os.getenv("TG_PAGE_ROWS", "100"))      # больше 100 Telegram за запрос не отдаёт
+TG_CHUNK_ROWS     = int(os.getenv("TG_CHUNK_ROWS", "5000"))
+TG_FLOOD_RETRIES  = int(os.getenv("TG_FLOOD_RETRIES", "5"))
+TG_FLOOD_MAX_WAIT = float(os.getenv("TG_FLOOD_MAX_WAIT", "900"))   # дольше — чат считается упавшим
+
+
+def _ts(values) -> pd.Series:
+    return pd.to_datetime(pd.Series(values), utc=True, errors="coerce")
+
+
+class Window(NamedTuple):
+    """что читать из чата: сообщения с date >= since или id > min_id (None — только since)."""
+    since: pd.Timestamp
+    min_id: int | None = None
+
+
+def _window(wm: state_store.Watermark, lookback_hours: float) -> Window:
+    """
+    окно инкрементальной выгрузки: всё новее last_id плюс сообщения за
+    lookback до прошлой выгрузки (их правки). Якорь — момент выгрузки, а не
+    время последнего сообщения: у тихого чата оно может быть давним.
+    """
+    anchor = (
+        pd.Timestamp(wm.updated_at, unit="s", tz="UTC") if wm.updated_at is not None
+        else _ts([wm.last_dttm]).iloc[0]
+    )
+    return Window(anchor - pd.Timedelta(hours=lookback_hours), int(wm.last_id))
+
+
+def _changed(df: pd.DataFrame, wm: state_store.Watermark | None) -> Tuple[pd.DataFrame, int, int]:
+    """(строки к записи, новых, изменённых) относительно водяного знака."""
+    if wm is None or df.empty:
+        return df, len(df), 0
+    new = df[MSG_ID_COL].astype("int64") > int(wm.last_id)
+    edited = pd.Series(False, index=df.index)
+    if MSG_EDIT_COL in df.columns:
+        # правка после прошлой выгрузки: позже последней виденной правки
+        # (или последнего сообщения, если правок ещё не было)
+        threshold = _ts([wm.last_edit or wm.last_dttm]).iloc[0]
+        edited = ~new & (_ts(df[MSG_EDIT_COL].tolist()).set_axis(df.index) > threshold)
+    return df[new | edited], int(new.sum()), int(edited.sum())
+
+
+def _advance(wm: state_store.Watermark | None, df: pd.DataFrame) -> state_store.Watermark:
+    """водяной знак после выгрузки df."""
+    dttm = _ts(df["dttm"].tolist())
+    last_id = int(df[MSG_ID_COL].max())
+    last_dttm = dttm.max()
+    last_edit = _ts(df[MSG_EDIT_COL].tolist()).max() if MSG_EDIT_COL in df.columns else pd.NaT
+    if wm is not None:
+        last_id = max(last_id, int(wm.last_id))
+        last_dttm = max(last_dttm, _ts([wm.last_dttm]).iloc[0])
+        if wm.last_edit:
+            prev = _ts([wm.last_edit]).iloc[0]
+            last_edit = prev if pd.isna(last_edit) else max(last_edit, prev)
+    chat_id = int(df["chat_id"].iloc[0]) if "chat_id" in df.columns else (wm.chat_id if wm else None)
+    return state_store.Watermark(
+        chat_id=chat_id,
+        last_id=last_id,
+        last_dttm=last_dttm.isoformat(),
+        last_edit=None if pd.isna(last_edit) else last_edit.isoformat(),
+    )
+
+
+# ─────────── конкурентная выгрузка ───────────
+def _flood_wait(exc: BaseException) -> float | None:
+    """секунды ожидания из FloodWaitError Telethon (по имени класса — telethon живёт в tg_etl)."""
+    if "FloodWait" not in type(exc).__name__:
+        return None
+    seconds = getattr(exc, "seconds", None)
+    return float(seconds) if seconds is not None else None
+
+
+def _client():
+    """клиент telethon выгрузки: одна сессия на весь dump."""
+    from telethon import TelegramClient
+    client = TelegramClient(TG_SESSION, int(os.environ["TG_API_ID"]), os.environ["TG_API_HASH"])
+    client.flood_sleep_threshold = 0        # FloodWait ждёт _request, отпустив слот семафора
+    return client
+
+
+async def _request(sem: asyncio.Semaphore, chat: str, call: Callable[[], Awaitable[Any]]) -> Any:
+    """один запрос к Telegram под семафором; на FloodWait ждёт вне семафора и повторяет."""
+    for attempt in range(TG_FLOOD_RETRIES + 1):
+        async with sem:
+            try:
+                return await call()
+            except Exception as e:
+                wait = _flood_wait(e)
+                if wait is None or wait > TG_FLOOD_MAX_WAIT or attempt == TG_FLOOD_RETRIES:
+                    raise
+        metrics.inc("ingest.flood_waits", chat=chat)
+        metrics.observe("ingest.flood_wait", wait)
+        print(f"  ⏳ {chat}: FloodWait {wait:.0f}s (попытка {attempt + 1}/{TG_FLOOD_RETRIES})")
+        await asyncio.sleep(wait + 1)
+    raise AssertionError("unreachable")
+
+
+async def _pages(
+    client, entity, chat: str, window: Window, until: pd.Timestamp | None, sem: asyncio.Semaphore,
+) -> AsyncIterator[list]:
+    """сообщения чата из window (до until) страницами по TG_PAGE_ROWS, от новых к старым."""
+    offset: Dict[str, Any] = {} if until is None else {"offset_date": until.to_pydatetime()}
+    while True:
+        page = await _request(sem, chat, lambda: client.get_messages(entity, limit=TG_PAGE_ROWS, **offset))
+        keep = [
+            m for m in page
+            if m.date >= window.since or (window.min_id is not None and m.id > window.min_id)
+        ]
+        if keep:
+            yield keep
+        if len(keep) < len(page) or len(page) < TG_PAGE_ROWS:
+            return
+        offset = {"offset_id": page[-1].id}
+
+
+Sink = Callable[[str, pd.DataFrame, bool], None]
+
+
+async def export_chats(
+    windows: Dict[str, Window],
+    sink: Sink,
+    *,
+    until: pd.Timestamp | None = None,
+    concurrency: int = TG_CONCURRENCY,
+    chunk_rows: int = TG_CHUNK_ROWS,
+) -> Dict[str, BaseException]:
+    """
+    Выгружает чаты {чат: окно} (до until, None — до текущего момента)
+    одним клиентом и отдаёт каждый в sink(чат, порция, последняя) порциями
+    по chunk_rows строк; последняя порция пустая.
+    Запись последовательная, в отдельном потоке, чтобы не блокировать loop.
+    Возвращает {чат: ошибка} по упавшим чатам.
+    """
+    sem = asyncio.Semaphore(max(1, concurrency))
+    write_lock = asyncio.Lock()
+    errors: Dict[str, BaseException] = {}
+    done = 0
+    client = _client()
+
+    async def write(chat: str, chunk: pd.DataFrame, last: bool) -> None:
+        async with write_lock:
+            await asyncio.to_thread(sink, chat, chunk, last)
+
+    async def one(chat: str) -> None:
+        nonlocal done
+        t0 = time.perf_counter()
+        rows = 0
+        try:
+            entity = await _request(sem, chat, lambda: client.get_entity(chat))
+            buf: list = []
+            async for page in _pages(client, entity, chat, windows[chat], until, sem):
+                buf.extend(page)
+                if len(buf) < chunk_rows:
+                    continue
+                chunk, buf = buf, []
+                df = await _request(sem, chat, lambda: tg_etl.enrich_messages(client, entity, chunk))
+                await write(chat, df, False)
+                rows += len(df)
+            if buf:
+                df = await _request(sem, chat, lambda: tg_etl.enrich_messages(client, entity, buf))
+                await write(chat, df, False)
+                rows += len(df)
+            await write(chat, pd.DataFrame(), True)
+        except Exception as e:
+            errors[chat] = e
+            metrics.observe("ingest.chat", time.perf_counter() - t0, error=True)
+            print(f"  ❌ {chat}: {type(e).__name__}: {e}")
+            return
+        finally:
+            done += 1
+        took = time.perf_counter() - t0
+        metrics.observe("ingest.chat", took)
+        print(f"  [{done}/{len(windows)}] {chat}: {rows} сообщений, {took:.1f}s")
+
+    await client.start()
+    try:
+        await asyncio.gather(*(one(chat) for chat in windows))
+    finally:
+        await client.disconnect()
+    return errors
+
+
+def _raise_failed(errors: Dict[str, BaseException]) -> None:
+    if errors:
+        raise RuntimeError(f"не выгружены чаты ({len(errors)}): {', '.join(errors)}")
+
+
+# ─────────── режимы dump ───────────
+def full_dump(
+    chats: List[str],
+    table: str,
+    schema: list,
+    *,
+    days_back_start: int = 3,
+    days_back_end: int = 0,
+    concurrency: int = TG_CONCURRENCY,
+    archive: tg_archive.Archive | None = None,
+) -> int:
+    """
+    Выгружает чаты за окно и заменяет содержимое table.
+    Порции копятся во временном каталоге; таблица перезаписывается
+    (первая порция — с перезаписью, остальные дописываются), только если
+    выгрузились все чаты, иначе остаётся как была.
+    Возвращает число записанных строк.
+    """
+    st = storage.get_storage()
+    now = pd.Timestamp.now(tz="UTC")
+    since = now - pd.Timedelta(days=days_back_start)
+    until = now - pd.Timedelta(days=days_back_end) if days_back_end else None
+    written = 0
+
+    with tempfile.TemporaryDirectory(prefix="tg_dump_") as spool:
+        parts: List[str] = []
+
+        def sink(chat: str, chunk: pd.DataFrame, last: bool) -> None:
+            if chunk.empty:
+                return
+            path = os.path.join(spool, f"{len(parts):06d}.pkl")
+            chunk.to_pickle(path)
+            parts.append(path)
+
+        with metrics.span("ingest.export"):
+            errors = asyncio.run(export_chats(
+                {chat: Window(since) for chat in chats}, sink,
+                until=until, concurrency=concurrency,
+            ))
+        _raise_failed(errors)
+
+        for path in parts:
+            chunk = pd.read_pickle(path)
+            with metrics.span("ingest.upload"):
+                st.upload(chunk, table, schema, overwrite=written == 0)
+            if archive is not None:
+                with metrics.span("ingest.archive"):
+                    archive.append(chunk)
+            written += len(chunk)
+    if written == 0:
+        st.upload(pd.DataFrame(columns=[c["name"] for c in schema]), table, schema, overwrite=True)
+    return written
+
+
+def incremental_dump(
+    chats: List[str],
+    table: str,
+    schema: list,
+    *,
+    days_back_start: int = 3,
+    lookback_hours: float = EDIT_LOOKBACK_HOURS,
+    concurrency: int = TG_CONCURRENCY,
+    archive: tg_archive.Archive | None = None,
+) -> int:
+    """
+    Выгружает из чатов только новые и изменённые сообщения и upsert'ит их в table.
+    Чаты без водяного знака выгружаются за days_back_start дней.
+    Возвращает число записанных строк.
+    """
+    store = state_store.StateStore()
+    now = pd.Timestamp.now(tz="UTC")
+    marks = {chat: store.watermark(chat) for chat in chats}
+    windows = {
+        chat: Window(now - pd.Timedelta(days=days_back_start)) if wm is None else _window(wm, lookback_hours)
+        for chat, wm in marks.items()
+    }
+    st = storage.get_storage()
+    written = 0
+    # по чату: накопленный водяной знак и счётчики (получено, новых, изменённых)
+    pending: Dict[str, state_store.Watermark | None] = {}
+    counts: Dict[str, List[int]] = {}
+
+    def sink(chat: str, chunk: pd.DataFrame, last: bool) -> None:
+        nonlocal written
+        wm = marks[chat]
+        rows, n_new, n_edited = _changed(chunk, wm)
+        if not rows.empty:
+            with metrics.span("ingest.upsert"):
+                st.upsert(rows, table, schema)
+            if archive is not None:
+                with metrics.span("ingest.archive"):
+                    archive.append(rows)
+            written += len(rows)
+        if not chunk.empty:
+            pending[chat] = _advance(pending.get(chat, wm), chunk)
+        c = counts.setdefault(chat, [0, 0, 0])
+        c[0] += len(chunk); c[1] += n_new; c[2] += n_edited
+        if not last:
+            return
+        if chat in pending:
+            store.set_watermark(chat, pending.pop(chat))
+        fetched, n_new, n_edited = counts.pop(chat)
+        metrics.inc("ingest.messages", n_new, kind="new")
+        metrics.inc("ingest.messages", n_edited, kind="edited")
+        metrics.inc("ingest.messages", fetched - n_new - n_edited, kind="unchanged")
+        print(f"  {chat}: окно с {windows[chat].since:%Y-%m-%d %H:%M} и id > {windows[chat].min_id or 0}, получено {fetched}, "
+              f"новых {n_new}, изменённых {n_edited}")
+
+    try:
+        with metrics.span("ingest.export"):
+            errors = asyncio.run(export_chats(windows, sink, concurrency=concurrency))
+    finally:
+        store.close()
+    _raise_failed(errors)
+    return written
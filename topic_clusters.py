@@ -0,0 +1,95 @@
+# topic_clusters.py
+# ─────────────────────────────────────────────────────────────
+# Локальная предкластеризация тем периода перед группировкой в сюжеты:
+#   • tfidf   — TF-IDF по summary / status / conclusions (NumPy),
+#               слова обрезаются до первых _STEM букв — грубый стемминг
+#               для русского без словарей
+#   • cluster — агломеративная кластеризация (average linkage) по
+#               косинусной близости: кластеры — кандидаты в сюжеты
+#
+# custom_date_digester (mode="clustered") отдаёт LLM каждый кластер
+# отдельным небольшим промптом параллельно, а не все темы периода одним.
+
+from __future__ import annotations
+import os, re
+from collections import Counter
+from typing import Any, Dict, List, Sequence
+
+import numpy as np
+
+
+# средняя косинусная близость, начиная с которой кластеры сливаются
+CLUSTER_THRESHOLD = float(os.getenv("CLUSTER_THRESHOLD", "0.2"))
+
+FIELDS = ("summary", "status", "conclusions")
+
+_WORD_RE = re.compile(r"[A-Za-zА-Яа-яЁё0-9]+")
+_STEM = 6
+_STOP = frozenset(
+    "и в во на не что как по со из за от для до это то же но или ли бы был была были быть "
+    "он она они мы вы его ее её их при об уже еще ещё так все всё там тут где когда чтобы "
+    "the and for with".split()
+)
+
+
+def _terms(text: str) -> List[str]:
+    words = (w.lower() for w in _WORD_RE.findall(text))
+    return [w[:_STEM] for w in words if len(w) > 2 and w not in _STOP]
+
+
+def item_text(item: Dict[str, Any], fields: Sequence[str] = FIELDS) -> str:
+    return " ".join(str(item.get(f) or "") for f in fields)
+
+
+def tfidf(docs: List[str]) -> np.ndarray:
+    """матрица (документ × термин): сублинейный tf × сглаженный idf, строки нормированы по L2."""
+    vocab: Dict[str, int] = {}
+    counts = [Counter(vocab.setdefault(t, len(vocab)) for t in _terms(d)) for d in docs]
+    tf = np.zeros((len(docs), len(vocab)), dtype=np.float32)
+    for i, row in enumerate(counts):
+        if row:
+            tf[i, list(row)] = list(row.values())
+    df = np.count_nonzero(tf, axis=0)
+    idf = np.log((1 + len(docs)) / (1 + df)) + 1
+    x = np.log1p(tf) * idf
+    norms = np.linalg.norm(x, axis=1, keepdims=True)
+    return x / np.where(norms == 0, 1, norms)
+
+
+def cluster(
+    items: List[Dict[str, Any]],
+    threshold: float = CLUSTER_THRESHOLD,
+    fields: Sequence[str] = FIELDS,
+) -> List[List[int]]:
+    """
+    Индексы items, сгруппированные по близости текста (average linkage,
+    слияние, пока средняя косинусная близость пары кластеров ≥ threshold).
+    Кластеры упорядочены по первому элементу.
+    """
+    n = len(items)
+    if n < 2:
+        return [[i] for i in range(n)]
+    x = tfidf([item_text(it, fields) for it in items])
+    # суммы близостей по парам элементов кластеров; средняя = сумма / (|A|·|B|)
+    sums = (x @ x.T).astype(np.float64)
+    sizes = np.ones(n)
+    alive = np.ones(n, dtype=bool)
+    members = [[i] for i in range(n)]
+
+    while alive.sum() > 1:
+        avg = sums / np.outer(sizes, sizes)
+        avg[~alive, :] = -np.inf
+        avg[:, ~alive] = -np.inf
+        np.fill_diagonal(avg, -np.inf)
+        a, b = divmod(int(np.argmax(avg)), n)
+        if avg[a, b] < threshold:
+            break
+        # b вливается в a
+        sums[a, :] += sums[b, :]
+        sums[:, a] += sums[:, b]
+        sizes[a] += sizes[b]
+        alive[b] = False
+        members[a] += members[b]
+        members[b] = []
+
+    return sorted((sorted(m) for m in members if m), key=lambda m: m[0])
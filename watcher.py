@@ -0,0 +1,220 @@
+# watcher.py
+# ─────────────────────────────────────────────────────────────
+# Режим реального времени (`watch`): подписка telethon на новые и
+# отредактированные сообщения TG_CHATS. События копятся по (чат, день),
+# день — московский с границей в 04:00 (как во всём конвейере).
+#
+# Пара (чат, день) уходит в обработку, когда в ней WATCH_DEBOUNCE_SEC
+# не было новых событий, но не позже WATCH_MAX_DELAY_SEC после первого
+# события. Все созревшие пары обрабатываются одной микропачкой:
+#   1. tg_ingest.incremental_dump по их чатам — сообщения дописываются
+#      в tg_raw_enriched в обычном формате tg_etl;
+#   2. orchestrator.process_interval(день, день, канал, with_daily) —
+#      темы, их анализ и строка daily_digest только для затронутого дня.
+#      Без incremental: отпечатки state_store считаются по UTC-дате, а
+#      событие уже означает, что день изменился.
+# Пока идёт пачка, события продолжают копиться. Дни, которые не удалось
+# пересчитать, возвращаются в буфер (не больше WATCH_MAX_ATTEMPTS попыток).
+#
+# Слушатель работает в своей сессии telethon (TG_WATCH_SESSION), чтобы
+# не делить файл сессии с выгрузкой tg_ingest (TG_INGEST_SESSION).
+# SIGTERM / SIGINT: текущая пачка дорабатывает, накопленное обрабатывается, выход.
+
+from __future__ import annotations
+import asyncio, datetime as dt, math, os, signal, time
+from dataclasses import dataclass
+from typing import Callable, Dict, List, Tuple
+
+from . import metrics
+
+
+WATCH_DEBOUNCE_SEC  = float(os.getenv("WATCH_DEBOUNCE_SEC", "60"))
+WATCH_MAX_DELAY_SEC = float(os.getenv("WATCH_MAX_DELAY_SEC", "300"))
+WATCH_MAX_ATTEMPTS  = int(os.getenv("WATCH_MAX_ATTEMPTS", "3"))
+WATCH_SESSION       = os.getenv("TG_WATCH_SESSION", "tg_digester_watch")
+
+MSK = dt.timezone(dt.timedelta(hours=3))
+DAY_START_HOUR = 4          # день = 04:00–04:00 MSK
+
+_TICK = 1.0
+
+
+def msk_day(ts: dt.datetime) -> dt.date:
+    """день конвейера для момента ts (naive — UTC)."""
+    if ts.tzinfo is None:
+        ts = ts.replace(tzinfo=dt.timezone.utc)
+    return (ts.astimezone(MSK) - dt.timedelta(hours=DAY_START_HOUR)).date()
+
+
+# ─────────── буфер ───────────
+@dataclass
+class Pending:
+    chat: str               # как в TG_CHATS (для выгрузки)
+    channel_id: int         # chat_id в tg_raw_enriched
+    day: dt.date
+    first_seen: float       # monotonic: первое событие пары
+    last_seen: float        # monotonic: последнее событие пары
+    oldest: dt.datetime     # самое раннее время сообщения (окно перевыгрузки)
+    events: int = 0
+    attempts: int = 0       # неудачных пересчётов
+
+
+class DayBuffer:
+    """накопитель событий по (канал, день) с debounce и предельной задержкой."""
+
+    def __init__(
+        self,
+        debounce: float = WATCH_DEBOUNCE_SEC,
+        max_delay: float = WATCH_MAX_DELAY_SEC,
+        clock: Callable[[], float] = time.monotonic,
+    ) -> None:
+        self.debounce = debounce
+        self.max_delay = max_delay
+        self._clock = clock
+        self._items: Dict[Tuple[int, dt.date], Pending] = {}
+
+    def __len__(self) -> int:
+        return len(self._items)
+
+    def add(self, chat: str, channel_id: int, msg_ts: dt.datetime, events: int = 1) -> Pending:
+        if msg_ts.tzinfo is None:
+            msg_ts = msg_ts.replace(tzinfo=dt.timezone.utc)
+        now = self._clock()
+        key = (channel_id, msk_day(msg_ts))
+        p = self._items.get(key)
+        if p is None:
+            p = self._items[key] = Pending(chat, channel_id, key[1], now, now, msg_ts)
+        p.last_seen = now
+        p.oldest = min(p.oldest, msg_ts)
+        p.events += events
+        return p
+
+    def requeue(self, items: List[Pending]) -> None:
+        """вернуть пары в буфер после сбоя: созреют заново через debounce."""
+        for p in items:
+            self.add(p.chat, p.channel_id, p.oldest, p.events).attempts = p.attempts + 1
+
+    def due(self, *, flush_all: bool = False) -> List[Pending]:
+        """забирает созревшие пары (flush_all — все)."""
+        now = self._clock()
+        ready = [
+            key for key, p in self._items.items()
+            if flush_all or now - p.last_seen >= self.debounce or now - p.first_seen >= self.max_delay
+        ]
+        return [self._items.pop(key) for key in ready]
+
+
+# ─────────── обработка пачки ───────────
+def process_batch(batch: List[Pending], *, model: str = "yandex", verify: bool | str = True) -> List[Pending]:
+    """
+    Перевыгрузка затронутых чатов и пересчёт тем / daily_digest затронутых дней.
+    Возвращает пары, которые пересчитать не удалось.
+    """
+    from . import orchestrator
+    from . import test_data
+    from . import tg_ingest
+
+    chats = sorted({p.chat for p in batch})
+    oldest = min(p.oldest for p in batch)
+    # окно перевыгрузки должно накрыть самое старое затронутое сообщение (правки)
+    lookback = math.ceil((dt.datetime.now(dt.timezone.utc) - oldest).total_seconds() / 3600) + 1
+    table = os.getenv("YT_MESSAGES_TABLE", orchestrator.TBL_MSG)
+
+    print(f"\n📥 Пачка: {len(batch)} (канал × день), {sum(p.events for p in batch)} событий")
+    with metrics.span("watch.ingest"):
+        tg_ingest.incremental_dump(chats, table, test_data.MSG_SCHEMA, lookback_hours=lookback)
+    failed: List[Pending] = []
+    for p in sorted(batch, key=lambda p: (p.day, p.channel_id)):
+        with metrics.span("watch.day"):
+            failures = orchestrator.process_interval(
+                p.day, p.day,
+                channel_id=p.channel_id,
+                model=model,
+                verify=verify,
+                with_daily=True,
+            )
+        if failures:
+            failed.append(p)
+            continue
+        lag = time.monotonic() - p.first_seen
+        metrics.observe("watch.lag", lag)
+        print(f"✅ {p.channel_id} {p.day}: дайджест обновлён (отставание {lag:.0f}s)")
+    return failed
+
+
+# ─────────── цикл ───────────
+async def _watch(
+    chats: List[str],
+    *,
+    model: str,
+    verify: bool | str,
+    debounce: float,
+    max_delay: float,
+) -> None:
+    from telethon import TelegramClient, events, utils
+
+    client = TelegramClient(WATCH_SESSION, int(os.environ["TG_API_ID"]), os.environ["TG_API_HASH"])
+    await client.start()
+
+    # peer id события → (чат из TG_CHATS, chat_id в tg_raw_enriched)
+    peers: Dict[int, Tuple[str, int]] = {}
+    for chat in chats:
+        entity = await client.get_entity(chat)
+        peers[utils.get_peer_id(entity)] = (chat, entity.id)
+    print(f"👀 Слушаем {len(peers)} чатов (debounce {debounce:g}s, не дольше {max_delay:g}s)")
+
+    buf = DayBuffer(debounce, max_delay)
+
+    async def _on_message(event) -> None:
+        chat, channel_id = peers[event.chat_id]
+        buf.add(chat, channel_id, event.message.date)
+        metrics.inc("watch.events", kind=type(event).__name__)
+
+    for builder in (events.NewMessage, events.MessageEdited):
+        client.add_event_handler(_on_message, builder(chats=list(peers)))
+
+    stop = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for s in (signal.SIGTERM, signal.SIGINT):
+        loop.add_signal_handler(s, stop.set)
+
+    try:
+        while True:
+            stopping = stop.is_set()
+            batch = buf.due(flush_all=stopping)
+            if batch:
+                try:
+                    # пачка — в потоке: loop продолжает принимать события
+                    failed = await loop.run_in_executor(None, lambda: process_batch(batch, model=model, verify=verify))
+                except Exception as e:
+                    print(f"⚠️ пачка упала: {type(e).__name__}: {e}")
+                    failed = batch
+                metrics.inc("watch.failures", len(failed))
+                retry = [p for p in failed if p.attempts + 1 < WATCH_MAX_ATTEMPTS and not stopping]
+                for p in failed:
+                    if p not in retry:
+                        print(f"❌ {p.channel_id} {p.day}: не пересчитан (попыток {p.attempts + 1})")
+                buf.requeue(retry)
+            if stopping:
+                break
+            try:
+                await asyncio.wait_for(stop.wait(), timeout=_TICK)
+            except asyncio.TimeoutError:
+                pass
+    finally:
+        print("🛑 watch остановлен")
+        await client.disconnect()
+
+
+def watch(
+    chats: List[str],
+    *,
+    model: str = "yandex",
+    verify: bool | str = True,
+    debounce: float = WATCH_DEBOUNCE_SEC,
+    max_delay: float = WATCH_MAX_DELAY_SEC,
+) -> None:
+    """слушает чаты и держит темы и daily_digest текущих дней в актуальном состоянии."""
+    from . import storage
+    storage.require_yt("watch")          # пачки идут через process_interval
+    asyncio.run(_watch(chats, model=model, verify=verify, debounce=debounce, max_delay=max_delay))
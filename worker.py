@@ -0,0 +1,154 @@
+# worker.py
+# ─────────────────────────────────────────────────────────────
+# Долгоживущий воркер (`serve`): разбирает задания из job_queue и выполняет
+# их в одном процессе. Модули, LLM-клиент (общая requests-сессия, кэш
+# ответов, лимитер), кэш каналов и буфер записи в YT живут между заданиями —
+# на задание не приходится ни старт интерпретатора, ни импорт pandas/telethon.
+#
+# SIGTERM / SIGINT: новые задания не берутся, текущие дорабатывают,
+# буфер записи сбрасывается. Повторный сигнал — немедленный выход:
+# прерванные задания возвращаются в очередь (JobQueue.release), строки
+# из буфера записи остаются в spill и дописываются при следующем старте.
+
+from __future__ import annotations
+import argparse, importlib, os, signal, threading, time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Set
+
+from . import job_queue
+
+
+# модули, которые прогреваются при старте (импорт + соединения)
+WARM_MODULES = (
+    "eliza_client",
+    "orchestrator",
+    "daily_digester",
+    "custom_date_digester",
+    "yt_writer",
+)
+
+# задания, которые воркер не выполняет
+_FORBIDDEN = {"serve", "enqueue", "jobs", "watch"}
+
+
+def _warm() -> None:
+    t0 = time.perf_counter()
+    for name in WARM_MODULES:
+        try:
+            importlib.import_module(f"{__package__}.{name}")
+        except ImportError as e:
+            print(f"⚠️ не удалось прогреть {name}: {e}")
+    print(f"🔥 модули загружены за {time.perf_counter() - t0:.2f}s")
+
+
+def _execute(
+    q: job_queue.JobQueue,
+    job: job_queue.Job,
+    run: Callable[[argparse.Namespace], object],
+) -> None:
+    t0 = time.perf_counter()
+    print(f"▶️  job {job.id}: {job.command} (попытка {job.attempts})")
+    try:
+        if job.command in _FORBIDDEN:
+            raise ValueError(f"команда {job.command} не выполняется воркером")
+        run(argparse.Namespace(command=job.command, **job.args))
+    except Exception as e:
+        q.finish(job.id, error=f"{type(e).__name__}: {e}")
+        print(f"❌ job {job.id}: {job.command} упал за {time.perf_counter() - t0:.2f}s: {e}")
+    else:
+        q.finish(job.id)
+        print(f"✅ job {job.id}: {job.command} за {time.perf_counter() - t0:.2f}s")
+
+
+def serve(
+    run: Callable[[argparse.Namespace], object],
+    *,
+    queue_path: str | None = None,
+    workers: int = 1,
+    poll: float = 1.0,
+    exit_when_empty: bool = False,
+) -> int:
+    """
+    Цикл воркера: берёт задания и выполняет их через run(args) в workers потоках.
+    exit_when_empty — выйти, когда очередь опустела (для cron и тестов).
+    Возвращает число выполненных заданий.
+    """
+    q = job_queue.JobQueue(queue_path or job_queue.DB_PATH)
+    stop = threading.Event()
+    running: Set[int] = set()           # id выполняющихся заданий
+    running_lock = threading.Lock()
+
+    def _abort(signum: int) -> None:
+        """второй сигнал: выполняющиеся задания — обратно в очередь, выход без ожидания."""
+        with running_lock:
+            ids = sorted(running)
+        # отдельное соединение: lock основного может держать прерванный поток
+        rq = job_queue.JobQueue(q.path)
+        for jid in ids:
+            rq.release(jid)
+        rq.close()
+        print(f"\n⛔ повторный сигнал: {len(ids)} прерванных заданий возвращены в очередь")
+        os._exit(128 + signum)
+
+    def _on_signal(signum, _frame):
+        if stop.is_set():
+            _abort(signum)
+        print(f"\n🛑 сигнал {signal.Signals(signum).name}: дорабатываем текущие задания…")
+        stop.set()
+
+    prev = {s: signal.signal(s, _on_signal) for s in (signal.SIGTERM, signal.SIGINT)}
+
+    if n := q.requeue_orphans():
+        print(f"♻️  {n} заданий умерших воркеров возвращены в очередь")
+    _warm()
+    print(f"🚀 serve: {workers} потоков, очередь {q.path}")
+
+    done = 0                            # завершённых заданий (успешно или с ошибкой)
+    slots = threading.Semaphore(workers)
+    t_start = time.perf_counter()
+    try:
+        with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="job") as pool:
+            while not stop.is_set():
+                if not slots.acquire(timeout=poll):
+                    continue
+                job = q.claim()
+                if job is None:
+                    slots.release()
+                    if exit_when_empty:
+                        # дожидаемся текущих заданий и проверяем очередь ещё раз
+                        for _ in range(workers):
+                            slots.acquire()
+                        for _ in range(workers):
+                            slots.release()
+                        if not q.counts().get("queued"):
+                            break
+                        continue
+                    stop.wait(poll)
+                    continue
+
+                def _task(j=job):
+                    nonlocal done
+                    with running_lock:
+                        running.add(j.id)
+                    try:
+                        _execute(q, j, run)
+                    finally:
+                        with running_lock:
+                            running.discard(j.id)
+                            done += 1
+                        slots.release()
+
+                pool.submit(_task)
+    finally:
+        for s, h in prev.items():
+            signal.signal(s, h)
+        counts = q.counts()
+        q.close()
+
+    elapsed = time.perf_counter() - t_start
+    print(
+        f"🏁 serve: завершено {done} заданий за {elapsed:.1f}s"
+        + (f" ({done / elapsed:.2f}/s)" if done and elapsed else "")
+        + f"; очередь: {counts}"
+    )
+    return done
@@ -0,0 +1,319 @@
+# yt_writer.py
+# ─────────────────────────────────────────────────────────────
+# Буферизованная запись в YT (или в бэкенд из storage): строки копятся
+# по целевым таблицам и уходят одним upsert на пачку — по размеру (batch_size),
+# по времени (flush_interval) или при выходе из процесса.
+#
+# At-least-once: каждая строка сначала дописывается в локальный spill-файл
+# (jsonl, fsync) и удаляется из него только после успешного upsert.
+# Оставшиеся после падения строки подхватываются при следующем старте;
+# повторная запись безопасна — upsert идемпотентен по ключу.
+#
+# Неудачный upsert — WriteError из flush(): вызывающий не должен считать
+# строки записанными. Чтобы повтор spill'а не затёр более свежую строку,
+# время каждой записанной строки по ключу хранится в журнале (written.sqlite
+# рядом со spill'ами); строка из spill пишется, только если она новее.
+#
+# Upsert идёт без общей блокировки writer'а: буфер таблицы под ней
+# забирается целиком (spill переименовывается), и write() не ждёт YT.
+# Flush одной таблицы — строго по очереди, чтобы старая пачка не легла
+# поверх новой.
+
+from __future__ import annotations
+import atexit, json, os, pathlib, re, sqlite3, threading, time
+from typing import Any, Dict, Iterable, List, Tuple
+
+import pandas as pd
+
+from . import metrics
+from . import storage
+
+
+SPILL_DIR      = os.getenv("YT_WRITER_SPILL_DIR", str(pathlib.Path.home() / ".cache" / "tg_digester" / "spill"))
+BATCH_SIZE     = int(os.getenv("YT_WRITER_BATCH", "500"))
+FLUSH_INTERVAL = float(os.getenv("YT_WRITER_FLUSH_SEC", "30"))
+
+
+class WriteError(RuntimeError):
+    """upsert не прошёл; строки остались в буфере и spill-файле."""
+
+    def __init__(self, failed: Dict[str, str]) -> None:
+        self.failed = failed            # таблица → ошибка
+        super().__init__("; ".join(f"{t}: {e}" for t, e in failed.items()))
+
+
+def _key_columns(schema: list) -> List[str]:
+    return [c["name"] for c in schema if c.get("sort_order")]
+
+
+def _row_key(row: Dict[str, Any], keys: List[str]) -> str:
+    return json.dumps([row.get(k) for k in keys], ensure_ascii=False, default=str)
+
+
+class _Written:
+    """журнал записанных строк: (таблица, ключ) → время строки."""
+
+    def __init__(self, path: pathlib.Path) -> None:
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS written (tbl TEXT, key TEXT, ts REAL, PRIMARY KEY (tbl, key))"
+        )
+        self._lock = threading.Lock()
+
+    def record(self, table: str, items: Iterable[Tuple[str, float]]) -> None:
+        with self._lock, self._conn:
+            self._conn.executemany(
+                "INSERT INTO written VALUES (?, ?, ?) "
+                "ON CONFLICT (tbl, key) DO UPDATE SET ts = max(ts, excluded.ts)",
+                [(table, key, ts) for key, ts in items],
+            )
+
+    def newer(self, table: str, key: str, ts: float) -> bool:
+        """записана ли по ключу строка новее ts."""
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT ts FROM written WHERE tbl = ? AND key = ?", (table, key)
+            ).fetchone()
+        return row is not None and row[0] >= ts
+
+
+class _TableBuffer:
+    def __init__(self, table: str, schema: list, spill: pathlib.Path) -> None:
+        self.table = table
+        self.schema = schema
+        self.spill = spill
+        self.rows: List[Dict[str, Any]] = []
+        self.stamps: List[float] = []    # время появления каждой строки (wall clock)
+        self.since = time.monotonic()
+        self.retired: List[pathlib.Path] = []   # прежние spill'ы, чьи строки снова в rows
+        self.flushing = threading.Lock()         # один upsert таблицы за раз
+        self._seq = 0
+
+    def take(self) -> Tuple[List[Dict[str, Any]], List[float], List[pathlib.Path]]:
+        """забирает строки на запись; spill уходит в отдельный файл (вызывать под блокировкой writer'а)."""
+        rows, stamps, spills = self.rows, self.stamps, self.retired
+        self.rows, self.stamps, self.retired = [], [], []
+        if self.spill.exists():
+            # суффикс .<pid>.jsonl сохраняется — _recover узнаёт файл умершего процесса
+            self._seq += 1
+            name, pid, ext = self.spill.name.rsplit(".", 2)
+            taken = self.spill.with_name(f"{name}~{self._seq}.{pid}.{ext}")
+            os.replace(self.spill, taken)
+            spills = spills + [taken]
+        return rows, stamps, spills
+
+    def put_back(
+        self, rows: List[Dict[str, Any]], stamps: List[float], spills: List[pathlib.Path], since: float,
+    ) -> None:
+        """возвращает незаписанные строки в начало буфера (под блокировкой writer'а)."""
+        self.since = min(self.since, since) if self.rows else since
+        self.rows = rows + self.rows
+        self.stamps = stamps + self.stamps
+        self.retired = spills + self.retired
+
+
+class BufferedWriter:
+    """буфер строк по таблицам + spill-файл на диске."""
+
+    def __init__(
+        self,
+        spill_dir: str | os.PathLike = SPILL_DIR,
+        *,
+        batch_size: int = BATCH_SIZE,
+        flush_interval: float = FLUSH_INTERVAL,
+    ) -> None:
+        self.spill_dir = pathlib.Path(spill_dir)
+        self.spill_dir.mkdir(parents=True, exist_ok=True)
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self._buffers: Dict[str, _TableBuffer] = {}
+        self._lock = threading.RLock()
+        self._stop = threading.Event()
+        self._written = _Written(self.spill_dir / "written.sqlite")
+        self._recover()
+        self._ticker = threading.Thread(target=self._tick, name="yt-writer", daemon=True)
+        self._ticker.start()
+
+    # ─────────── spill ───────────
+    def _spill_path(self, table: str) -> pathlib.Path:
+        # свой файл на процесс: параллельные запуски не трогают чужие строки
+        name = re.sub(r"[^\w.-]+", "_", table.strip("/"))
+        return self.spill_dir / f"{name}.{os.getpid()}.jsonl"
+
+    @staticmethod
+    def _alive(pid: int) -> bool:
+        try:
+            os.kill(pid, 0)
+        except ProcessLookupError:
+            return False
+        except PermissionError:
+            return True
+        return True
+
+    def _recover(self) -> None:
+        """
+        строки, не дошедшие до YT из завершившихся процессов, снова ставятся в буфер —
+        последняя версия по ключу и только если по этому ключу не записано ничего новее.
+        """
+        spills = []
+        # таблица → (схема, ключ → (строка, время))
+        recovered: Dict[str, Tuple[list, Dict[str, Tuple[Dict[str, Any], float]]]] = {}
+        for spill in sorted(self.spill_dir.glob("*.jsonl")):
+            try:
+                pid = int(spill.suffixes[-2].lstrip("."))
+            except (IndexError, ValueError):
+                pid = 0
+            if pid == os.getpid() or (pid and self._alive(pid)):
+                continue
+            spills.append(spill)
+            for line in spill.read_text(encoding="utf-8").splitlines():
+                try:
+                    rec = json.loads(line)
+                except json.JSONDecodeError:
+                    continue        # оборванная последняя строка
+                ts = rec.get("ts") or spill.stat().st_mtime
+                schema, rows = recovered.setdefault(rec["table"], (rec["schema"], {}))
+                keys = _key_columns(schema)
+                key = _row_key(rec["row"], keys) if keys else line
+                if key not in rows or rows[key][1] <= ts:
+                    rows[key] = (rec["row"], ts)
+        for table, (schema, rows) in recovered.items():
+            fresh = [(key, row, ts) for key, (row, ts) in rows.items() if not self._written.newer(table, key, ts)]
+            if len(fresh) < len(rows):
+                print(f"⏭  {len(rows) - len(fresh)} строк из spill старее записанных → {table}")
+            if fresh:
+                self._enqueue(table, schema, [r for _, r, _ in fresh], [ts for _, _, ts in fresh])
+                print(f"♻️  {len(fresh)} строк из spill → {table}")
+        for spill in spills:
+            # строки уже в новом spill'е этого процесса
+            spill.unlink(missing_ok=True)
+
+    def _append_spill(self, buf: _TableBuffer, rows: List[Dict[str, Any]], stamps: List[float]) -> None:
+        with open(buf.spill, "a", encoding="utf-8") as f:
+            for row, ts in zip(rows, stamps):
+                f.write(json.dumps(
+                    {"table": buf.table, "schema": buf.schema, "row": row, "ts": ts},
+                    ensure_ascii=False, default=str,
+                ) + "\n")
+            f.flush()
+            os.fsync(f.fileno())
+
+    # ─────────── API ───────────
+    def write(self, table: str, schema: list, row: Dict[str, Any]) -> None:
+        self.write_many(table, schema, [row])
+
+    def write_many(self, table: str, schema: list, rows: List[Dict[str, Any]]) -> None:
+        """
+        ставит строки в буфер таблицы; при заполнении буфера — flush
+        (его ошибка не поднимается: строки остаются в буфере до следующего flush).
+        """
+        self._enqueue(table, schema, rows, [time.time()] * len(rows))
+
+    def _enqueue(self, table: str, schema: list, rows: List[Dict[str, Any]], stamps: List[float]) -> None:
+        if not rows:
+            return
+        with self._lock:
+            buf = self._buffers.get(table)
+            if buf is None:
+                buf = self._buffers[table] = _TableBuffer(table, schema, self._spill_path(table))
+            if not buf.rows:
+                buf.since = time.monotonic()
+            self._append_spill(buf, rows, stamps)
+            buf.rows.extend(rows)
+            buf.stamps.extend(stamps)
+            full = len(buf.rows) >= self.batch_size
+        if full:
+            self.flush(table, raise_errors=False)
+
+    def _flush_buffer(self, buf: _TableBuffer) -> None:
+        with buf.flushing:
+            with self._lock:
+                since = buf.since
+                rows, stamps, spills = buf.take()
+            if not rows:
+                return
+            try:
+                keys = _key_columns(buf.schema)
+                # одна строка на ключ — последняя по времени
+                latest: Dict[str, Tuple[Dict[str, Any], float]] = {}
+                for i, (row, ts) in enumerate(zip(rows, stamps)):
+                    key = _row_key(row, keys) if keys else str(i)
+                    if key not in latest or latest[key][1] <= ts:
+                        latest[key] = (row, ts)
+                with metrics.span("write.upsert", table=buf.table):
+                    storage.get_storage().upsert(pd.DataFrame([r for r, _ in latest.values()]), buf.table, buf.schema)
+            except BaseException:
+                with self._lock:
+                    buf.put_back(rows, stamps, spills, since)
+                raise
+            # журнал — только после успешного upsert
+            if keys:
+                self._written.record(buf.table, ((k, ts) for k, (_, ts) in latest.items()))
+            for spill in spills:
+                spill.unlink(missing_ok=True)
+        metrics.inc("write.rows", len(latest), table=buf.table.rsplit("/", 1)[-1])
+        print(f"✅ {len(latest)} строк upsert → {buf.table}")
+
+    def flush(self, table: str | None = None, *, raise_errors: bool = True) -> None:
+        """
+        пишет накопленное (всё или одну таблицу); при ошибке строки остаются в буфере
+        и spill, а после попытки записать остальные таблицы — WriteError
+        (raise_errors=False — только предупреждение).
+        """
+        failed: Dict[str, str] = {}
+        with self._lock:
+            if table:
+                buffers = [self._buffers[table]] if table in self._buffers else []
+            else:
+                buffers = list(self._buffers.values())
+        for buf in buffers:
+            try:
+                self._flush_buffer(buf)
+            except Exception as e:
+                failed[buf.table] = f"{type(e).__name__}: {e}"
+                metrics.inc("write.failures", table=buf.table.rsplit("/", 1)[-1])
+                print(f"⚠️ upsert fail {buf.table}: {e} — {len(buf.rows)} строк остаются в spill ({self.spill_dir})")
+        if failed and raise_errors:
+            raise WriteError(failed)
+
+    def pending(self) -> Dict[str, int]:
+        with self._lock:
+            return {t: len(b.rows) for t, b in self._buffers.items() if b.rows}
+
+    def _tick(self) -> None:
+        while not self._stop.wait(min(self.flush_interval, 5.0)):
+            with self._lock:
+                due = [
+                    b.table for b in self._buffers.values()
+                    if b.rows and time.monotonic() - b.since >= self.flush_interval
+                ]
+            for table in due:
+                self.flush(table, raise_errors=False)
+
+    def close(self) -> None:
+        self._stop.set()
+        self.flush(raise_errors=False)
+
+
+_writer: BufferedWriter | None = None
+_writer_lock = threading.Lock()
+
+
+def get_writer() -> BufferedWriter:
+    """общий на процесс writer; при выходе из процесса буферы сбрасываются."""
+    global _writer
+    with _writer_lock:
+        if _writer is None:
+            _writer = BufferedWriter()
+            atexit.register(_writer.close)
+        return _writer
+
+
+def write(table: str, schema: list, row: Dict[str, Any]) -> None:
+    get_writer().write(table, schema, row)
+
+
+def flush() -> None:
+    """сбросить все буферы процесса; WriteError, если что-то не записалось."""
+    if _writer is not None:
+        _writer.flush()